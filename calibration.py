@@ -40,7 +40,7 @@ if __name__ == "__main__":
 
                 calibrate_cam.set_position(2.55, 37.954542, 89.264111)
                 calibrate_cam.turn_precisely('y', offset_angle)
-                raw_image = calibrate_cam.take_screenshot(f"calib_{offset_angle}_")
+                raw_image = calibrate_cam.take_screenshot(f"calib_{offset_angle}_", gray=True)
 
                 # observed and supposed points in pixel coordinates
                 observed_sun_center = SunDetector.center_point_of_raw(raw_image)
@@ -58,7 +58,7 @@ if __name__ == "__main__":
                 calibrate_cam.set_position(2.55, 37.954542, 89.264111)
                 calibrate_cam.turn_precisely('y', diagonal_offset_angle)
                 calibrate_cam.turn_precisely('z', 45)
-                raw_image = calibrate_cam.take_screenshot(f"calib_{diagonal_offset_angle}_")
+                raw_image = calibrate_cam.take_screenshot(f"calib_{diagonal_offset_angle}_", gray=True)
 
                 # observed and supposed points in pixel coordinates
                 observed_sun_center = SunDetector.center_point_of_raw(raw_image)
@@ -1,4 +1,5 @@
 # common properties and values
+import functools
 import math
 
 import cv2
@@ -58,6 +59,13 @@ class Params:
     automatic_photo_mode_val = "2"
     default_star_magnitude_limit: float = 7
 
+    # star tracker artifact defaults, used when no camera settings are given
+    star_tracker_max_fov_deg = 17.0
+    star_tracker_magnitude_limit = 4.9
+    star_tracker_epoch = 2000.0
+    # added to the half diagonal of the field of view when searching around a predicted boresight
+    star_tracker_tracking_margin_deg = 2.0
+
     # se commands
     get_cmd = "Get"
     set_cmd = "Set"
@@ -108,6 +116,12 @@ class Params:
     debug_matched_img = "debug_matched_img.png"
     debug_candidates_img = "debug_candidates_img.png"
     debug_triangulated_img = "debug_triangulated_img.png"
+    # debug images are rendered on a background thread, see DebugRenderer
+    debug_rendering = False
+    debug_render_queue_size = 16
+
+    # number of decoded gray screenshots kept by the gray frame cache
+    gray_frame_cache_size = 8
 
     # astronomical size definitions in km
     astronomical_unit_km = 149597870.7
@@ -151,6 +165,29 @@ class Code:
     def cosine_separation_to_angle_deg(cosine_separation: float) -> float:
         return Code.rad_to_deg(math.acos(cosine_separation))
 
+    @staticmethod
+    def to_gray(image: np.ndarray) -> np.ndarray:
+        """
+        :return: the image itself if it is gray already, a gray conversion of a BGR image otherwise
+        """
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    @functools.cache
+    def circular_field_of_view_mask() -> np.ndarray:
+        """
+        Read-only mask of the pixels within the norm radius around the image center, 255 inside and 0 outside.
+        Computed once and shared by all frames.
+        """
+        width, height = Params.width_height
+        ys, xs = np.ogrid[0:height, 0:width]
+        mask = np.where((xs - Params.center_point[0]) ** 2 + (ys - Params.center_point[1]) ** 2 <=
+                        Params.norm_radius ** 2, 255, 0).astype(np.uint8)
+        mask.flags.writeable = False
+        return mask
+
     @staticmethod
     def save_debug_image(filename: str, image: np.ndarray):
         cv2.imwrite(Params.debug_images_dir + filename, image)
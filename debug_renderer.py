@@ -0,0 +1,123 @@
+import queue
+import threading
+import traceback
+from collections.abc import Callable
+
+import cv2
+import numpy as np
+
+from common import Params, Code
+
+# a draw command receives the image to draw into and returns the drawn image, e.g. a bound cv2.circle call
+DrawCommand = Callable[[np.ndarray], np.ndarray]
+
+
+class DebugRenderer:
+    """
+    Renders debug images off the hot path. Producers hand over in-memory frames and draw commands, a background thread
+    applies the commands and encodes and writes the PNG files. Jobs are processed in submission order, so a drawing can
+    start from a frame submitted or drawn before it. The queue is bounded, when it is full jobs are dropped instead of
+    blocking the producer. Disabled by default, submissions are then ignored without copying anything. Rendering
+    errors are printed with their traceback when they happen and raised by the next flush.
+    """
+    def __init__(self, enabled: bool = Params.debug_rendering, queue_size: int = Params.debug_render_queue_size):
+        self.enabled = enabled
+        self.dropped_jobs = 0
+        # errors of the render thread not yet raised by flush
+        self._render_errors: list[Exception] = []
+        # guards dropped_jobs, producers may submit from several threads, and _render_errors
+        self._state_lock = threading.Lock()
+        self._jobs: queue.Queue = queue.Queue(maxsize=queue_size)
+        # latest frame per debug image name, only touched by the render thread
+        self._frames: dict[str, np.ndarray] = {}
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._render_loop, name="debug-renderer", daemon=True)
+                self._thread.start()
+
+    def _put(self, job: tuple):
+        self._ensure_thread()
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            with self._state_lock:
+                self.dropped_jobs += 1
+
+    def submit_frame(self, name: str, image: np.ndarray):
+        """
+        Stores a frame under a debug image name and writes it. The frame is copied, the caller may keep using it.
+        """
+        if self.enabled:
+            self._put((name, None, image.copy(), []))
+
+    def submit_drawing(self, name: str, source_name: str, draw_commands: list[DrawCommand]):
+        """
+        Draws into a copy of the latest frame named source_name, stores the result under name and writes it.
+        """
+        if self.enabled:
+            self._put((name, source_name, None, draw_commands))
+
+    def flush(self):
+        """
+        Blocks until every submitted job has been written. Raises the first error the render thread ran into since the
+        last flush.
+        """
+        if self._thread is not None:
+            self._jobs.join()
+        with self._state_lock:
+            render_errors, self._render_errors = self._render_errors, []
+        if len(render_errors) > 0:
+            raise Exception(f"{len(render_errors)} debug images could not be rendered.") from render_errors[0]
+
+    @staticmethod
+    def circle(center: tuple[int, int], radius: int, color: tuple[int, int, int], thickness: int) -> DrawCommand:
+        return lambda image: cv2.circle(image, center, radius, color, thickness)
+
+    @staticmethod
+    def line(start: tuple[int, int], end: tuple[int, int], color: tuple[int, int, int], thickness: int) -> DrawCommand:
+        return lambda image: cv2.line(image, start, end, color, thickness)
+
+    @staticmethod
+    def text(text: str, origin: tuple[int, int], color: tuple[int, int, int]) -> DrawCommand:
+        return lambda image: cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+
+    @staticmethod
+    def keypoints(keypoints: list[cv2.KeyPoint], color: tuple[int, int, int]) -> DrawCommand:
+        return lambda image: cv2.drawKeypoints(image, keypoints, np.zeros((1, 1)), color,
+                                               cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
+
+    def _render_loop(self):
+        while True:
+            name, source_name, image, draw_commands = self._jobs.get()
+            try:
+                if source_name is not None:
+                    source_image = self._frames.get(source_name)
+                    image = source_image.copy() if source_image is not None else Code.read_debug_image(source_name)
+                    if image is not None and image.ndim == 2:
+                        # draw colored markers like into a gray frame read back from its PNG
+                        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+                if image is not None:
+                    for draw_command in draw_commands:
+                        image = draw_command(image)
+                    self._frames[name] = image
+                    Code.save_debug_image(name, image)
+            except Exception as error:
+                print(f"Could not render debug image {name}:")
+                traceback.print_exc()
+                with self._state_lock:
+                    self._render_errors.append(error)
+            finally:
+                self._jobs.task_done()
+
+
+debug_renderer = DebugRenderer()
@@ -30,12 +30,12 @@ class DistanceEstimator:
     @staticmethod
     def raw_to_mask(raw_image: np.ndarray) -> np.ndarray:
         """
-        :param raw_image: Raw image of the sun in BGR
+        :param raw_image: Raw image of the sun in BGR or an already gray frame
         :return: Mask image of relevant 'solar disc' pixels.
         """
-        assert raw_image.shape == Params.width_height + (3,)
+        assert raw_image.shape[:2] == Params.width_height
         # transform image to grayscale
-        gray_image = cv2.cvtColor(raw_image, cv2.COLOR_BGR2GRAY)
+        gray_image = Code.to_gray(raw_image)
         # turn gray image to mask using thresholding
         _, mask = cv2.threshold(gray_image, 248, 255, cv2.THRESH_BINARY)
         return mask
@@ -63,7 +63,7 @@ class DistanceEstimator:
         fov = Params.distance_estimation_fov_settings[0]
         for fov in Params.distance_estimation_fov_settings:
             camera.update_fov(fov)
-            image = camera.take_screenshot(str(fov))
+            image = camera.take_screenshot(str(fov), gray=True)
             cv2.imwrite(f'{fov}_img.png', image)
             mask = DistanceEstimator.raw_to_mask(image)
             cv2.imwrite(f'{fov}_mask.png', mask)
@@ -2,11 +2,13 @@ import os
 import re
 import time
 import shutil
+from collections import OrderedDict
 from typing import Literal
 
 import pyautogui
 import subprocess
 import cv2
+import numpy as np
 
 from pre_startup_sol_mod import Modifier
 from common import Params, Code
@@ -167,31 +169,83 @@ class WindowController:
         time.sleep(script.run_duration)
 
 
+class GrayFrameCache:
+    """
+    Decodes screenshots straight to 8-bit grayscale and keeps the most recently used frames per file, so every
+    consumer of a screenshot shares one decoded buffer. Frames are read-only, consumers must not draw into them.
+    The circular field of view mask is applied once per frame, the masked frame is cached alongside.
+    """
+    def __init__(self, max_frames: int = Params.gray_frame_cache_size):
+        self.max_frames = max_frames
+        # keyed by path and modification time, an overwritten file is decoded again
+        self._frames: OrderedDict[tuple[str, int], dict[bool, np.ndarray]] = OrderedDict()
+
+    def read(self, path: str, within_field_of_view: bool = False) -> np.ndarray | None:
+        """
+        :param within_field_of_view: zero all pixels outside the circular field of view
+        :return: gray frame, None if the file cannot be decoded
+        """
+        key = path, os.stat(path).st_mtime_ns
+        frames = self._frames.get(key)
+        if frames is None:
+            gray_frame = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray_frame is None:
+                return None
+            gray_frame.flags.writeable = False
+            frames = {False: gray_frame}
+            self._frames[key] = frames
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        else:
+            self._frames.move_to_end(key)
+        if within_field_of_view not in frames:
+            masked_frame = cv2.bitwise_and(frames[False], Code.circular_field_of_view_mask())
+            masked_frame.flags.writeable = False
+            frames[True] = masked_frame
+        return frames[within_field_of_view]
+
+    def clear(self):
+        self._frames.clear()
+
+
+gray_frame_cache = GrayFrameCache()
+
+
 class FileController:
     @staticmethod
-    def _read_image(path: str) -> cv2.typing.MatLike:
+    def _read_image(path: str, gray: bool = False, within_field_of_view: bool = False) -> cv2.typing.MatLike:
+        """
+        :param gray: read-only gray frame from the gray frame cache instead of a newly decoded BGR image
+        :param within_field_of_view: gray frame with all pixels outside the circular field of view zeroed
+        """
+        if gray:
+            return gray_frame_cache.read(path, within_field_of_view)
+        assert not within_field_of_view
         return cv2.imread(path)
 
     @staticmethod
-    def fetch_latest_image_by_tag(tag: str) -> cv2.typing.MatLike | None:
+    def fetch_latest_image_by_tag(tag: str, gray: bool = False,
+                                  within_field_of_view: bool = False) -> cv2.typing.MatLike | None:
         all_files = os.listdir(Params.screenshots_dir)
         tagged_files = [f for f in all_files if tag in f]
         if len(tagged_files) >= 1:
             tagged_files.sort()
-            return FileController._read_image(Params.screenshots_dir + tagged_files[-1])
+            return FileController._read_image(Params.screenshots_dir + tagged_files[-1], gray, within_field_of_view)
         else:
             return None
 
     @staticmethod
-    def fetch_multiple_by_tag(tags: list[str]) -> dict[str, cv2.typing.MatLike | None]:
+    def fetch_multiple_by_tag(tags: list[str], gray: bool = False) -> dict[str, cv2.typing.MatLike | None]:
         image_dict = {}
         for tag in tags:
-            image_dict[tag] = FileController.fetch_latest_image_by_tag(tag)
+            image_dict[tag] = FileController.fetch_latest_image_by_tag(tag, gray)
         return image_dict
 
 
 class VirtualCamera:
     exposure_comp_step = 0.25
+    # increased by every command turning or moving the camera, all virtual cameras steer the same SpaceEngine camera
+    turn_count = 0
 
     def __init__(self, name: str, field_of_view: float, exposure_comp: float,
                  star_magnitude_limit: float = Params.default_star_magnitude_limit):
@@ -230,6 +284,7 @@ class VirtualCamera:
         set_position_script = Script.set_position_script(dist_au, declination_deg, right_ascension_deg)
         set_position_script.generate()
         WindowController.run_script(set_position_script)
+        VirtualCamera.turn_count += 1
         if not suppress_print:
             print(f"\"{self.name}\" positioned at RA: {right_ascension_deg}°, dec: {declination_deg}°, {dist_au} AU from Sol.")
 
@@ -252,6 +307,7 @@ class VirtualCamera:
 
     def turn_around(self):
         WindowController.run_script(DefaultScripts.turn_around_script)
+        VirtualCamera.turn_count += 1
         print(f"\"{self.name}\" pointing towards the stars.")
 
     @staticmethod
@@ -259,30 +315,39 @@ class VirtualCamera:
         rand_rotate_script = Script.rotate_randomly_3_axes(override_angles)
         rand_rotate_script.generate()
         WindowController.run_script(rand_rotate_script)
+        VirtualCamera.turn_count += 1
         angles = rand_rotate_script.additional_information
         print(f"Rotated around 3 axes: x:{angles[0]}°, y:{angles[1]}°, z:{angles[2]}°.")
 
     @staticmethod
     def take_sun_detection_screenshots() -> dict[str, cv2.typing.MatLike | None]:
         WindowController.run_script(DefaultScripts.sun_detection_script)
+        # the script turns the camera to all six sides
+        VirtualCamera.turn_count += 1
         print("Took six sun detection screenshots.")
-        return FileController.fetch_multiple_by_tag(Params.sun_detection_image_prefixes)
+        return FileController.fetch_multiple_by_tag(Params.sun_detection_image_prefixes, gray=True)
 
     @staticmethod
     def turn_precisely(axis: Literal['x', 'y', 'z'], turn_angle: float, turn_duration: float = 2):
         turn_script = Script.turn_precisely_script(axis, turn_angle, turn_duration=turn_duration)
         turn_script.generate()
         WindowController.run_script(turn_script)
+        VirtualCamera.turn_count += 1
         print(f"Rotated around {axis}-axis by {turn_angle}°.")
 
     @staticmethod
-    def take_screenshot(prefix: str, fetch_without_taking: bool = False) -> cv2.typing.MatLike:
+    def take_screenshot(prefix: str, fetch_without_taking: bool = False, gray: bool = False,
+                        within_field_of_view: bool = False) -> cv2.typing.MatLike:
+        """
+        :param gray: read-only gray frame shared through the gray frame cache, see GrayFrameCache
+        :param within_field_of_view: gray frame with all pixels outside the circular field of view zeroed
+        """
         if not fetch_without_taking:
             screenshot_script = Script.take_screenshot_script(prefix)
             screenshot_script.generate()
             WindowController.run_script(screenshot_script)
             print(f"Took screenshot \"{prefix}\".")
-        return FileController.fetch_latest_image_by_tag(prefix)
+        return FileController.fetch_latest_image_by_tag(prefix, gray, within_field_of_view)
 
     @staticmethod
     def subsequent_photo_mode_adjustment(new_photo_mode: Literal['manual', 'auto']):
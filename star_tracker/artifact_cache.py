@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from math import cos, radians
+
+import numpy as np
+
+from common import Params
+from star_tracker.catalog_parser import Parser
+from star_tracker.catalog_store import CatalogStore, CatalogDict
+from star_tracker.neighbor_graph import NeighborGraph
+from star_tracker.pair_database import StarPairDatabase
+from star_tracker.pattern_hash import TriangleHashIndex
+from star_tracker.star_pairing import PairDatabaseBuilder
+
+
+class StarTrackerArtifacts:
+    """
+    Catalog store, pair database, neighbor graph and triangle hash index built together for one parameter set.
+    """
+    catalog_subdir = "catalog"
+    pairs_subdir = "pairs"
+    neighbors_subdir = "neighbors"
+    triangles_subdir = "triangles"
+
+    def __init__(self, directory: str, parameters: dict[str, float]):
+        self.directory = directory
+        self.parameters = parameters
+        self.catalog_store = CatalogStore.load(os.path.join(directory, self.catalog_subdir))
+        self.catalog_dict = CatalogDict(self.catalog_store)
+        self.pair_database = StarPairDatabase.load(os.path.join(directory, self.pairs_subdir))
+        self.neighbor_graph = NeighborGraph.load(os.path.join(directory, self.neighbors_subdir))
+        self.triangle_hash_index = TriangleHashIndex.load(os.path.join(directory, self.triangles_subdir))
+        self._visible_star_ids: np.ndarray | None = None
+        self._visible_positions: np.ndarray | None = None
+
+    @property
+    def max_viable_angle_deg(self) -> float:
+        return self.parameters["max_viable_angle_deg"]
+
+    @property
+    def max_magnitude(self) -> float:
+        return self.parameters["max_magnitude"]
+
+    @property
+    def visible_star_ids(self) -> np.ndarray:
+        """
+        Ids of the stars up to the magnitude limit, determined on first use.
+        """
+        if self._visible_star_ids is None:
+            self._visible_star_ids = np.flatnonzero(self.catalog_store.visual_magnitudes <= self.max_magnitude)
+            self._visible_positions = np.ascontiguousarray(self.catalog_store.positions[self._visible_star_ids])
+        return self._visible_star_ids
+
+    def star_ids_within_cone(self, direction: np.ndarray, radius_deg: float) -> np.ndarray:
+        """
+        :return: ids of the stars up to the magnitude limit within radius_deg of direction
+        """
+        # a single cone is answered fastest by one dot product over the visible stars, see cone_search_benchmark
+        visible_star_ids = self.visible_star_ids
+        return visible_star_ids[self._visible_positions @ direction >= cos(radians(radius_deg))]
+
+    def restricted_to_cone(self, direction: np.ndarray, radius_deg: float):
+        return ConeRestrictedArtifacts(self, self.star_ids_within_cone(direction, radius_deg))
+
+    @staticmethod
+    def build(directory: str, catalog_file: str, parameters: dict[str, float]):
+        parser = Parser()
+        parser.catalog_file = catalog_file
+        catalog_store = CatalogStore.from_catalog_columns(parser.parse_columns(), parameters["epoch"])
+        catalog_store.save(os.path.join(directory, StarTrackerArtifacts.catalog_subdir))
+        builder = PairDatabaseBuilder(parameters["max_viable_angle_deg"], parameters["min_viable_angle_deg"],
+                                      parameters["max_magnitude"], catalog_store)
+        pair_database = builder.build()
+        if len(pair_database) >= 2:
+            pair_database.build_k_vector_index()
+        pair_database.save(os.path.join(directory, StarTrackerArtifacts.pairs_subdir))
+        neighbor_graph = NeighborGraph.from_pair_database(pair_database, len(catalog_store))
+        neighbor_graph.save(os.path.join(directory, StarTrackerArtifacts.neighbors_subdir))
+        triangle_hash_index = TriangleHashIndex.from_pair_database(pair_database, catalog_store.positions,
+                                                                   parameters["max_viable_angle_deg"])
+        triangle_hash_index.save(os.path.join(directory, StarTrackerArtifacts.triangles_subdir))
+
+
+class ConeRestrictedArtifacts:
+    """
+    Artifacts limited to the catalog stars within a cone, for frames whose boresight is approximately known. The pair
+    database, neighbor graph and triangle hash index only hold pairs among those stars and are built in memory, the
+    catalog is shared with the full artifacts. Not backed by a directory, so it cannot be handed to worker processes.
+    """
+    def __init__(self, artifacts: StarTrackerArtifacts, star_ids: np.ndarray):
+        self.full_artifacts = artifacts
+        self.star_ids = star_ids
+        self.parameters = artifacts.parameters
+        self.catalog_store = artifacts.catalog_store
+        self.catalog_dict = artifacts.catalog_dict
+        positions = self.catalog_store.positions[star_ids]
+        first_rows, second_rows = np.triu_indices(len(star_ids), k=1)
+        cosine_separations = np.einsum("ij,ij->i", positions[first_rows], positions[second_rows])
+        viable = ((cosine_separations <= cos(radians(self.parameters["min_viable_angle_deg"]))) &
+                  (cosine_separations >= cos(radians(self.max_viable_angle_deg))))
+        self.pair_database = StarPairDatabase.from_pair_arrays(star_ids[first_rows[viable]],
+                                                               star_ids[second_rows[viable]],
+                                                               cosine_separations[viable])
+        if len(self.pair_database) >= 2:
+            self.pair_database.build_k_vector_index()
+        self.neighbor_graph = NeighborGraph.from_pair_database(self.pair_database, len(self.catalog_store))
+        self._triangle_hash_index: TriangleHashIndex | None = None
+
+    @property
+    def max_viable_angle_deg(self) -> float:
+        return self.full_artifacts.max_viable_angle_deg
+
+    @property
+    def max_magnitude(self) -> float:
+        return self.full_artifacts.max_magnitude
+
+    @property
+    def triangle_hash_index(self) -> TriangleHashIndex:
+        # only the hash engine needs it
+        if self._triangle_hash_index is None:
+            self._triangle_hash_index = TriangleHashIndex.from_pair_database(
+                self.pair_database, self.catalog_store.positions, self.max_viable_angle_deg)
+        return self._triangle_hash_index
+
+
+class ArtifactCache:
+    """
+    On-disk cache of star tracker artifacts. Entries are keyed by a hash of the catalog file content and the build
+    parameters, so artifacts never silently mismatch the camera settings or catalog they are used with. Missing entries
+    are built on first use, least recently used entries are evicted beyond max_entries or max_size_bytes.
+    """
+    cache_dir = "star_tracker/artifact_cache/"
+    metadata_file = "metadata.json"
+    # part of every key, increased whenever the set or format of artifacts changes
+    artifact_version = 2
+    # artifacts already loaded by this process, keyed by entry directory
+    loaded_artifacts: dict[str, StarTrackerArtifacts] = {}
+    # content hashes of catalog files, keyed by path, modification time and size
+    catalog_hashes: dict[tuple[str, int, int], str] = {}
+
+    def __init__(self, cache_dir: str = cache_dir, catalog_file: str = Parser().catalog_file, max_entries: int = 8,
+                 max_size_bytes: int = 2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.catalog_file = catalog_file
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_bytes
+
+    def catalog_hash(self) -> str:
+        """
+        SHA-256 of the catalog file, only read and hashed again once the file changes.
+        """
+        stat = os.stat(self.catalog_file)
+        hash_key = (os.path.abspath(self.catalog_file), stat.st_mtime_ns, stat.st_size)
+        if hash_key not in self.catalog_hashes:
+            with open(self.catalog_file, "rb") as file:
+                self.catalog_hashes[hash_key] = hashlib.sha256(file.read()).hexdigest()
+        return self.catalog_hashes[hash_key]
+
+    @staticmethod
+    def artifact_key(catalog_hash: str, parameters: dict[str, float]) -> str:
+        key_source = json.dumps({"catalog": catalog_hash, "version": ArtifactCache.artifact_version, **parameters},
+                                sort_keys=True)
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()[:16]
+
+    def artifacts(self, max_viable_angle_deg: float, min_viable_angle_deg: float, max_magnitude: float,
+                  epoch: float = Params.star_tracker_epoch) -> StarTrackerArtifacts:
+        parameters = {
+            "max_viable_angle_deg": float(max_viable_angle_deg),
+            "min_viable_angle_deg": float(min_viable_angle_deg),
+            "max_magnitude": float(max_magnitude),
+            "epoch": float(epoch),
+        }
+        catalog_hash = self.catalog_hash()
+        directory = os.path.join(self.cache_dir, self.artifact_key(catalog_hash, parameters))
+        # entries already loaded are used as they are, the cache on disk is only touched when loading or building
+        artifacts = self.loaded_artifacts.get(directory)
+        if artifacts is not None:
+            return artifacts
+        metadata_path = os.path.join(directory, self.metadata_file)
+        if not os.path.exists(metadata_path):
+            self._build_entry(directory, catalog_hash, parameters)
+        self._touch(metadata_path)
+        self.evict(keep=directory)
+
+        artifacts = StarTrackerArtifacts(directory, parameters)
+        self.loaded_artifacts[directory] = artifacts
+        return artifacts
+
+    def artifacts_for_camera(self, field_of_view_deg: float, star_magnitude_limit: float,
+                             epoch: float = Params.star_tracker_epoch) -> StarTrackerArtifacts:
+        """
+        Artifacts matching the settings of a star tracker camera: pairs up to the full field of view, stars up to the
+        camera's magnitude limit.
+        """
+        return self.artifacts(field_of_view_deg, field_of_view_deg / 1000, star_magnitude_limit, epoch)
+
+    @staticmethod
+    def default_artifacts() -> StarTrackerArtifacts:
+        return ArtifactCache().artifacts_for_camera(Params.star_tracker_max_fov_deg,
+                                                    Params.star_tracker_magnitude_limit)
+
+    def _build_entry(self, directory: str, catalog_hash: str, parameters: dict[str, float]):
+        print(f"Building star tracker artifacts for {parameters}.")
+        start = time.time()
+        # build next to the final location and rename, so a partially built entry is never picked up
+        build_directory = f"{directory}.build-{os.getpid()}"
+        shutil.rmtree(build_directory, ignore_errors=True)
+        StarTrackerArtifacts.build(build_directory, self.catalog_file, parameters)
+        metadata = {
+            "catalog_file": self.catalog_file,
+            "catalog_sha256": catalog_hash,
+            "artifact_version": self.artifact_version,
+            "parameters": parameters,
+            "created": time.time(),
+            "last_used": time.time(),
+        }
+        self._write_metadata(os.path.join(build_directory, self.metadata_file), metadata)
+        try:
+            os.rename(build_directory, directory)
+        except OSError:
+            # another process finished the same entry first
+            shutil.rmtree(build_directory, ignore_errors=True)
+        print(f"Built star tracker artifacts in {time.time() - start:.1f} s.")
+
+    @staticmethod
+    def _write_metadata(metadata_path: str, metadata: dict):
+        # written next to the final file and renamed, so readers in other processes never see a partial file
+        temporary_path = f"{metadata_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(temporary_path, metadata_path)
+
+    @staticmethod
+    def _touch(metadata_path: str):
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+        metadata["last_used"] = time.time()
+        ArtifactCache._write_metadata(metadata_path, metadata)
+
+    @staticmethod
+    def _directory_size(directory: str) -> int:
+        size = 0
+        for root, _, files in os.walk(directory):
+            for file in files:
+                size += os.path.getsize(os.path.join(root, file))
+        return size
+
+    def entries(self) -> list[tuple[str, dict]]:
+        """
+        :return: directory and metadata of all complete cache entries, most recently used first
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            metadata_path = os.path.join(self.cache_dir, name, self.metadata_file)
+            if os.path.exists(metadata_path):
+                with open(metadata_path, "r") as f:
+                    entries.append((os.path.join(self.cache_dir, name), json.load(f)))
+        entries.sort(key=lambda entry: entry[1]["last_used"], reverse=True)
+        return entries
+
+    def evict(self, keep: str | None = None):
+        total_size = 0
+        for idx, (directory, _) in enumerate(self.entries()):
+            total_size += self._directory_size(directory)
+            over_limit = idx >= self.max_entries or total_size > self.max_size_bytes
+            if over_limit and directory != keep:
+                shutil.rmtree(directory, ignore_errors=True)
+                self.loaded_artifacts.pop(directory, None)
+                print(f"Evicted star tracker artifacts \"{directory}\".")
+
+
+if __name__ == "__main__":
+    default_artifacts = ArtifactCache.default_artifacts()
+    print(f"{len(default_artifacts.pair_database)} pairs in \"{default_artifacts.directory}\".")
@@ -1,24 +1,114 @@
+import itertools
 import math
+from collections.abc import Iterable
 
-import cv2
 import numpy as np
 
 from common import Code, Params
+from debug_renderer import debug_renderer, DebugRenderer
 from se_automation import WindowController, VirtualCamera
-from star_tracker.catalog_dict import catalog_dict
+from star_tracker.artifact_cache import ArtifactCache
 from star_tracker.catalog_parser import UnitVector, CatalogStar
-from star_tracker.star_imager import ObservedStar, StarImager
+from star_tracker.star_imager import ObservedStar, ObservedQuadruple, StarImager
 from star_tracker.star_matching import StarMatcher, MultiMatcher
 
 
 class AttitudeDeterminer:
-    def __init__(self, field_of_view_deg: float):
+    """
+    Determines the camera attitude from the stars in view. Tracking needs a known attitude and turns made by
+    turn_camera since, so it serves callers stepping through frames with turn_camera and
+    view_attitude_determination_procedure. full_attitude_determination_procedure starts without an attitude and stops
+    at the first determined one, its frames are always matched lost-in-space.
+    """
+    def __init__(self, field_of_view_deg: float, star_magnitude_limit: float = Params.star_tracker_magnitude_limit,
+                 matching_engine: str = "quadruple", matching_workers: int = 1, tracking: bool = True):
+        """
+        :param matching_engine: "quadruple", "pyramid" or "hash", see MultiMatcher
+        :param matching_workers: processes matching quadruples in parallel, see MultiMatcher. Their pool is kept
+        until close is called
+        :param tracking: once an attitude is known, predict the next one from the commanded turns and match against
+        the catalog stars around the predicted view vector first
+        """
         self.field_of_view_deg = field_of_view_deg
+        self.matching_engine = matching_engine
+        self.matching_workers = matching_workers
+        self.star_magnitude_limit = star_magnitude_limit
+        self.artifacts = ArtifactCache().artifacts_for_camera(field_of_view_deg, star_magnitude_limit)
+        # workers load the artifacts once and match the quadruples of all frames
+        self.matching_pool = (MultiMatcher.create_worker_pool(self.artifacts, matching_workers)
+                              if matching_workers > 1 else None)
+        self.tracking = tracking
+        # view vector and rotation axis of the last determined attitude, turned along with the camera
+        self.predicted_attitude: tuple[UnitVector, UnitVector] | None = None
+        # VirtualCamera.turn_count the prediction is valid for, any other turn of the camera makes it stale
+        self.predicted_turn_count: int | None = None
+        # "tracking" or "lost-in-space", how the last frame was matched
+        self.last_matching_mode: str | None = None
+
+    def close(self):
+        """
+        Shuts the matching worker processes down.
+        """
+        if self.matching_pool is not None:
+            self.matching_pool.shutdown(wait=True, cancel_futures=True)
+            self.matching_pool = None
+
+    @property
+    def tracking_cone_radius_deg(self) -> float:
+        return self.field_of_view_deg / 2 * math.sqrt(2) + Params.star_tracker_tracking_margin_deg
+
+    def predict_turn(self, turn_angle: float):
+        """
+        Turns the predicted attitude like turn_precisely turns the camera around its y-axis, the rotation axis.
+        """
+        if self.predicted_attitude is not None:
+            view_vector, axis_vector = self.predicted_attitude
+            predicted_view_vector = UnitVector.from_rodrigues_rotation(axis_vector, view_vector, turn_angle)
+            self.predicted_attitude = predicted_view_vector, axis_vector
+
+    def discard_stale_prediction(self):
+        """
+        Drops the predicted attitude if the camera was turned other than by turn_camera since it was made.
+        """
+        if self.predicted_turn_count != VirtualCamera.turn_count:
+            self.predicted_attitude = None
+
+    def turn_camera(self, virtual_camera: VirtualCamera, turn_angle: float):
+        self.discard_stale_prediction()
+        virtual_camera.turn_precisely('y', turn_angle, turn_duration=5)
+        self.predict_turn(turn_angle)
+        self.predicted_turn_count = VirtualCamera.turn_count
+
+    def match_quadruples(self, observed_quadruples: Iterable[ObservedQuadruple]
+                         ) -> tuple[dict[int, int], dict[int, ObservedStar]] | None:
+        """
+        Matches against the catalog stars within the cone around the predicted view vector if an attitude is
+        predicted, against the full catalog if there is none or tracking fails. A failed prediction is dropped.
+        :param observed_quadruples: list or lazy iterator, e.g. of StarImager.determine_viable_quadruples
+        """
+        if self.tracking and self.predicted_attitude is not None:
+            view_vector, _ = self.predicted_attitude
+            # the quadruples pulled by the tracking attempt are replayed to the fallback, further ones stay lazy
+            observed_quadruples, fallback_quadruples = itertools.tee(observed_quadruples)
+            cone_artifacts = self.artifacts.restricted_to_cone(view_vector.value, self.tracking_cone_radius_deg)
+            # the restricted artifacts are small and in memory only, they are matched within this process
+            multi_matcher = MultiMatcher(observed_quadruples, artifacts=cone_artifacts, engine=self.matching_engine)
+            matching_result = multi_matcher.determine_match_from_multiple_quadruples()
+            if matching_result is not None:
+                self.last_matching_mode = "tracking"
+                return matching_result
+            print("Tracking failed, falling back to lost-in-space matching.")
+            self.predicted_attitude = None
+            observed_quadruples = fallback_quadruples
+        self.last_matching_mode = "lost-in-space"
+        multi_matcher = MultiMatcher(observed_quadruples, artifacts=self.artifacts, engine=self.matching_engine,
+                                     workers=self.matching_workers, worker_pool=self.matching_pool)
+        return multi_matcher.determine_match_from_multiple_quadruples()
 
     def triangulate_view_vector(self, target_view_point: tuple[float, float], three_observed: list[ObservedStar], three_matched_ids: list[int]) -> UnitVector:
         assert len(three_observed) == 3
         assert len(three_matched_ids) == 3
-        three_matched_catalog_stars = [catalog_dict.get(idx) for idx in three_matched_ids]
+        three_matched_catalog_stars = [self.artifacts.catalog_dict.get(idx) for idx in three_matched_ids]
         euclidean_distances = [Code.euclidean_distance(target_view_point, observed.position) for observed in three_observed]
         cosine_separations = np.array([math.cos(Code.deg_to_rad(self.field_of_view_deg) * eu_dist/Params.width_height[0]) for eu_dist in euclidean_distances])
         star_position_matrix = np.array([match.position.value for match in three_matched_catalog_stars])
@@ -33,35 +123,32 @@ class AttitudeDeterminer:
         return UnitVector.from_cross_product(right_edge_vector, left_edge_vector)
 
     def draw_view_vector(self, view_vector: UnitVector):
+        if not debug_renderer.enabled:
+            return
         cross_size = 5
         color = (0, 255, 0)
         thickness = 2
         int_x, int_y = Params.center_point_as_int
-        matched_img = Code.read_debug_image(Params.debug_matched_img)
         ra_text, dec_text = Code.fancy_format_ra_dec(view_vector.to_degrees, True)
 
-        cv2.line(matched_img, (int_x - cross_size, int_y), (int_x + cross_size, int_y), color, thickness)
-        cv2.line(matched_img, (int_x, int_y - cross_size), (int_x, int_y + cross_size), color, thickness)
-
-        cv2.putText(
-            matched_img,
-            ra_text, (int_x + 15, int_y - 30),
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA
-        )
-        cv2.putText(
-            matched_img,
-            dec_text, (int_x + 15, int_y - 10),
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA
-        )
-        Code.save_debug_image(Params.debug_triangulated_img, matched_img)
+        debug_renderer.submit_drawing(Params.debug_triangulated_img, Params.debug_matched_img, [
+            DebugRenderer.line((int_x - cross_size, int_y), (int_x + cross_size, int_y), color, thickness),
+            DebugRenderer.line((int_x, int_y - cross_size), (int_x, int_y + cross_size), color, thickness),
+            DebugRenderer.text(ra_text, (int_x + 15, int_y - 30), color),
+            DebugRenderer.text(dec_text, (int_x + 15, int_y - 10), color)
+        ])
 
     def view_attitude_determination_procedure(self, virtual_camera: VirtualCamera) -> tuple[UnitVector, UnitVector] | None:
         """
         Virtual camera must be set up and pointing at the sun before running this procedure.
         Returns tuple of view vector and rotation axis vector or None if view vector cannot be determined.
         """
-        night_sky_image = virtual_camera.take_screenshot("nightsky")
-        star_imager = StarImager(field_of_view, True)
+        if (virtual_camera.field_of_view != self.field_of_view_deg or
+                virtual_camera.star_magnitude_limit != self.star_magnitude_limit):
+            raise Exception("Camera settings do not match the star tracker artifacts of this attitude determiner.")
+        self.discard_stale_prediction()
+        night_sky_image = virtual_camera.take_screenshot("nightsky", gray=True, within_field_of_view=True)
+        star_imager = StarImager(self.field_of_view_deg, True)
         observed_viable_quadruples = star_imager.determine_viable_quadruples(night_sky_image)
 
         # not enough stars in frame
@@ -69,9 +156,7 @@ class AttitudeDeterminer:
             print("Could not match any stars within this frame.")
             return None
 
-        print(f"Number of Quadruples in frame: {len(observed_viable_quadruples)}")
-        multi_matcher = MultiMatcher(observed_viable_quadruples)
-        matching_result = multi_matcher.determine_match_from_multiple_quadruples()
+        matching_result = self.match_quadruples(observed_viable_quadruples)
 
         # if no match is possible return None
         if matching_result is None:
@@ -88,6 +173,8 @@ class AttitudeDeterminer:
         self.draw_view_vector(view_vector)
         axis_vector = self.determine_rotation_axis(three_observed_stars, three_matched_stars)
         print(f"Looking at: {Code.fancy_format_ra_dec(view_vector.to_degrees)}")
+        self.predicted_attitude = view_vector, axis_vector
+        self.predicted_turn_count = VirtualCamera.turn_count
         return view_vector, axis_vector
 
     def full_attitude_determination_procedure(self, virtual_camera: VirtualCamera) -> UnitVector:
@@ -95,6 +182,9 @@ class AttitudeDeterminer:
         Virtual camera must be set up and pointing at the sun before running this procedure.
         Determines attitude relative to the sun by moving the camera frame.
         """
+        # the camera was pointed at the sun since any earlier attitude, predictions start over. The procedure ends at
+        # the first determined attitude, so no frame of it is matched by tracking
+        self.predicted_attitude = None
         # predefine camera turning angles
         turn_angles = [90]
         for num_of_angles in range(0, int(Params.degrees_per_half_circle // virtual_camera.field_of_view)):
@@ -103,7 +193,7 @@ class AttitudeDeterminer:
         for idx, turn_angle in enumerate(turn_angles):
             # turn camera, determine quadruples of current frame
             print(f"Attitude determination attempt {idx + 1} out of {len(turn_angles)} attempts.")
-            virtual_camera.turn_precisely('y', turn_angle, turn_duration=5)
+            self.turn_camera(virtual_camera, turn_angle)
 
             view_attitude_vectors = self.view_attitude_determination_procedure(virtual_camera)
             if view_attitude_vectors is None:
@@ -121,6 +211,7 @@ class AttitudeDeterminer:
 
 
 if __name__ == "__main__":
+    debug_renderer.enable()
     WindowController.initial_setup()
     field_of_view = 17
     exposure_comp = 1.5
@@ -142,8 +233,10 @@ if __name__ == "__main__":
 
     #tracker_cam.set_position_celestial_coordinates(dist_au, ra_h, ra_m, ra_s, de_sign, de_d, de_m, de_s)  # polaris
 
-    atdt = AttitudeDeterminer(field_of_view)
+    atdt = AttitudeDeterminer(field_of_view, star_magnitude_limit)
     atdt.view_attitude_determination_procedure(tracker_cam)
+    atdt.close()
+    debug_renderer.flush()
     #calculated_position_vector = atdt.full_attitude_determination_procedure(tracker_cam)
     #print(f"Positioned at: {Code.fancy_format_ra_dec(calculated_position_vector.to_degrees)}")
 
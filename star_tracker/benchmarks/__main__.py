@@ -0,0 +1,8 @@
+from star_tracker.benchmarks.catalog import CatalogBenchmarks
+from star_tracker.benchmarks.fixtures import BenchmarkFixtures
+from star_tracker.benchmarks.imaging import ImagingBenchmarks
+from star_tracker.benchmarks.matching import MatchingBenchmarks
+
+# every benchmark of every subsystem, single ones run with e.g. python -m star_tracker.benchmarks.matching tracking
+for benchmarks in (CatalogBenchmarks, MatchingBenchmarks, ImagingBenchmarks):
+    BenchmarkFixtures.run(benchmarks, [])
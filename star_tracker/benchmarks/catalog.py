@@ -0,0 +1,232 @@
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from star_tracker.benchmarks.fixtures import BenchmarkFixtures
+from star_tracker.catalog_parser import Parser
+from star_tracker.pair_database import StarPairDatabase
+
+
+class CatalogBenchmarks:
+    """
+    Catalog loading and parsing, star pair generation, candidate pair lookup and cone search.
+    """
+    @staticmethod
+    def catalog_import_benchmark(repetitions: int = 5):
+        """
+        Compares import time and peak memory of the legacy generated catalog module against the memory-mapped
+        catalog store of the default artifacts. Both are generated first if missing.
+        """
+        from star_tracker.artifact_cache import ArtifactCache, StarTrackerArtifacts
+        if not os.path.exists(Parser.catalog_dict_file):
+            parser = Parser()
+            parser.parse()
+            parser.generate_catalog_dict_file()
+        catalog_directory = os.path.join(ArtifactCache.default_artifacts().directory,
+                                         StarTrackerArtifacts.catalog_subdir)
+
+        legacy_module = Parser.catalog_dict_file[:-len(".py")].replace("/", ".")
+        statements = {
+            "baseline (catalog_parser only)": "import star_tracker.catalog_parser",
+            "legacy generated module": f"from {legacy_module} import catalog_dict",
+            "memory-mapped catalog store": "from star_tracker.catalog_store import CatalogDict, CatalogStore\n"
+                                           f"catalog_dict = CatalogDict(CatalogStore.load({catalog_directory!r}))",
+        }
+        for label, statement in statements.items():
+            # first run warms up the bytecode cache
+            BenchmarkFixtures.measure_import(statement)
+            measurements = [BenchmarkFixtures.measure_import(statement) for _ in range(repetitions)]
+            durations, max_rss = zip(*measurements)
+            print(f"{label}: import {min(durations) * 1000:.1f} ms (best of {repetitions}), "
+                  f"peak RSS {max(max_rss):.1f} MiB")
+
+    @staticmethod
+    def catalog_parse_benchmark(repetitions: int = 5):
+        """
+        Compares the line by line catalog parser with the columnar parser and asserts that both produce the same
+        catalog dict.
+        """
+        parsers = {"line by line": Parser(), "columnar": Parser()}
+        parse_methods = {"line by line": Parser.parse_line_by_line, "columnar": Parser.parse}
+        best_durations = {}
+        for label, parser in parsers.items():
+            durations = []
+            for _ in range(repetitions):
+                start = time.perf_counter()
+                parse_methods[label](parser)
+                durations.append(time.perf_counter() - start)
+            best_durations[label] = min(durations)
+            print(f"{label}: {best_durations[label] * 1000:.1f} ms (best of {repetitions})")
+        print(f"Speed-up: {best_durations['line by line'] / best_durations['columnar']:.1f}x")
+        column_durations = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            parsers["columnar"].parse_columns()
+            column_durations.append(time.perf_counter() - start)
+        print(f"columnar arrays only, without CatalogStar objects: {min(column_durations) * 1000:.1f} ms "
+              f"(speed-up {best_durations['line by line'] / min(column_durations):.1f}x)")
+
+        reference, columnar = parsers["line by line"].catalog_dict, parsers["columnar"].catalog_dict
+        assert reference.keys() == columnar.keys()
+        for identifier, reference_star in reference.items():
+            columnar_star = columnar.get(identifier)
+            assert reference_star.name == columnar_star.name
+            assert reference_star.visual_magnitude == columnar_star.visual_magnitude
+            assert np.array_equal(reference_star.position.value, columnar_star.position.value)
+        print(f"Both parsers yield identical catalogs of {len(reference)} stars.")
+
+    @staticmethod
+    def pair_generation_scaling_benchmark(max_viable_angle_deg: float = 20.0, brute_force_max_magnitude: float = 4.5):
+        """
+        Times sky grid pair generation for magnitude limits 4.0 to 6.5. Up to brute_force_max_magnitude the quadratic
+        reference implementation is timed as well and its pairs are compared against the sky grid result.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        catalog_dict = ArtifactCache.default_artifacts().catalog_dict
+        from star_tracker.star_pairing import PairingDeterminer
+        for magnitude_times_10 in range(40, 65 + 1, 5):
+            magnitude = magnitude_times_10 / 10
+            pd = PairingDeterminer(max_viable_angle_deg, max_viable_angle_deg / 1000, magnitude, catalog_dict)
+            start = time.perf_counter()
+            first_ids, second_ids, _ = pd.determine_viable_pair_arrays()
+            grid_duration = time.perf_counter() - start
+            line = (f"magnitude {magnitude}: {len(pd.filtered_catalog_dict)} stars, {len(first_ids)} pairs, "
+                    f"sky grid {grid_duration * 1000:.0f} ms")
+            if magnitude <= brute_force_max_magnitude:
+                start = time.perf_counter()
+                reference_pairs = pd.determine_viable_pairings_brute_force()
+                brute_force_duration = time.perf_counter() - start
+                reference_set = {frozenset((pair.first_id, pair.second_id)) for pair in reference_pairs}
+                grid_set = {frozenset((int(a), int(b))) for a, b in zip(first_ids, second_ids)}
+                assert reference_set == grid_set
+                line += f", brute force {brute_force_duration * 1000:.0f} ms (identical pairs)"
+            print(line)
+
+    @staticmethod
+    def candidate_lookup_benchmark(max_viable_angle_deg: float = 17.0, max_magnitude: float = 4.9,
+                                   repetitions: int = 1000):
+        """
+        Times the candidate pair lookup for the 6 observed pairs of one quadruple: filtering the list of catalog pairs
+        versus binary search in the sorted pair database.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        catalog_dict = ArtifactCache.default_artifacts().catalog_dict
+        from star_tracker.star_pairing import PairingDeterminer
+        from star_tracker.star_matching import StarMatcher
+        pd = PairingDeterminer(max_viable_angle_deg, max_viable_angle_deg / 1000, max_magnitude, catalog_dict)
+        pairings = pd.determine_viable_pairings()
+        pair_database = StarPairDatabase.from_pair_arrays(*pd.determine_viable_pair_arrays())
+        measured_cosine_separations = np.random.default_rng(0).choice(pair_database.cosine_separations, 6)
+
+        start = time.perf_counter()
+        filtered_counts = []
+        for measured in measured_cosine_separations:
+            candidates = list(filter(lambda pair: StarMatcher.cosine_separation_in_bounds(
+                measured, pair.cosine_separation), pairings))
+            filtered_counts.append(len(candidates))
+        filter_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            database_counts = [len(pair_database.query(measured)[0]) for measured in measured_cosine_separations]
+        database_duration = (time.perf_counter() - start) / repetitions
+
+        assert filtered_counts == database_counts
+        print(f"{len(pair_database)} pairs, candidates per observed pair: {database_counts}")
+        print(f"list filter: {filter_duration * 1000:.1f} ms per quadruple, "
+              f"binary search: {database_duration * 1e6:.1f} µs per quadruple")
+
+    @staticmethod
+    def k_vector_benchmark(max_viable_angle_deg: float = 20.0, magnitudes: tuple[float, ...] = (6.0, 6.5, 7.0),
+                           queries: int = 20000):
+        """
+        Compares binary search and k-vector candidate lookup on pair databases beyond one million pairs.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        catalog_dict = ArtifactCache.default_artifacts().catalog_dict
+        from star_tracker.star_pairing import PairingDeterminer
+        for magnitude in magnitudes:
+            pd = PairingDeterminer(max_viable_angle_deg, max_viable_angle_deg / 1000, magnitude, catalog_dict)
+            pair_database = StarPairDatabase.from_pair_arrays(*pd.determine_viable_pair_arrays())
+            start = time.perf_counter()
+            pair_database.build_k_vector_index()
+            build_duration = time.perf_counter() - start
+            measured_cosine_separations = np.random.default_rng(0).choice(pair_database.cosine_separations, queries)
+
+            ranges = {}
+            durations = {}
+            for lookup in StarPairDatabase.lookups:
+                start = time.perf_counter()
+                ranges[lookup] = [pair_database.query_range(measured, lookup=lookup)
+                                  for measured in measured_cosine_separations]
+                durations[lookup] = (time.perf_counter() - start) / queries
+            assert ranges["binary_search"] == ranges["k_vector"]
+
+            # range lookup alone, without converting the measured separation into a cosine interval
+            intervals = [StarPairDatabase.cosine_interval(measured) for measured in measured_cosine_separations]
+            cosine_separations, k_vector_index = pair_database.cosine_separations, pair_database.k_vector_index
+            start = time.perf_counter()
+            for lowest, highest in intervals:
+                np.searchsorted(cosine_separations, lowest, side="left")
+                np.searchsorted(cosine_separations, highest, side="right")
+            durations["binary_search, range only"] = (time.perf_counter() - start) / queries
+            start = time.perf_counter()
+            for lowest, highest in intervals:
+                k_vector_index.value_range(cosine_separations, lowest, highest)
+            durations["k_vector, range only"] = (time.perf_counter() - start) / queries
+
+            mean_candidates = np.mean([stop - start for start, stop in ranges["k_vector"]])
+            print(f"magnitude {magnitude}: {len(pair_database)} pairs, {mean_candidates:.0f} candidates per query, "
+                  f"k-vector built in {build_duration * 1000:.0f} ms")
+            for label, duration in durations.items():
+                print(f"    {label}: {duration * 1e6:.2f} µs per query")
+
+    @staticmethod
+    def cone_search_benchmark(radii_deg: tuple[float, ...] = (2.0, 8.5, 17.0), max_magnitude: float = 6.0,
+                              queries: int = 20000):
+        """
+        Checks batched and single sky grid cone searches against a brute force scan over all stars and compares their
+        durations.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        from star_tracker.sky_grid import SkyGrid
+        store = ArtifactCache.default_artifacts().catalog_store
+        positions = store.positions[store.visual_magnitudes <= max_magnitude]
+        rng = np.random.default_rng(0)
+        directions = rng.normal(size=(queries, 3))
+        directions /= np.linalg.norm(directions, axis=1)[:, None]
+        # directions at the poles and on star positions probe cell and cone boundaries
+        directions[:2] = [[0.0, 0.0, 1.0], [0.0, 0.0, -1.0]]
+        directions[2:102] = positions[rng.choice(len(positions), 100, replace=False)]
+        for radius_deg in radii_deg:
+            radius_rad = math.radians(radius_deg)
+            # cells much smaller than a field of view only add per cell overhead
+            sky_grid = SkyGrid(positions, max(radius_deg, 8.5))
+            start = time.perf_counter()
+            offsets, star_ids = sky_grid.star_ids_within_cones(directions, radius_rad)
+            batched_duration = time.perf_counter() - start
+
+            start = time.perf_counter()
+            brute_force_ids = []
+            for direction in directions:
+                brute_force_ids.append(np.flatnonzero(positions @ direction >= math.cos(radius_rad)))
+            brute_force_duration = time.perf_counter() - start
+            for query, expected_ids in enumerate(brute_force_ids):
+                assert np.array_equal(star_ids[offsets[query]:offsets[query + 1]], expected_ids)
+
+            single_queries = directions[:1000]
+            start = time.perf_counter()
+            for query, direction in enumerate(single_queries):
+                assert np.array_equal(sky_grid.star_ids_within_cone(direction, radius_rad), brute_force_ids[query])
+            single_duration = (time.perf_counter() - start) / len(single_queries) * queries
+            print(f"radius {radius_deg}°: {len(positions)} stars, {len(star_ids) / queries:.1f} stars per cone, "
+                  f"{queries} queries batched {batched_duration * 1000:.0f} ms, one by one "
+                  f"{single_duration * 1000:.0f} ms, brute force {brute_force_duration * 1000:.0f} ms, "
+                  f"identical results")
+
+
+if __name__ == "__main__":
+    BenchmarkFixtures.run(CatalogBenchmarks, sys.argv[1:])
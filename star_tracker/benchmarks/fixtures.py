@@ -0,0 +1,156 @@
+import contextlib
+import io
+import math
+import subprocess
+import sys
+
+import numpy as np
+
+from common import Params
+from star_tracker.star_imager import ObservedStar, ObservedStarPair, ObservedQuadruple, StarImager
+
+
+class BenchmarkFixtures:
+    """
+    Synthetic inputs and helpers shared by the catalog, matching and imaging benchmarks.
+    """
+    @staticmethod
+    def measure_import(import_statement: str) -> tuple[float, float]:
+        """
+        Runs an import statement in a fresh interpreter.
+        :return: import duration in seconds and peak resident set size in MiB of that interpreter
+        """
+        code = (
+            "import resource, time\n"
+            "start = time.perf_counter()\n"
+            f"{import_statement}\n"
+            "duration = time.perf_counter() - start\n"
+            "print(duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+        )
+        output = subprocess.check_output([sys.executable, "-c", code], text=True)
+        duration, max_rss_kib = output.split()
+        return float(duration), float(max_rss_kib) / 1024
+
+    @staticmethod
+    def synthetic_frames(artifacts, frame_count: int, field_of_view_deg: float = Params.star_tracker_max_fov_deg,
+                         quadruples_per_frame: int = 5, noise_deg: float = 0.03, seed: int = 0,
+                         boresights: list[np.ndarray] | None = None
+                         ) -> list[tuple[list[ObservedQuadruple], list[list[int]]]]:
+        """
+        Simulated star tracker frames: random boresights, catalog stars of the artifacts' magnitude limit within the
+        circular field of view projected onto the image plane, observed separations disturbed by uniform noise.
+        :param artifacts: StarTrackerArtifacts providing the catalog and magnitude limit
+        :param boresights: one frame per given boresight instead of frame_count random ones, frames with fewer than
+        four stars have no quadruples
+        :return: per frame the observed quadruples, brightest four stars first, and their true catalog ids
+        """
+        rng = np.random.default_rng(seed)
+        store = artifacts.catalog_store
+        visible_ids = np.flatnonzero(store.visual_magnitudes <= artifacts.max_magnitude)
+        positions = store.positions[visible_ids]
+        pixels_per_radian = Params.width_height[0] / math.radians(field_of_view_deg)
+        frames = []
+        while len(frames) < (frame_count if boresights is None else len(boresights)):
+            if boresights is None:
+                boresight = rng.normal(size=3)
+                boresight /= np.linalg.norm(boresight)
+            else:
+                boresight = boresights[len(frames)]
+            in_view = np.flatnonzero(positions @ boresight >= math.cos(math.radians(field_of_view_deg / 2)))
+            if len(in_view) < 4:
+                if boresights is not None:
+                    frames.append(([], []))
+                continue
+            in_view = in_view[np.argsort(store.visual_magnitudes[visible_ids[in_view]])]
+            east = np.cross([0.0, 0.0, 1.0], boresight)
+            east /= np.linalg.norm(east)
+            north = np.cross(boresight, east)
+            observed_stars = []
+            for row in in_view:
+                angle = math.acos(min(1.0, float(positions[row] @ boresight)))
+                direction = np.array([positions[row] @ east, positions[row] @ north])
+                direction /= max(np.linalg.norm(direction), 1e-12)
+                position = tuple(np.array(Params.center_point) + direction * angle * pixels_per_radian)
+                pixel_count = max(1, int(20 - 3 * store.visual_magnitudes[visible_ids[row]]))
+                observed_stars.append(ObservedStar(pixel_count, position))
+
+            selections = [list(range(4))]
+            while len(selections) < min(quadruples_per_frame, math.comb(len(in_view), 4)):
+                selection = sorted(rng.choice(len(in_view), 4, replace=False).tolist())
+                if selection not in selections:
+                    selections.append(selection)
+            quadruples, truths = [], []
+            # like separations measured from star positions, every star pair is disturbed the same in all quadruples
+            observed_angles_deg = {}
+            for selection in selections:
+                stars = {identifier: observed_stars[selection[identifier]]
+                         for identifier in StarImager.matching_candidate_ids}
+                pairings = {}
+                for identifier in StarImager.pairing_ids:
+                    first, second = StarImager.pair_by_ids[identifier]
+                    star_pair = (selection[first], selection[second])
+                    if star_pair not in observed_angles_deg:
+                        true_cosine = positions[in_view[star_pair[0]]] @ positions[in_view[star_pair[1]]]
+                        observed_angles_deg[star_pair] = (math.degrees(math.acos(min(1.0, float(true_cosine)))) +
+                                                          rng.uniform(-noise_deg, noise_deg))
+                    pairings[identifier] = ObservedStarPair(math.cos(math.radians(observed_angles_deg[star_pair])))
+                quadruples.append(ObservedQuadruple(stars, pairings))
+                truths.append([int(visible_ids[in_view[index]]) for index in selection])
+            frames.append((quadruples, truths))
+        return frames
+
+    @staticmethod
+    def matched_correctly(result: tuple[dict[int, int], dict] | None, quadruples: list[ObservedQuadruple],
+                          truths: list[list[int]]) -> bool:
+        """
+        :param result: matched ids and observed stars as returned by the multi matcher
+        :return: whether the matched catalog ids are the true ids of the matched quadruple
+        """
+        if result is None:
+            return False
+        matched_ids, observed_stars = result
+        quadruple_index = next(idx for idx, quadruple in enumerate(quadruples)
+                               if quadruple.observed_stars_dict is observed_stars)
+        return [matched_ids[identifier] for identifier in StarImager.matching_candidate_ids] == truths[quadruple_index]
+
+    @staticmethod
+    def quiet():
+        """
+        Silences the progress output of the code under benchmark.
+        """
+        return contextlib.redirect_stdout(io.StringIO())
+
+    @staticmethod
+    def synthetic_star_image(star_count: int = 300, sigma_px: float = 0.8, background: float | np.ndarray = 20.0,
+                             noise: float = 3.0, brightness_scale: float = 1.0,
+                             seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gray night sky image with Gaussian star spots at random sub-pixel positions on a noisy background.
+        :param background: constant level or a background image
+        :param brightness_scale: scales all star peaks, like a different exposure
+        :return: the image and the true (x, y) star positions
+        """
+        rng = np.random.default_rng(seed)
+        width, height = Params.width_height
+        true_positions = rng.uniform(10, min(width, height) - 10, size=(star_count, 2))
+        peaks = rng.uniform(60, 235, size=star_count) * brightness_scale
+        image = background + rng.normal(0, noise, size=(height, width))
+        radius = int(math.ceil(4 * sigma_px))
+        for (x, y), peak in zip(true_positions, peaks):
+            x0, y0 = int(x) - radius, int(y) - radius
+            ys, xs = np.mgrid[y0:y0 + 2 * radius + 2, x0:x0 + 2 * radius + 2]
+            image[ys, xs] += peak * np.exp(-((xs - x) ** 2 + (ys - y) ** 2) / (2 * sigma_px ** 2))
+        return np.clip(image, 0, 255).astype(np.uint8), true_positions
+
+    @staticmethod
+    def run(benchmarks: type, names: list[str]):
+        """
+        Runs the given benchmarks of a benchmark class, all of them if no names are given.
+        :param names: benchmark names without the _benchmark suffix, e.g. from the command line
+        """
+        available = [name[:-len("_benchmark")] for name in vars(benchmarks) if name.endswith("_benchmark")]
+        for name in names if len(names) > 0 else available:
+            if name not in available:
+                raise Exception(f"Unknown benchmark {name}, available: {', '.join(available)}")
+            print(f"--- {benchmarks.__name__}.{name}_benchmark")
+            getattr(benchmarks, f"{name}_benchmark")()
@@ -0,0 +1,214 @@
+import itertools
+import math
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from common import Params
+from star_tracker.benchmarks.fixtures import BenchmarkFixtures
+from star_tracker.star_imager import ObservedFrame, ObservedStar, ObservedStarPair, ObservedQuadruple, StarImager
+
+
+class ImagingBenchmarks:
+    """
+    Star detection and centroiding, observed frames, frame loading and sun detection.
+    """
+    @staticmethod
+    def centroiding_benchmark(repetitions: int = 20):
+        """
+        Compares binary mask centroids with intensity weighted centroids on synthetic star images.
+        """
+        gray_image, true_positions = BenchmarkFixtures.synthetic_star_image()
+        background_estimate = StarImager.background_estimate_of(gray_image)
+        mask_image = StarImager.gray_to_mask(gray_image, background_estimate)
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            num_labels, _, stats, centroids = cv2.connectedComponentsWithStats(mask_image, connectivity=8)
+        mask_duration = (time.perf_counter() - start) / repetitions
+        mask_centroids = centroids[1:][stats[1:, cv2.CC_STAT_AREA] <= StarImager.max_star_pixel_count]
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            detected_stars, _ = StarImager.determine_centroids(gray_image, mask_image, background_estimate.background)
+        weighted_duration = (time.perf_counter() - start) / repetitions
+
+        for label, positions, duration in (("binary mask", mask_centroids, mask_duration),
+                                           ("intensity weighted", detected_stars.positions, weighted_duration)):
+            # every detection is compared with its closest true star
+            distances = np.linalg.norm(positions[:, None, :] - true_positions[None, :, :], axis=2)
+            errors = distances.min(axis=1)
+            errors = errors[errors < 2]
+            print(f"{label}: {len(errors)} of {len(true_positions)} stars, mean error {np.mean(errors):.3f} px, "
+                  f"95th percentile {np.percentile(errors, 95):.3f} px, {duration * 1000:.2f} ms per frame")
+
+    @staticmethod
+    def star_detection_benchmark():
+        """
+        Compares the former global threshold of 68 with the tiled background estimate and local thresholds on
+        synthetic frames with a dim exposure, a milky way like band, a planet in view and wider stars on a dark sky. Stars are counted within
+        the circular field of view only.
+        """
+        from star_tracker.star_imager import DetectionStatistics
+        width, height = Params.width_height
+        ys, xs = np.mgrid[0:height, 0:width]
+        milky_way = 20.0 + 70.0 * np.exp(-((xs - ys) / (math.sqrt(2) * 120)) ** 2)
+        planet = np.where((xs - 300) ** 2 + (ys - 700) ** 2 <= 25 ** 2, 220.0, 20.0)
+        scenarios = {
+            "dark sky": BenchmarkFixtures.synthetic_star_image(),
+            "dim exposure": BenchmarkFixtures.synthetic_star_image(brightness_scale=0.4),
+            "milky way": BenchmarkFixtures.synthetic_star_image(background=milky_way, noise=6.0),
+            "planet": BenchmarkFixtures.synthetic_star_image(background=planet),
+            # bright stars spread far above the low threshold of a dark sky, their cores must still count as stars
+            "dark sky, wide stars": BenchmarkFixtures.synthetic_star_image(sigma_px=1.2, background=0.0, noise=0.5),
+            "dark sky, wider stars": BenchmarkFixtures.synthetic_star_image(sigma_px=1.5, background=0.0, noise=0.5),
+        }
+        def within_field_of_view(positions: np.ndarray) -> np.ndarray:
+            return positions[np.hypot(*(positions - np.array(Params.center_point)).T) <= Params.norm_radius]
+
+        for scenario, (gray_image, true_positions) in scenarios.items():
+            true_positions = within_field_of_view(true_positions)
+            # former detection: global threshold, components of 1 to 20 pixels
+            _, mask_image = cv2.threshold(gray_image, 68, 255, cv2.THRESH_BINARY)
+            num_labels, _, stats, centroids = cv2.connectedComponentsWithStats(mask_image, connectivity=8)
+            global_positions = within_field_of_view(centroids[1:][stats[1:, cv2.CC_STAT_AREA] <= 20])
+
+            start = time.perf_counter()
+            background_estimate = StarImager.background_estimate_of(gray_image)
+            mask_image = StarImager.gray_to_mask(gray_image, background_estimate)
+            detected_stars, extended_count = StarImager.determine_centroids(gray_image, mask_image,
+                                                                            background_estimate.background)
+            duration = time.perf_counter() - start
+
+            for label, positions, components in (("global threshold", global_positions, num_labels - 1),
+                                                 ("local thresholds", detected_stars.positions,
+                                                  len(detected_stars) + extended_count)):
+                distances = np.linalg.norm(positions[:, None, :] - true_positions[None, :, :], axis=2)
+                found = np.count_nonzero(distances.min(axis=0) < 1) if len(positions) > 0 else 0
+                false_detections = np.count_nonzero(distances.min(axis=1) >= 1) if len(positions) > 0 else 0
+                print(f"{scenario}, {label}: {components} components, {found} of {len(true_positions)} stars "
+                      f"found, {false_detections} false detections")
+            print(f"    local thresholds: {duration * 1000:.1f} ms per frame, "
+                  f"{DetectionStatistics(background_estimate, len(detected_stars), extended_count)}")
+
+    @staticmethod
+    def observed_frame_benchmark(star_count: int = 30, quadruple_count: int = 5000, repetitions: int = 5,
+                                 field_of_view_deg: float = 17.0, crowded_star_count: int = 5000):
+        """
+        Compares building quadruples from per pair cosines of observed star objects with quadruples as index views
+        into an ObservedFrame sharing its cached cosine separations, and times the first quadruples of a crowded frame.
+        """
+        rng = np.random.default_rng(0)
+        positions = rng.uniform(0, Params.width_height[0], (star_count, 2))
+        pixel_counts = rng.integers(1, StarImager.max_star_pixel_count + 1, star_count)
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            stars = [ObservedStar(int(pixel_count), (float(x), float(y)))
+                     for (x, y), pixel_count in zip(positions, pixel_counts)]
+            viable_stars = [star for star in stars if star.within_circular_field_of_view]
+            for quadruple_stars in itertools.islice(itertools.combinations(viable_stars, 4), quadruple_count):
+                ObservedQuadruple(dict(enumerate(quadruple_stars)),
+                                  {identifier: ObservedStarPair.from_observed_stars(
+                                      quadruple_stars[first], quadruple_stars[second], field_of_view_deg)
+                                   for identifier, (first, second) in enumerate(StarImager.pair_by_ids)})
+        object_duration = (time.perf_counter() - start) / repetitions
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            frame = ObservedFrame(positions, pixel_counts, field_of_view_deg).within_field_of_view()
+            for star_indices in itertools.islice(frame.brightness_ordered_quadruples(), quadruple_count):
+                frame.quadruple(star_indices)
+        frame_duration = (time.perf_counter() - start) / repetitions
+
+        print(f"{quadruple_count} quadruples of {star_count} stars: {object_duration * 1000:.2f} ms with per pair "
+              f"cosines, {frame_duration * 1000:.2f} ms with an observed frame")
+
+        # noisy frames detect thousands of stars, matching still only needs the first quadruples
+        noisy_frame = ObservedFrame(rng.uniform(0, Params.width_height[0], (crowded_star_count, 2)),
+                                    rng.integers(1, StarImager.max_star_pixel_count + 1, crowded_star_count),
+                                    field_of_view_deg)
+        start = time.perf_counter()
+        for star_indices in itertools.islice(noisy_frame.brightness_ordered_quadruples(), 20):
+            noisy_frame.quadruple(star_indices)
+        print(f"20 quadruples of {crowded_star_count} stars: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    @staticmethod
+    def frame_loading_benchmark(repetitions: int = 20, consumers: int = 3):
+        """
+        Compares decoding a screenshot to BGR with a gray conversion per consumer and a masked copy for the star
+        tracker against the gray frame cache, decoding straight to gray once and sharing the buffer.
+        """
+        import tempfile
+        from common import Code
+        from se_automation import GrayFrameCache
+        gray_image, _ = BenchmarkFixtures.synthetic_star_image()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark_frame.png")
+            cv2.imwrite(path, cv2.cvtColor(gray_image, cv2.COLOR_GRAY2BGR))
+            field_of_view_mask = Code.circular_field_of_view_mask()
+
+            start = time.perf_counter()
+            for _ in range(repetitions):
+                raw_image = cv2.imread(path)
+                gray_images = [cv2.cvtColor(raw_image, cv2.COLOR_BGR2GRAY) for _ in range(consumers)]
+                np.where(field_of_view_mask > 0, gray_images[0], 0).astype(np.uint8)
+            bgr_duration = (time.perf_counter() - start) / repetitions
+
+            start = time.perf_counter()
+            for _ in range(repetitions):
+                frame_cache = GrayFrameCache()
+                for _ in range(consumers):
+                    frame_cache.read(path)
+                frame_cache.read(path, within_field_of_view=True)
+            cold_duration = (time.perf_counter() - start) / repetitions
+
+            start = time.perf_counter()
+            for _ in range(repetitions):
+                for _ in range(consumers):
+                    frame_cache.read(path)
+                frame_cache.read(path, within_field_of_view=True)
+            cached_duration = (time.perf_counter() - start) / repetitions
+
+        print(f"{consumers} consumers per frame: {bgr_duration * 1000:.2f} ms decoding to BGR, "
+              f"{cold_duration * 1000:.2f} ms decoding to gray once, {cached_duration * 1000:.3f} ms from the cache")
+
+    @staticmethod
+    def sun_mask_statistics_benchmark(center: tuple[float, float] = (620.3, 410.7), radius: float = 150.0,
+                                      repetitions: int = 20):
+        """
+        Compares the former per pixel loop over a sun mask with SunMaskStatistics on a synthetic solar disc.
+        """
+        from sun_detection import SunMaskStatistics
+        width, height = Params.width_height
+        ys, xs = np.mgrid[0:height, 0:width]
+        mask_image = np.where((xs - center[0]) ** 2 + (ys - center[1]) ** 2 <= radius ** 2, 255, 0).astype(np.uint8)
+
+        # former implementation: collect every white pixel in nested loops, average row and column
+        start = time.perf_counter()
+        dots = []
+        for row in range(0, height):
+            for col in range(0, width):
+                val = mask_image[row][col]
+                assert val == 0 or val == 255
+                if val > 0:
+                    dots.append([row, col])
+        dots = np.array(dots)
+        loop_center = float(dots[:, 1].mean()), float(dots[:, 0].mean())
+        loop_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            mask_statistics = SunMaskStatistics.from_mask_image(mask_image)
+        vectorized_duration = (time.perf_counter() - start) / repetitions
+
+        assert mask_statistics.pixel_count == len(dots)
+        assert np.allclose(mask_statistics.center_point, loop_center)
+        print(f"Disc of radius {radius} px at {center}: {mask_statistics}")
+        print(f"per pixel loop: {loop_duration * 1000:.1f} ms, vectorized: {vectorized_duration * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    BenchmarkFixtures.run(ImagingBenchmarks, sys.argv[1:])
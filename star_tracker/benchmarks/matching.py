@@ -0,0 +1,194 @@
+import math
+import sys
+import time
+
+import numpy as np
+
+from common import Params
+from star_tracker.benchmarks.fixtures import BenchmarkFixtures
+from star_tracker.star_imager import StarImager
+
+
+class MatchingBenchmarks:
+    """
+    Matching engines, pattern hash, frame wide candidate lookup, match confidence and tracking.
+    """
+    @staticmethod
+    def matching_engine_benchmark(frame_count: int = 100):
+        """
+        Runs the quadruple and the pyramid matching engine on the same synthetic frames.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        from star_tracker.star_matching import MultiMatcher, matching_engines
+        artifacts = ArtifactCache.default_artifacts()
+        frames = BenchmarkFixtures.synthetic_frames(artifacts, frame_count)
+        for engine in matching_engines:
+            durations, solved, correct = [], 0, 0
+            for quadruples, truths in frames:
+                multi_matcher = MultiMatcher(quadruples, artifacts=artifacts, engine=engine, save_debug_images=False)
+                start = time.perf_counter()
+                with BenchmarkFixtures.quiet():
+                    result = multi_matcher.determine_match_from_multiple_quadruples()
+                durations.append(time.perf_counter() - start)
+                solved += result is not None
+                correct += BenchmarkFixtures.matched_correctly(result, quadruples, truths)
+            print(f"{engine}: solved {solved} / {frame_count} frames, {correct} correctly, "
+                  f"median {np.median(durations) * 1000:.2f} ms, "
+                  f"95th percentile {np.percentile(durations, 95) * 1000:.2f} ms per frame")
+
+    @staticmethod
+    def triangle_hash_benchmark(max_viable_angle_deg: float = Params.star_tracker_max_fov_deg,
+                                magnitudes: tuple[float, ...] = (4.9, 5.5), queries: int = 2000):
+        """
+        Tracks build time, size and lookup latency of the triangle hash index. Lookups probe the brightest triangle of
+        synthetic frames, the true catalog triangle must be among the candidates.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        from star_tracker.pattern_hash import TriangleHashIndex
+        for magnitude in magnitudes:
+            artifacts = ArtifactCache().artifacts_for_camera(max_viable_angle_deg, magnitude)
+            start = time.perf_counter()
+            triangle_hash_index = TriangleHashIndex.from_pair_database(
+                artifacts.pair_database, artifacts.catalog_store.positions, max_viable_angle_deg)
+            build_duration = time.perf_counter() - start
+
+            frames = BenchmarkFixtures.synthetic_frames(artifacts, queries, max_viable_angle_deg, quadruples_per_frame=1)
+            probes = []
+            for quadruples, truths in frames:
+                pairings = quadruples[0].observed_pairings_dict
+                side_angles = tuple(math.degrees(math.acos(min(1.0, pairings.get(StarImager.pairing_id_by_pair.get(
+                    side)).cosine_separation))) for side in ((1, 2), (0, 2), (0, 1)))
+                probes.append((side_angles, set(truths[0][:3])))
+            start = time.perf_counter()
+            candidate_sets = [triangle_hash_index.candidates(side_angles) for side_angles, _ in probes]
+            lookup_duration = (time.perf_counter() - start) / queries
+            found = sum(any(set(row.tolist()) == truth for row in candidates)
+                        for candidates, (_, truth) in zip(candidate_sets, probes))
+            mean_candidates = np.mean([len(candidates) for candidates in candidate_sets])
+            print(f"magnitude {magnitude}: {len(triangle_hash_index)} triangles, "
+                  f"{triangle_hash_index.nbytes / 2**20:.1f} MiB, built in {build_duration * 1000:.0f} ms, "
+                  f"lookup {lookup_duration * 1e6:.1f} µs, {mean_candidates:.0f} candidates per lookup, "
+                  f"true triangle found {found} / {queries}")
+
+    @staticmethod
+    def frame_lookup_benchmark(frame_count: int = 50, quadruples_per_frame: int = 20):
+        """
+        Compares six candidate pair queries per quadruple with one batched query per frame over the unique observed
+        pairs. Both lookups must lead to the same matches.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        from star_tracker.star_matching import FrameCandidateRanges, MultiMatcher
+        artifacts = ArtifactCache.default_artifacts()
+        pair_database = artifacts.pair_database
+        frames = BenchmarkFixtures.synthetic_frames(artifacts, frame_count, quadruples_per_frame=quadruples_per_frame)
+        per_quadruple_durations, batched_durations, unique_pair_counts, quadruple_counts = [], [], [], []
+        for quadruples, _ in frames:
+            start = time.perf_counter()
+            for quadruple in quadruples:
+                for observed_star_pair in quadruple.observed_pairings_dict.values():
+                    pair_database.query_range(observed_star_pair.cosine_separation)
+            per_quadruple_durations.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            frame_candidate_ranges = FrameCandidateRanges(quadruples, pair_database)
+            batched_durations.append(time.perf_counter() - start)
+            unique_pair_counts.append(frame_candidate_ranges.unique_pair_count)
+            quadruple_counts.append(len(quadruples))
+
+            results = {}
+            for batch_lookup in (False, True):
+                multi_matcher = MultiMatcher(quadruples, artifacts=artifacts, save_debug_images=False,
+                                             batch_lookup=batch_lookup)
+                with BenchmarkFixtures.quiet():
+                    results[batch_lookup] = multi_matcher.determine_match_from_multiple_quadruples()
+            assert (results[False] is None) == (results[True] is None)
+            assert results[False] is None or results[False][0] == results[True][0]
+        print(f"{np.mean(quadruple_counts):.1f} quadruples, {np.mean(unique_pair_counts):.1f} unique pairs per frame "
+              f"(instead of {6 * np.mean(quadruple_counts):.0f} pair queries)")
+        print(f"per quadruple lookup: {np.mean(per_quadruple_durations) * 1000:.2f} ms per frame, "
+              f"batched lookup: {np.mean(batched_durations) * 1000:.2f} ms per frame, identical matches")
+
+    @staticmethod
+    def match_confidence_benchmark(frame_count: int = 100, quadruples_per_frame: int = 20, noise_deg: float = 0.06):
+        """
+        Counts the quadruples tried per frame until a match is accepted, once accepting unambiguous matches only and
+        once also accepting the best scored hypothesis of a sufficiently confident quadruple.
+        """
+        from star_tracker.artifact_cache import ArtifactCache
+        from star_tracker.star_matching import MultiMatcher
+        artifacts = ArtifactCache.default_artifacts()
+        frames = BenchmarkFixtures.synthetic_frames(artifacts, frame_count, quadruples_per_frame=quadruples_per_frame,
+                                             noise_deg=noise_deg)
+        for engine in ("quadruple", "pyramid"):
+            for min_confidence in (None, 0.5):
+                retries, solved, correct = [], 0, 0
+                for quadruples, truths in frames:
+                    multi_matcher = MultiMatcher(quadruples, artifacts=artifacts, engine=engine,
+                                                 save_debug_images=False, min_confidence=min_confidence)
+                    with BenchmarkFixtures.quiet():
+                        multi_matcher.determine_match_from_multiple_quadruples()
+                    winning_result = next((result for result in multi_matcher.results
+                                           if result is not None and result.matched), None)
+                    if winning_result is None:
+                        retries.append(len(quadruples))
+                        continue
+                    retries.append(winning_result.quadruple_index)
+                    solved += 1
+                    matched_ids = [winning_result.matching_quadruple[identifier]
+                                   for identifier in StarImager.matching_candidate_ids]
+                    correct += matched_ids == truths[winning_result.quadruple_index]
+                print(f"{engine}, min confidence {min_confidence}: solved {solved} / {frame_count} frames, "
+                      f"{correct} correctly, {np.mean(retries):.2f} retries per frame on average, "
+                      f"{np.max(retries)} at most")
+
+    @staticmethod
+    def tracking_benchmark(frame_count: int = 100, turn_angle_deg: float = 5.0, seed: int = 0):
+        """
+        Turns a simulated camera frame by frame around a fixed axis and matches every frame once lost-in-space and
+        once tracking, i.e. against the catalog stars around the view vector predicted from the previous frame.
+        """
+        from star_tracker.attitude_determiner import AttitudeDeterminer
+        from star_tracker.catalog_parser import UnitVector
+        rng = np.random.default_rng(seed)
+        determiner = AttitudeDeterminer(Params.star_tracker_max_fov_deg)
+        view_vector = UnitVector(rng.normal(size=3))
+        axis_vector = UnitVector(np.cross(view_vector.value, rng.normal(size=3)))
+        view_vectors = [view_vector]
+        while len(view_vectors) < frame_count + 1:
+            view_vectors.append(UnitVector.from_rodrigues_rotation(axis_vector, view_vectors[-1], turn_angle_deg))
+        # the first view only provides the previous attitude of the first frame
+        frames = BenchmarkFixtures.synthetic_frames(determiner.artifacts, frame_count,
+                                             boresights=[vector.value for vector in view_vectors[1:]])
+        for tracking in (False, True):
+            determiner.tracking = tracking
+            durations, correct, modes = [], 0, []
+            for previous_view_vector, (quadruples, truths) in zip(view_vectors, frames):
+                if len(quadruples) == 0:
+                    continue
+                determiner.predicted_attitude = previous_view_vector, axis_vector
+                determiner.predict_turn(turn_angle_deg)
+                start = time.perf_counter()
+                with BenchmarkFixtures.quiet():
+                    result = determiner.match_quadruples(quadruples)
+                durations.append(time.perf_counter() - start)
+                modes.append(determiner.last_matching_mode)
+                correct += BenchmarkFixtures.matched_correctly(result, quadruples, truths)
+            print(f"{'tracking' if tracking else 'lost-in-space'}: {correct} / {len(durations)} frames correct, "
+                  f"{modes.count('tracking')} matched by tracking, median {np.median(durations) * 1000:.2f} ms, "
+                  f"95th percentile {np.percentile(durations, 95) * 1000:.2f} ms per frame")
+
+        # a wrong prediction with lazily built quadruples like the star imager's, the fallback must still see them
+        determiner.tracking = True
+        solved = 0
+        for previous_view_vector, (quadruples, _) in zip(view_vectors, frames):
+            if len(quadruples) == 0:
+                continue
+            determiner.predicted_attitude = UnitVector(-previous_view_vector.value), axis_vector
+            with BenchmarkFixtures.quiet():
+                result = determiner.match_quadruples(quadruple for quadruple in quadruples)
+            assert determiner.predicted_attitude is None
+            solved += result is not None and determiner.last_matching_mode == "lost-in-space"
+        print(f"wrong prediction, lazy quadruples: {solved} frames solved by the lost-in-space fallback")
+
+
+if __name__ == "__main__":
+    BenchmarkFixtures.run(MatchingBenchmarks, sys.argv[1:])
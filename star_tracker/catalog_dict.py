@@ -0,0 +1,10 @@
+# Thin accessor over the catalog store of the default star tracker artifacts, kept for callers of the formerly
+# generated dict module. The artifacts are only looked up, and built if missing, on first access of catalog_dict,
+# importing this module has no side effects. See ArtifactCache.
+
+
+def __getattr__(name: str):
+    if name == "catalog_dict":
+        from star_tracker.artifact_cache import ArtifactCache
+        return ArtifactCache.default_artifacts().catalog_dict
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
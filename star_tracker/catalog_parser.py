@@ -116,14 +116,162 @@ class Parser:
         de_seconds_end = 90
         vmag_start = 103
         vmag_end = 107
+        # annual proper motion in arcsec per year, right ascension component already scaled by cos(declination)
+        pm_ra_start = 149
+        pm_ra_end = 154
+        pm_de_start = 155
+        pm_de_end = 160
 
-    catalog_dict_file = "star_tracker/catalog_dict.py"
+    # epoch of the catalog positions in Julian years
+    catalog_epoch = 2000.0
+
+    # legacy python source form of the catalog, superseded by star_tracker.catalog_store
+    catalog_dict_file = "star_tracker/legacy_catalog_dict.py"
 
     def __init__(self):
         self.catalog_file = "./assets/catalog"
         self.catalog_dict: dict[int, CatalogStar] | None = None
+        # columns of parse_columns restricted to valid rows, row index equals star id
+        self.catalog_columns: dict[str, np.ndarray] | None = None
+        self._positions_by_epoch: dict[float, np.ndarray] = {}
 
     def parse(self):
+        """
+        Columnar parse of the whole catalog file, results equal those of parse_line_by_line.
+        """
+        columns = self.parse_columns()
+        valid_rows = np.flatnonzero(columns["valid"])
+        names = columns["name"]
+        visual_magnitudes = columns["visual_magnitude"]
+        raw_positions = columns["raw_position"]
+        catalog_stars = {}
+        for idx, row in enumerate(valid_rows):
+            catalog_stars[idx] = CatalogStar(str(names[row]), UnitVector(raw_positions[row]),
+                                             float(visual_magnitudes[row]))
+        self.catalog_dict = catalog_stars
+        self.catalog_columns = {key: column[valid_rows] for key, column in columns.items()}
+        self._positions_by_epoch = {}
+
+    def positions_at_epoch(self, epoch: float) -> np.ndarray:
+        """
+        Positions of all parsed stars at the given epoch, propagated along their proper motion. Results are cached per
+        epoch and returned read-only.
+        :param epoch: Julian epoch year, e.g. 2025.5
+        :return: (n, 3) matrix of unit vectors, row index equals star id
+        """
+        assert self.catalog_columns is not None, "catalog must be parsed first"
+        positions = self._positions_by_epoch.get(epoch)
+        if positions is None:
+            positions = self.propagate_positions(self.catalog_columns, epoch - self.catalog_epoch)
+            positions.setflags(write=False)
+            self._positions_by_epoch[epoch] = positions
+        return positions
+
+    @staticmethod
+    def propagate_positions(columns: dict[str, np.ndarray], years: float) -> np.ndarray:
+        """
+        Moves every star along its tangent plane by proper motion times elapsed years in a single vectorized pass.
+        :param columns: catalog columns as returned by parse_columns
+        :param years: elapsed Julian years since the catalog epoch, may be negative
+        :return: (n, 3) matrix of unit vectors
+        """
+        raw_positions = columns["raw_position"]
+        positions = raw_positions / np.linalg.norm(raw_positions, axis=1, keepdims=True)
+        if years == 0:
+            return positions
+        right_ascensions, declinations = columns["right_ascension"], columns["declination"]
+        east = np.column_stack((-np.sin(right_ascensions), np.cos(right_ascensions), np.zeros(len(positions))))
+        north = np.column_stack((
+            -np.sin(declinations) * np.cos(right_ascensions),
+            -np.sin(declinations) * np.sin(right_ascensions),
+            np.cos(declinations)
+        ))
+        proper_motions = columns["proper_motion"]
+        moved = positions + years * (proper_motions[:, 0:1] * east + proper_motions[:, 1:2] * north)
+        return moved / np.linalg.norm(moved, axis=1, keepdims=True)
+
+    def read_line_matrix(self) -> np.ndarray:
+        """
+        Reads the fixed-width catalog file into a (lines, bytes) uint8 matrix, short lines are padded with null bytes.
+        """
+        with open(self.catalog_file, 'rb') as file:
+            lines = file.read().splitlines()
+        line_width = max(len(line) for line in lines)
+        return np.array(lines, dtype=f"S{line_width}").view(np.uint8).reshape(len(lines), line_width)
+
+    @staticmethod
+    def column(line_matrix: np.ndarray, start_byte: int, end_byte: int) -> np.ndarray:
+        """
+        Vectorized counterpart of substr, returns the stripped field of every line as a bytes array.
+        """
+        field = np.ascontiguousarray(line_matrix[:, start_byte - 1: end_byte])
+        return np.char.strip(field.view(f"S{end_byte - start_byte + 1}").ravel())
+
+    @staticmethod
+    def float_column(line_matrix: np.ndarray, start_byte: int, end_byte: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: float values of a field and the mask of lines in which the field is present
+        """
+        field = Parser.column(line_matrix, start_byte, end_byte)
+        present = field != b""
+        return np.where(present, field, b"0").astype(np.float64), present
+
+    def parse_columns(self) -> dict[str, np.ndarray]:
+        """
+        Slices every relevant fixed-width field for all catalog lines at once. Lines that do not correspond to a star,
+        rather a nebular, galaxy or cluster, lack numeric fields and are flagged in the 'valid' mask.
+        """
+        line_matrix = self.read_line_matrix()
+        numeric_fields = {
+            "visual_magnitude": (self.Indices.vmag_start, self.Indices.vmag_end),
+            "ra_hours": (self.Indices.ra_hours_start, self.Indices.ra_hours_end),
+            "ra_minutes": (self.Indices.ra_minutes_start, self.Indices.ra_minutes_end),
+            "ra_seconds": (self.Indices.ra_seconds_start, self.Indices.ra_seconds_end),
+            "de_degrees": (self.Indices.de_degrees_start, self.Indices.de_degrees_end),
+            "de_minutes": (self.Indices.de_minutes_start, self.Indices.de_minutes_end),
+            "de_seconds": (self.Indices.de_seconds_start, self.Indices.de_seconds_end),
+        }
+        values = {}
+        valid = np.ones(len(line_matrix), dtype=bool)
+        for key, (start_byte, end_byte) in numeric_fields.items():
+            values[key], present = self.float_column(line_matrix, start_byte, end_byte)
+            valid &= present
+        de_signs = self.column(line_matrix, self.Indices.de_sign, self.Indices.de_sign)
+
+        # same evaluation order as UnitVector.from_celestial_coordinate, so values are bitwise equal
+        de_multipliers = np.where(de_signs == b"-", -1, 1)
+        ra_radians = (values["ra_hours"] * Params.radians_per_hour + values["ra_minutes"] * Params.radians_per_minute +
+                      values["ra_seconds"] * Params.radians_per_second)
+        de_radians = (values["de_degrees"] * Params.radians_per_degree +
+                      values["de_minutes"] * Params.radians_per_arcmin +
+                      values["de_seconds"] * Params.radians_per_arcsec) * de_multipliers
+        raw_positions = np.column_stack((
+            np.cos(ra_radians) * np.cos(de_radians),
+            np.sin(ra_radians) * np.cos(de_radians),
+            np.sin(de_radians)
+        ))
+
+        # missing proper motion does not invalidate a star, it is treated as zero
+        pm_ra, _ = self.float_column(line_matrix, self.Indices.pm_ra_start, self.Indices.pm_ra_end)
+        pm_de, _ = self.float_column(line_matrix, self.Indices.pm_de_start, self.Indices.pm_de_end)
+        proper_motions = np.column_stack((pm_ra, pm_de)) * Params.radians_per_arcsec
+
+        names = self.column(line_matrix, self.Indices.name_start, self.Indices.name_end)
+        hd_names = np.char.add(b"HD", self.column(line_matrix, self.Indices.hd_num_start, self.Indices.hd_num_end))
+        names = np.where(names == b"", hd_names, names)
+        names = np.char.replace(np.char.replace(names, b"    ", b" "), b"  ", b" ")
+
+        return {
+            "valid": valid,
+            "name": np.char.decode(names, "ascii"),
+            "visual_magnitude": values["visual_magnitude"],
+            "right_ascension": ra_radians,
+            "declination": de_radians,
+            "raw_position": raw_positions,
+            "proper_motion": proper_motions,
+        }
+
+    def parse_line_by_line(self):
         valid_stars = []
         with open(self.catalog_file, 'r') as file:
             for line in file:
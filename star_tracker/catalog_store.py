@@ -0,0 +1,146 @@
+import os
+from collections.abc import Iterator, Mapping
+
+import numpy as np
+
+from star_tracker.catalog_parser import CatalogStar, UnitVector, Parser
+
+
+class CatalogStore:
+    """
+    Compiled star catalog. Every star is one record of a structured array, star names are concatenated into a single
+    byte blob and referenced by offset and length. Both arrays are written as .npy files and memory-mapped at load.
+    """
+    store_dir = "star_tracker/catalog_store/"
+    records_file = "catalog.npy"
+    names_file = "names.npy"
+    record_dtype = np.dtype([
+        ("id", np.int32),
+        ("name_offset", np.int32),
+        ("name_length", np.int16),
+        ("visual_magnitude", np.float64),
+        ("position", np.float64, (3,)),
+        ("proper_motion", np.float64, (2,))
+    ])
+
+    def __init__(self, records: np.ndarray, names: np.ndarray):
+        assert records.dtype == self.record_dtype
+        self.records = records
+        self.names = names
+        self._positions: np.ndarray | None = None
+
+    @classmethod
+    def from_catalog_dict(cls, catalog_stars: dict[int, CatalogStar]):
+        """
+        Proper motion is not part of CatalogStar, stores built this way have it set to zero.
+        """
+        ids = sorted(catalog_stars.keys())
+        assert ids == list(range(len(ids))), "catalog ids must be consecutive, starting at 0"
+        records = np.zeros(len(ids), dtype=cls.record_dtype)
+        encoded_names = []
+        name_offset = 0
+        for identifier in ids:
+            star = catalog_stars.get(identifier)
+            encoded_name = star.name.encode("utf-8")
+            record = records[identifier]
+            record["id"] = identifier
+            record["name_offset"] = name_offset
+            record["name_length"] = len(encoded_name)
+            record["visual_magnitude"] = star.visual_magnitude
+            record["position"] = star.position.value
+            encoded_names.append(encoded_name)
+            name_offset += len(encoded_name)
+        names = np.frombuffer(b"".join(encoded_names), dtype=np.uint8)
+        return cls(records, names)
+
+    @classmethod
+    def from_catalog_columns(cls, columns: dict[str, np.ndarray], epoch: float = Parser.catalog_epoch):
+        """
+        Builds the store straight from Parser.parse_columns without creating CatalogStar objects.
+        :param columns: catalog columns, rows not flagged as valid are skipped
+        :param epoch: Julian epoch year the stored positions are propagated to
+        """
+        valid_rows = np.flatnonzero(columns["valid"])
+        valid_columns = {key: column[valid_rows] for key, column in columns.items()}
+        encoded_names = np.char.encode(valid_columns["name"], "utf-8")
+        name_lengths = np.char.str_len(encoded_names)
+        records = np.zeros(len(valid_rows), dtype=cls.record_dtype)
+        records["id"] = np.arange(len(valid_rows))
+        records["name_offset"] = np.cumsum(name_lengths) - name_lengths
+        records["name_length"] = name_lengths
+        records["visual_magnitude"] = valid_columns["visual_magnitude"]
+        records["position"] = Parser.propagate_positions(valid_columns, epoch - Parser.catalog_epoch)
+        records["proper_motion"] = valid_columns["proper_motion"]
+        names = np.frombuffer(b"".join(encoded_names.tolist()), dtype=np.uint8)
+        return cls(records, names)
+
+    @classmethod
+    def load(cls, directory: str = store_dir, mmap: bool = True):
+        mmap_mode = "r" if mmap else None
+        records = np.load(os.path.join(directory, cls.records_file), mmap_mode=mmap_mode)
+        names = np.load(os.path.join(directory, cls.names_file), mmap_mode=mmap_mode)
+        return cls(records, names)
+
+    def save(self, directory: str = store_dir):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.records_file), self.records)
+        np.save(os.path.join(directory, self.names_file), self.names)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.records["id"]
+
+    @property
+    def visual_magnitudes(self) -> np.ndarray:
+        return self.records["visual_magnitude"]
+
+    @property
+    def positions(self) -> np.ndarray:
+        """
+        Contiguous (n, 3) matrix of catalog unit vectors, row index equals star id.
+        """
+        if self._positions is None:
+            self._positions = np.ascontiguousarray(self.records["position"])
+        return self._positions
+
+    def name(self, star_id: int) -> str:
+        record = self.records[star_id]
+        name_offset = int(record["name_offset"])
+        return bytes(self.names[name_offset: name_offset + int(record["name_length"])]).decode("utf-8")
+
+    def catalog_star(self, star_id: int) -> CatalogStar:
+        record = self.records[star_id]
+        position = UnitVector(np.array(record["position"]))
+        return CatalogStar(self.name(star_id), position, float(record["visual_magnitude"]))
+
+
+class CatalogDict(Mapping):
+    """
+    Read-only dict[int, CatalogStar] view of a CatalogStore. CatalogStar objects are created on access only.
+    """
+    def __init__(self, store: CatalogStore):
+        self.store = store
+
+    def __getitem__(self, star_id: int) -> CatalogStar:
+        if not isinstance(star_id, (int, np.integer)) or not 0 <= star_id < len(self.store):
+            raise KeyError(star_id)
+        return self.store.catalog_star(int(star_id))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.store)))
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def copy(self) -> dict[int, CatalogStar]:
+        return dict(self.items())
+
+
+if __name__ == "__main__":
+    # the catalog store is built and kept along with the other star tracker artifacts
+    from star_tracker.artifact_cache import ArtifactCache
+    artifacts = ArtifactCache.default_artifacts()
+    print(f"Catalog store of {len(artifacts.catalog_store)} stars in \"{artifacts.directory}\".")
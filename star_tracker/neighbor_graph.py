@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+
+from star_tracker.pair_database import StarPairDatabase
+
+
+class NeighborGraph:
+    """
+    Star neighbor graph in compressed sparse row form. Neighbors of star s are
+    neighbor_ids[offsets[s]:offsets[s + 1]], sorted ascending, with the cosine separation of every edge stored at the
+    same index in cosine_separations.
+    """
+    offsets_file = "offsets.npy"
+    neighbor_ids_file = "neighbor_ids.npy"
+    cosine_separations_file = "cosine_separations.npy"
+
+    def __init__(self, offsets: np.ndarray, neighbor_ids: np.ndarray, cosine_separations: np.ndarray):
+        assert len(neighbor_ids) == len(cosine_separations) == offsets[-1]
+        self.offsets = offsets
+        self.neighbor_ids = neighbor_ids
+        self.cosine_separations = cosine_separations
+
+    @classmethod
+    def from_pair_database(cls, pair_database: StarPairDatabase, star_count: int):
+        """
+        :param pair_database: every pair becomes an edge in both directions
+        :param star_count: number of catalog stars, stars without pairs get an empty neighbor range
+        """
+        source_ids = np.concatenate((pair_database.first_ids, pair_database.second_ids))
+        target_ids = np.concatenate((pair_database.second_ids, pair_database.first_ids))
+        cosine_separations = np.concatenate((pair_database.cosine_separations, pair_database.cosine_separations))
+        order = np.lexsort((target_ids, source_ids))
+        offsets = np.searchsorted(source_ids[order], np.arange(star_count + 1)).astype(np.int64)
+        return cls(offsets, target_ids[order].astype(np.int32), cosine_separations[order])
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        mmap_mode = "r" if mmap else None
+        return cls(
+            np.load(os.path.join(directory, cls.offsets_file), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, cls.neighbor_ids_file), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, cls.cosine_separations_file), mmap_mode=mmap_mode)
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.offsets_file), self.offsets)
+        np.save(os.path.join(directory, self.neighbor_ids_file), self.neighbor_ids)
+        np.save(os.path.join(directory, self.cosine_separations_file), self.cosine_separations)
+
+    @property
+    def star_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def neighbors_of(self, star_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: sorted neighbor ids and the corresponding cosine separations, as views into the graph
+        """
+        start, stop = self.offsets[star_id], self.offsets[star_id + 1]
+        return self.neighbor_ids[start:stop], self.cosine_separations[start:stop]
+
+    def common_neighbors(self, star_id: int, candidate_ids: np.ndarray) -> np.ndarray:
+        """
+        :return: sorted ids of all neighbors of star_id which are contained in candidate_ids
+        """
+        neighbor_ids, _ = self.neighbors_of(star_id)
+        return neighbor_ids[np.isin(neighbor_ids, candidate_ids)]
+
+    def neighbors_within(self, star_id: int, lowest_cosine: float, highest_cosine: float,
+                         candidate_mask: np.ndarray | None = None) -> np.ndarray:
+        """
+        :param candidate_mask: optional boolean mask over all catalog stars restricting the admissible neighbors
+        :return: neighbors whose cosine separation to star_id lies within [lowest_cosine, highest_cosine]
+        """
+        neighbor_ids, cosine_separations = self.neighbors_of(star_id)
+        within = (cosine_separations >= lowest_cosine) & (cosine_separations <= highest_cosine)
+        if candidate_mask is not None:
+            within &= candidate_mask[neighbor_ids]
+        return neighbor_ids[within]
+
+    def edges_of(self, star_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized gathering of all edges of several stars.
+        :return: edge indices into neighbor_ids / cosine_separations and, per edge, the position of its star in star_ids
+        """
+        starts = self.offsets[star_ids]
+        counts = self.offsets[np.asarray(star_ids) + 1] - starts
+        owners = np.repeat(np.arange(len(star_ids)), counts)
+        first_edge_of_owner = np.cumsum(counts) - counts
+        edge_indices = starts[owners] + np.arange(len(owners)) - first_edge_of_owner[owners]
+        return edge_indices, owners
+
+    def have_neighbor_within(self, star_ids: np.ndarray, candidate_mask: np.ndarray, lowest_cosine: float,
+                             highest_cosine: float) -> np.ndarray:
+        """
+        Vectorized "neighbor within angular tolerance" test.
+        :param star_ids: stars to test
+        :param candidate_mask: boolean mask over all catalog stars of admissible neighbors
+        :return: boolean array, True where a star has an admissible neighbor within [lowest_cosine, highest_cosine]
+        """
+        edge_indices, owners = self.edges_of(star_ids)
+        cosine_separations = self.cosine_separations[edge_indices]
+        valid_edges = ((cosine_separations >= lowest_cosine) & (cosine_separations <= highest_cosine) &
+                       candidate_mask[self.neighbor_ids[edge_indices]])
+        return np.bincount(owners[valid_edges], minlength=len(star_ids)) > 0
@@ -2,17 +2,15 @@ import numpy as np
 from matplotlib import pyplot as plt
 
 from common import Code, Params
-from star_tracker.catalog_dict import catalog_dict
-from star_tracker.catalog_parser import UnitVector
-from star_tracker.star_pairing import PairingDeterminer
+from star_tracker.artifact_cache import ArtifactCache
+from star_tracker.sky_grid import SkyGrid
+from star_tracker.star_pairing import PairDatabaseBuilder
 
 
 class OptimizationAnalysis:
     @staticmethod
     def create_magnitude_barchart(min_mag: float = -1, max_mag: float = 8):
-        mag_vals = []
-        for val in catalog_dict.values():
-            mag_vals.append(val.visual_magnitude)
+        mag_vals = ArtifactCache.default_artifacts().catalog_store.visual_magnitudes.tolist()
         print(f"Min: {min(mag_vals)} Max: {max(mag_vals)} Length: {len(mag_vals)}")
         barchart_tuples = []
         for i in range(int(min_mag * 2), int(max_mag * 2 + 1)):
@@ -39,21 +37,21 @@ class OptimizationAnalysis:
     @staticmethod
     def create_star_density_graphic(max_mag: float, field_of_view_deg: float):
         field_of_view_rad = Code.deg_to_rad(field_of_view_deg)
-        filtered_star_list = [star for star in catalog_dict.values() if star.visual_magnitude <= max_mag]
-        print(f"number of stars: {len(filtered_star_list)}")
-        counting_rows_by_declination = []
-        for dec_deg in range(90, -90-1, -1):
-            print(dec_deg)
-            counts_by_right_ascension = []
-            for ra_deg in range(0, 359+1):
-                visible_count = 0
-                heading_vector = UnitVector.from_celestial_radians(ra_deg * Params.radians_per_degree, dec_deg * Params.radians_per_degree)
-                for star in filtered_star_list:
-                    separation_angle_rad = heading_vector.angular_rad_separation(star.position)
-                    if separation_angle_rad <= field_of_view_rad:
-                        visible_count += 1
-                counts_by_right_ascension.append(visible_count)
-            counting_rows_by_declination.append(counts_by_right_ascension)
+        store = ArtifactCache.default_artifacts().catalog_store
+        filtered_positions = store.positions[store.visual_magnitudes <= max_mag]
+        print(f"number of stars: {len(filtered_positions)}")
+        # one heading per whole degree, rows from north to south, columns by right ascension
+        dec_rads = np.arange(90, -90-1, -1) * Params.radians_per_degree
+        ra_rads = np.arange(0, 359+1) * Params.radians_per_degree
+        ra_grid, dec_grid = np.meshgrid(ra_rads, dec_rads)
+        heading_vectors = np.column_stack((
+            (np.cos(ra_grid) * np.cos(dec_grid)).ravel(),
+            (np.sin(ra_grid) * np.cos(dec_grid)).ravel(),
+            np.sin(dec_grid).ravel()
+        ))
+        sky_grid = SkyGrid(filtered_positions, field_of_view_deg)
+        offsets, _ = sky_grid.star_ids_within_cones(heading_vectors, field_of_view_rad)
+        counting_rows_by_declination = np.diff(offsets).reshape(len(dec_rads), len(ra_rads))
 
         a = np.array(counting_rows_by_declination)#np.random.random((5, 5))
         plt.imshow(a, cmap='hot', interpolation='nearest')
@@ -71,17 +69,19 @@ class OptimizationAnalysis:
         max_fov = 25
         fov_step = 1
         if overriding_data is None:
+            catalog_store = ArtifactCache.default_artifacts().catalog_store
+            # build the union database once, every (fov, mag) cell is derived from it by masking
+            builder = PairDatabaseBuilder(max_fov, min_fov/1000, max_mag, catalog_store)
+            union_database = builder.build()
+            visual_magnitudes = catalog_store.visual_magnitudes
             for fov in range(min_fov, max_fov+1, fov_step):
                 print(f"fov: {fov}°")
                 count_pairings_by_mag = []
                 for mag_times_10 in range(int(min_mag*10), int(max_mag*10)+1, mag_step):
                     mag = mag_times_10 / 10
-                    pd = PairingDeterminer(fov, fov/1000, mag, catalog_dict.copy())
-                    pairings = pd.determine_viable_pairings()
-                    len_pairings = len(pairings)
-                    print(fov, mag ,len_pairings, len(pd.filtered_catalog_dict))
+                    len_pairings = len(builder.derive(union_database, fov, fov/1000, mag))
+                    print(fov, mag, len_pairings, np.count_nonzero(visual_magnitudes <= mag))
                     count_pairings_by_mag.append(len_pairings)
-                    pd = None
                 count_pairings_by_fov.append(count_pairings_by_mag)
         else:
             count_pairings_by_fov = overriding_data
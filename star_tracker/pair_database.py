@@ -0,0 +1,175 @@
+import os
+
+import numpy as np
+
+from common import Code
+
+
+class KVectorIndex:
+    """
+    k-vector range search (Mortari) over a sorted array. A line z(i) = slope * i + intercept is fitted from just below
+    the smallest to just above the largest value, k[i] counts the values <= z(i). An interval query reads two k entries
+    to obtain a slice containing all matches and trims its few surplus elements at both ends, so the cost does not
+    depend on the number of stored values.
+    """
+    k_vector_file = "k_vector.npy"
+    line_file = "k_vector_line.npy"
+    # relative margin keeping the line strictly below the first and above the last value
+    epsilon = 1e-12
+
+    def __init__(self, k_vector: np.ndarray, slope: float, intercept: float):
+        self.k_vector = k_vector
+        self.slope = slope
+        self.intercept = intercept
+
+    @classmethod
+    def from_sorted_values(cls, sorted_values: np.ndarray):
+        n = len(sorted_values)
+        assert n >= 2
+        margin = cls.epsilon * max(1.0, float(np.max(np.abs(sorted_values[[0, -1]]))))
+        lowest, highest = float(sorted_values[0]) - margin, float(sorted_values[-1]) + margin
+        slope = (highest - lowest) / (n - 1)
+        line = lowest + slope * np.arange(n)
+        k_vector = np.searchsorted(sorted_values, line, side="right").astype(np.int64)
+        return cls(k_vector, slope, lowest)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        mmap_mode = "r" if mmap else None
+        k_vector = np.load(os.path.join(directory, cls.k_vector_file), mmap_mode=mmap_mode)
+        slope, intercept = np.load(os.path.join(directory, cls.line_file))
+        return cls(k_vector, float(slope), float(intercept))
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, cls.k_vector_file))
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.k_vector_file), self.k_vector)
+        np.save(os.path.join(directory, self.line_file), np.array([self.slope, self.intercept]))
+
+    def value_range(self, sorted_values: np.ndarray, lowest: float, highest: float) -> tuple[int, int]:
+        """
+        :return: start and stop index of all values within [lowest, highest]
+        """
+        last_index = len(self.k_vector) - 1
+        # widen by one step on both sides so that rounding never cuts off values equal to a bound
+        lower_index = min(max(int((lowest - self.intercept) // self.slope) - 1, 0), last_index)
+        upper_index = min(max(int(-((self.intercept - highest) // self.slope)) + 1, 0), last_index)
+        start, stop = int(self.k_vector[lower_index]), int(self.k_vector[upper_index])
+        # the surplus at either end is about one element per line step, so a linear trim beats a binary search
+        while start < stop and sorted_values[start] < lowest:
+            start += 1
+        while stop > start and sorted_values[stop - 1] > highest:
+            stop -= 1
+        return start, stop
+
+
+class StarPairDatabase:
+    """
+    Catalog star pairs as three parallel arrays, sorted by ascending cosine separation. Candidate pairs for a measured
+    separation form a contiguous slice which is found with two binary searches.
+    """
+    cosine_separations_file = "cosine_separations.npy"
+    first_ids_file = "first_ids.npy"
+    second_ids_file = "second_ids.npy"
+
+    lookups = ("binary_search", "k_vector")
+
+    def __init__(self, cosine_separations: np.ndarray, first_ids: np.ndarray, second_ids: np.ndarray,
+                 k_vector_index: KVectorIndex | None = None):
+        assert len(cosine_separations) == len(first_ids) == len(second_ids)
+        self.cosine_separations = cosine_separations
+        self.first_ids = first_ids
+        self.second_ids = second_ids
+        self.k_vector_index = k_vector_index
+
+    def build_k_vector_index(self):
+        self.k_vector_index = KVectorIndex.from_sorted_values(self.cosine_separations)
+
+    @classmethod
+    def from_pair_arrays(cls, first_ids: np.ndarray, second_ids: np.ndarray, cosine_separations: np.ndarray):
+        order = np.argsort(cosine_separations, kind="stable")
+        return cls(
+            np.ascontiguousarray(cosine_separations[order], dtype=np.float64),
+            np.ascontiguousarray(first_ids[order], dtype=np.int32),
+            np.ascontiguousarray(second_ids[order], dtype=np.int32)
+        )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        mmap_mode = "r" if mmap else None
+        k_vector_index = KVectorIndex.load(directory, mmap) if KVectorIndex.exists(directory) else None
+        return cls(
+            np.load(os.path.join(directory, cls.cosine_separations_file), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, cls.first_ids_file), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, cls.second_ids_file), mmap_mode=mmap_mode),
+            k_vector_index
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.cosine_separations_file), self.cosine_separations)
+        np.save(os.path.join(directory, self.first_ids_file), self.first_ids)
+        np.save(os.path.join(directory, self.second_ids_file), self.second_ids)
+        if self.k_vector_index is not None:
+            self.k_vector_index.save(directory)
+
+    def __len__(self) -> int:
+        return len(self.cosine_separations)
+
+    @staticmethod
+    def cosine_interval(measured_cosine_separation: float,
+                        delta_angular_separation_deg: float = 0.1) -> tuple[float, float]:
+        """
+        Turns a measured separation and an angular tolerance into the matching interval of cosine separations,
+        equivalent to StarMatcher.cosine_separation_in_bounds.
+        :return: lowest and highest matching cosine separation
+        """
+        measured_angular_separation = Code.cosine_separation_to_angle_deg(measured_cosine_separation)
+        min_angular_separation = max(measured_angular_separation - delta_angular_separation_deg, 0)
+        max_angular_separation = min(measured_angular_separation + delta_angular_separation_deg, 90)
+        return (Code.angle_to_cosine_separation(max_angular_separation),
+                Code.angle_to_cosine_separation(min_angular_separation))
+
+    def query_range(self, measured_cosine_separation: float, delta_angular_separation_deg: float = 0.1,
+                    lookup: str = "binary_search") -> tuple[int, int]:
+        """
+        :param lookup: "binary_search" or "k_vector", the latter requires a built k-vector index
+        :return: start and stop index of the candidate pair slice
+        """
+        assert lookup in self.lookups
+        lowest_cosine, highest_cosine = self.cosine_interval(measured_cosine_separation, delta_angular_separation_deg)
+        if lookup == "k_vector":
+            assert self.k_vector_index is not None, "k-vector index has not been built"
+            return self.k_vector_index.value_range(self.cosine_separations, lowest_cosine, highest_cosine)
+        start = int(np.searchsorted(self.cosine_separations, lowest_cosine, side="left"))
+        stop = int(np.searchsorted(self.cosine_separations, highest_cosine, side="right"))
+        return start, stop
+
+    def query_ranges(self, measured_cosine_separations: np.ndarray, delta_angular_separation_deg: float = 0.1,
+                     lookup: str = "binary_search") -> tuple[np.ndarray, np.ndarray]:
+        """
+        Batched query_range for many measured separations at once.
+        :return: start and stop indices of the candidate pair slices
+        """
+        assert lookup in self.lookups
+        intervals = np.array([self.cosine_interval(float(measured), delta_angular_separation_deg)
+                              for measured in measured_cosine_separations]).reshape(-1, 2)
+        if lookup == "k_vector":
+            assert self.k_vector_index is not None, "k-vector index has not been built"
+            ranges = np.array([self.k_vector_index.value_range(self.cosine_separations, lowest, highest)
+                               for lowest, highest in intervals], dtype=np.int64).reshape(-1, 2)
+            return ranges[:, 0], ranges[:, 1]
+        starts = np.searchsorted(self.cosine_separations, intervals[:, 0], side="left")
+        stops = np.searchsorted(self.cosine_separations, intervals[:, 1], side="right")
+        return starts, stops
+
+    def query(self, measured_cosine_separation: float, delta_angular_separation_deg: float = 0.1,
+              lookup: str = "binary_search") -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: first ids, second ids and cosine separations of all candidate pairs, as views into the database
+        """
+        start, stop = self.query_range(measured_cosine_separation, delta_angular_separation_deg, lookup)
+        return self.first_ids[start:stop], self.second_ids[start:stop], self.cosine_separations[start:stop]
@@ -0,0 +1,110 @@
+import itertools
+import os
+
+import numpy as np
+
+from star_tracker.neighbor_graph import NeighborGraph
+from star_tracker.pair_database import StarPairDatabase
+
+
+class TriangleHashIndex:
+    """
+    Geometric hash index over all catalog star triangles of a pair database. The three side angles of a triangle are
+    sorted ascending and quantized into bins of bin_width_deg, the bin triple forms the hash key. Keys are stored as a
+    sorted array next to a (m x 3) matrix of star ids, ordered like the sorted sides: the first star lies opposite the
+    shortest side, the last star opposite the longest one. A lookup probes at most 8 keys with binary searches.
+    """
+    keys_file = "triangle_keys.npy"
+    star_ids_file = "triangle_star_ids.npy"
+    quantization_file = "triangle_quantization.npy"
+
+    def __init__(self, keys: np.ndarray, star_ids: np.ndarray, bin_width_deg: float, bin_count: int):
+        assert len(keys) == len(star_ids)
+        self.keys = keys
+        self.star_ids = star_ids
+        self.bin_width_deg = bin_width_deg
+        self.bin_count = bin_count
+
+    @staticmethod
+    def catalog_triangles(pair_database: StarPairDatabase, star_count: int) -> np.ndarray:
+        """
+        :return: (m x 3) matrix of star ids a < b < c of all triangles whose three sides are pairs of the database
+        """
+        lower_ids = np.minimum(pair_database.first_ids, pair_database.second_ids).astype(np.int64)
+        upper_ids = np.maximum(pair_database.first_ids, pair_database.second_ids).astype(np.int64)
+        neighbor_graph = NeighborGraph.from_pair_database(pair_database, star_count)
+        # close every edge a-b with a neighbor c > b of a, and keep it if b-c is an edge as well
+        edge_indices, owners = neighbor_graph.edges_of(lower_ids)
+        third_ids = neighbor_graph.neighbor_ids[edge_indices].astype(np.int64)
+        beyond = third_ids > upper_ids[owners]
+        first, second, third = lower_ids[owners[beyond]], upper_ids[owners[beyond]], third_ids[beyond]
+        edge_keys = np.sort(lower_ids * star_count + upper_ids)
+        probe_keys = second * star_count + third
+        positions = np.minimum(np.searchsorted(edge_keys, probe_keys), len(edge_keys) - 1)
+        closed = edge_keys[positions] == probe_keys
+        return np.column_stack((first[closed], second[closed], third[closed]))
+
+    @classmethod
+    def from_pair_database(cls, pair_database: StarPairDatabase, positions: np.ndarray, max_viable_angle_deg: float,
+                           bin_width_deg: float = 0.2):
+        """
+        :param positions: (n x 3) catalog unit vectors, row index equals star id
+        :param bin_width_deg: quantization step, at least twice the angular tolerance of later lookups
+        """
+        triangles = cls.catalog_triangles(pair_database, len(positions))
+        opposite_side_angles = np.column_stack([
+            np.degrees(np.arccos(np.clip(np.einsum("ij,ij->i", positions[triangles[:, second]],
+                                                   positions[triangles[:, third]]), -1.0, 1.0)))
+            for second, third in ((1, 2), (0, 2), (0, 1))
+        ])
+        order = np.argsort(opposite_side_angles, axis=1)
+        star_ids = np.take_along_axis(triangles, order, axis=1).astype(np.int32)
+        sorted_side_angles = np.take_along_axis(opposite_side_angles, order, axis=1)
+        bin_count = int(max_viable_angle_deg // bin_width_deg) + 2
+        keys = cls._keys(np.floor(sorted_side_angles / bin_width_deg).astype(np.int64), bin_count)
+        key_order = np.argsort(keys, kind="stable")
+        return cls(keys[key_order], np.ascontiguousarray(star_ids[key_order]), bin_width_deg, bin_count)
+
+    @staticmethod
+    def _keys(bins: np.ndarray, bin_count: int) -> np.ndarray:
+        return (bins[..., 0] * bin_count + bins[..., 1]) * bin_count + bins[..., 2]
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        mmap_mode = "r" if mmap else None
+        bin_width_deg, bin_count = np.load(os.path.join(directory, cls.quantization_file))
+        return cls(
+            np.load(os.path.join(directory, cls.keys_file), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, cls.star_ids_file), mmap_mode=mmap_mode),
+            float(bin_width_deg), int(bin_count)
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.keys_file), self.keys)
+        np.save(os.path.join(directory, self.star_ids_file), self.star_ids)
+        np.save(os.path.join(directory, self.quantization_file), np.array([self.bin_width_deg, self.bin_count]))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.star_ids.nbytes
+
+    def candidates(self, side_angles_deg: tuple[float, float, float], tolerance_deg: float = 0.1) -> np.ndarray:
+        """
+        :param side_angles_deg: the three observed side angles in any order
+        :return: (m x 3) matrix of catalog star ids of all triangles sharing a probed key, ordered opposite the
+        ascending sides
+        """
+        bin_ranges = []
+        for side_angle in sorted(side_angles_deg):
+            lowest_bin = int((side_angle - tolerance_deg) // self.bin_width_deg)
+            highest_bin = int((side_angle + tolerance_deg) // self.bin_width_deg)
+            bin_ranges.append(range(max(lowest_bin, 0), min(highest_bin, self.bin_count - 1) + 1))
+        probe_keys = self._keys(np.array(list(itertools.product(*bin_ranges)), dtype=np.int64).reshape(-1, 3),
+                                self.bin_count)
+        starts = np.searchsorted(self.keys, probe_keys, side="left")
+        stops = np.searchsorted(self.keys, probe_keys, side="right")
+        return np.concatenate([self.star_ids[start:stop] for start, stop in zip(starts, stops)])
@@ -0,0 +1,161 @@
+from math import pi, asin, sin, cos, floor, ceil
+
+import numpy as np
+
+
+class SkyGrid:
+    """
+    Bucket index over unit vectors. The sphere is split into declination bands of equal height, every band into right
+    ascension cells of roughly the same angular width, so cells cover similar areas. Star ids are stored per cell in
+    compressed form: ids of cell c are cell_star_ids[cell_starts[c]:cell_starts[c + 1]].
+    """
+    full_circle = 2 * pi
+    half_pi = pi / 2
+
+    def __init__(self, positions: np.ndarray, cell_size_deg: float):
+        assert positions.ndim == 2 and positions.shape[1] == 3
+        cell_size_rad = np.deg2rad(cell_size_deg)
+        self.positions = positions
+        self.band_count = max(1, int(pi // cell_size_rad))
+        self.band_height = pi / self.band_count
+
+        # the widest circle of latitude within a band determines how many cells fit into it
+        band_lower_decs = -self.half_pi + np.arange(self.band_count) * self.band_height
+        band_upper_decs = band_lower_decs + self.band_height
+        widest_cosines = np.where(band_lower_decs * band_upper_decs < 0, 1.0,
+                                  np.cos(np.minimum(np.abs(band_lower_decs), np.abs(band_upper_decs))))
+        self.cells_per_band = np.maximum(1, np.floor(self.full_circle * widest_cosines / cell_size_rad)).astype(int)
+        self.band_offsets = np.concatenate(([0], np.cumsum(self.cells_per_band)))
+        self.cell_count = int(self.band_offsets[-1])
+
+        star_cells = self.cells_of(positions)
+        self.cell_star_ids = np.argsort(star_cells, kind="stable")
+        self.cell_starts = np.searchsorted(star_cells[self.cell_star_ids], np.arange(self.cell_count + 1))
+
+    @staticmethod
+    def to_celestial_radians(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: right ascensions in [0, 2 pi) and declinations of an (n, 3) matrix of unit vectors
+        """
+        right_ascensions = np.arctan2(vectors[:, 1], vectors[:, 0]) % SkyGrid.full_circle
+        declinations = np.arcsin(np.clip(vectors[:, 2], -1.0, 1.0))
+        return right_ascensions, declinations
+
+    def cells_of(self, vectors: np.ndarray) -> np.ndarray:
+        right_ascensions, declinations = self.to_celestial_radians(vectors)
+        bands = np.minimum(((declinations + self.half_pi) // self.band_height).astype(int), self.band_count - 1)
+        cells_in_band = self.cells_per_band[bands]
+        ra_cells = np.minimum((right_ascensions * cells_in_band / self.full_circle).astype(int), cells_in_band - 1)
+        return self.band_offsets[bands] + ra_cells
+
+    def star_ids_in_cell(self, cell: int) -> np.ndarray:
+        return self.cell_star_ids[self.cell_starts[cell]:self.cell_starts[cell + 1]]
+
+    def cell_bounds(self, cell: int) -> tuple[float, float, float, float]:
+        """
+        :return: lower and upper declination as well as lower and upper right ascension of a cell in radians
+        """
+        band = int(np.searchsorted(self.band_offsets, cell, side="right")) - 1
+        cell_width = self.full_circle / self.cells_per_band[band]
+        ra_cell = cell - self.band_offsets[band]
+        dec_lower = -self.half_pi + band * self.band_height
+        return dec_lower, dec_lower + self.band_height, ra_cell * cell_width, (ra_cell + 1) * cell_width
+
+    def cells_near_region(self, dec_lower: float, dec_upper: float, ra_lower: float, ra_upper: float,
+                          radius_rad: float) -> np.ndarray:
+        """
+        Conservative cell lookup: returns every cell that may contain a point within radius_rad of any point of the
+        given declination / right ascension rectangle. A cone query is a rectangle of zero extent.
+        """
+        reach_lower, reach_upper = dec_lower - radius_rad, dec_upper + radius_rad
+        first_band = max(0, int((reach_lower + self.half_pi) // self.band_height))
+        last_band = min(self.band_count - 1, int((reach_upper + self.half_pi) // self.band_height))
+        max_abs_dec = max(abs(dec_lower), abs(dec_upper))
+        if max_abs_dec + radius_rad >= self.half_pi:
+            # a pole lies within reach, every right ascension has to be covered
+            ra_reach = pi
+        else:
+            ra_reach = asin(min(1.0, sin(radius_rad) / cos(max_abs_dec)))
+        cells = []
+        for band in range(first_band, last_band + 1):
+            cells_in_band = int(self.cells_per_band[band])
+            band_offset = int(self.band_offsets[band])
+            if ra_upper - ra_lower + 2 * ra_reach >= self.full_circle:
+                cells.append(np.arange(band_offset, band_offset + cells_in_band))
+                continue
+            cell_width = self.full_circle / cells_in_band
+            first_cell = floor((ra_lower - ra_reach) / cell_width)
+            last_cell = ceil((ra_upper + ra_reach) / cell_width) - 1
+            ra_cells = np.unique(np.arange(first_cell, last_cell + 1) % cells_in_band)
+            cells.append(band_offset + ra_cells)
+        return np.concatenate(cells)
+
+    def cells_near_cone(self, direction: np.ndarray, radius_rad: float) -> np.ndarray:
+        right_ascensions, declinations = self.to_celestial_radians(direction.reshape(1, 3))
+        ra, dec = float(right_ascensions[0]), float(declinations[0])
+        return self.cells_near_region(dec, dec, ra, ra, radius_rad)
+
+    def star_ids_within_cone(self, direction: np.ndarray, radius_rad: float) -> np.ndarray:
+        """
+        :param direction: unit vector of the cone axis
+        :return: ascending row indices of all indexed vectors within radius_rad of direction
+        """
+        near_ids = np.concatenate([self.star_ids_in_cell(cell) for cell in self.cells_near_cone(direction, radius_rad)])
+        within = self.positions[near_ids] @ direction >= cos(radius_rad)
+        return np.sort(near_ids[within])
+
+    def star_ids_within_cones(self, directions: np.ndarray, radius_rad: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Batched cone search. Queries are grouped by the cell of their direction, all queries of a cell are compared
+        against the vectors of the same nearby cells at once. Fastest with cells about as large as the radius.
+        :param directions: (m x 3) unit vectors of the cone axes
+        :return: offsets and row indices in compressed form, the ascending indices within cone q are
+        star_ids[offsets[q]:offsets[q + 1]]
+        """
+        min_cosine = cos(radius_rad)
+        query_cells = self.cells_of(directions)
+        query_order = np.argsort(query_cells, kind="stable")
+        cells, cell_starts = np.unique(query_cells[query_order], return_index=True)
+        cell_stops = np.append(cell_starts[1:], len(query_order))
+        query_chunks, star_id_chunks = [], []
+        for cell, start, stop in zip(cells, cell_starts, cell_stops):
+            queries = query_order[start:stop]
+            near_cells = self.cells_near_region(*self.cell_bounds(int(cell)), radius_rad)
+            # sorted, so the ids of every query come out ascending
+            near_ids = np.sort(np.concatenate([self.star_ids_in_cell(near_cell) for near_cell in near_cells]))
+            rows, cols = np.nonzero(directions[queries] @ self.positions[near_ids].T >= min_cosine)
+            query_chunks.append(queries[rows])
+            star_id_chunks.append(near_ids[cols])
+        if len(query_chunks) == 0:
+            return np.zeros(len(directions) + 1, dtype=int), np.zeros(0, dtype=int)
+        query_ids, star_ids = np.concatenate(query_chunks), np.concatenate(star_id_chunks)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(query_ids, minlength=len(directions)))))
+        return offsets, star_ids[np.argsort(query_ids, kind="stable")]
+
+    def pairs_within_angle(self, min_cosine: float, max_cosine: float,
+                           cells: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Enumerates all unordered pairs of indexed vectors with max_cosine <= cosine separation <= min_cosine. Only
+        cells close enough to contain such pairs are compared.
+        :param cells: restricts the enumeration to pairs whose lower index lies in one of these cells, chunks of
+        disjoint cells yield disjoint pair sets
+        :return: first row indices, second row indices (first < second) and cosine separations
+        """
+        radius_rad = np.arccos(np.clip(max_cosine, -1.0, 1.0))
+        first_chunks, second_chunks, cosine_chunks = [], [], []
+        for cell in (range(self.cell_count) if cells is None else cells):
+            cell_ids = self.star_ids_in_cell(cell)
+            if len(cell_ids) == 0:
+                continue
+            near_cells = self.cells_near_region(*self.cell_bounds(cell), radius_rad)
+            near_ids = np.concatenate([self.star_ids_in_cell(near_cell) for near_cell in near_cells])
+            cosines = self.positions[cell_ids] @ self.positions[near_ids].T
+            # every pair is reported once, from the cell of its lower index
+            viable = (cosines <= min_cosine) & (cosines >= max_cosine) & (cell_ids[:, None] < near_ids[None, :])
+            rows, cols = np.nonzero(viable)
+            first_chunks.append(cell_ids[rows])
+            second_chunks.append(near_ids[cols])
+            cosine_chunks.append(cosines[rows, cols])
+        if len(first_chunks) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+        return np.concatenate(first_chunks), np.concatenate(second_chunks), np.concatenate(cosine_chunks)
@@ -1,9 +1,12 @@
+import functools
+import itertools
 import math
-import random
+from collections.abc import Iterator
 
 import numpy as np
 import cv2
 from common import Params, Code
+from debug_renderer import debug_renderer, DebugRenderer
 from se_automation import WindowController, VirtualCamera
 
 
@@ -20,14 +23,6 @@ class ObservedStar:
     def within_circular_field_of_view(self) -> bool:
         return self.center_distance <= Params.norm_radius
 
-    @staticmethod
-    def star_viable(observed_star: any) -> bool:
-        return observed_star.within_circular_field_of_view
-
-    @staticmethod
-    def sort_by_pixel_count(observed_star: any) -> int:
-        return observed_star.pixel_count
-
     def __str__(self):
         return f"ObservedStar({self.pixel_count}, {self.position})"
 
@@ -45,13 +40,281 @@ class ObservedStarPair:
 
 class ObservedQuadruple:
     """
-    Wrapper class which contains observed stars and their corresponding observed pairs.
+    Wrapper class which contains observed stars and their corresponding observed pairs. Quadruples of an
+    ObservedFrame also keep the frame and the indices of their four stars in it.
     """
-    def __init__(self, observed_stars_dict: dict[int, ObservedStar], observed_pairings_dict: dict[int, ObservedStarPair]):
+    def __init__(self, observed_stars_dict: dict[int, ObservedStar], observed_pairings_dict: dict[int, ObservedStarPair],
+                 frame: "ObservedFrame | None" = None, star_indices: tuple[int, int, int, int] | None = None):
         assert len(observed_stars_dict) == 4
         assert len(observed_pairings_dict) == 6
         self.observed_stars_dict = observed_stars_dict
         self.observed_pairings_dict = observed_pairings_dict
+        self.frame = frame
+        self.star_indices = star_indices
+
+    @classmethod
+    def from_frame(cls, frame: "ObservedFrame", star_indices: tuple[int, int, int, int]):
+        """
+        :param star_indices: frame indices of the stars with matching candidate ids 0 to 3
+        """
+        observed_stars_dict = {identifier: frame.observed_star(star_indices[identifier])
+                               for identifier in StarImager.matching_candidate_ids}
+        observed_pairings_dict = {identifier: ObservedStarPair(cosine_separation)
+                                  for identifier, cosine_separation in enumerate(frame.pair_cosines(star_indices))}
+        return cls(observed_stars_dict, observed_pairings_dict, frame, star_indices)
+
+
+class DetectedStars:
+    """
+    Stars detected in one frame as parallel arrays: sub-pixel positions (n x 2, x and y), brightness as the summed
+    intensity above the detection threshold and the pixel count of every star.
+    """
+    def __init__(self, positions: np.ndarray, brightness: np.ndarray, pixel_counts: np.ndarray):
+        assert len(positions) == len(brightness) == len(pixel_counts)
+        self.positions = positions
+        self.brightness = brightness
+        self.pixel_counts = pixel_counts
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def select(self, selection: np.ndarray):
+        """
+        :param selection: boolean mask or indices of the stars to keep
+        """
+        return DetectedStars(self.positions[selection], self.brightness[selection], self.pixel_counts[selection])
+
+    def keypoints(self) -> list[cv2.KeyPoint]:
+        # pixel count as size, like the keypoints drawn before sub-pixel centroiding
+        return [cv2.KeyPoint(float(x), float(y), float(pixel_count))
+                for (x, y), pixel_count in zip(self.positions, self.pixel_counts)]
+
+
+class ObservedFrame:
+    """
+    Struct of arrays over the stars of one frame: (n x 2) pixel positions and pixel counts, plus the circular field
+    of view mask and cosine separations. There is no separate brightness column, the pixel count is the brightness
+    measure stars are ranked by, as ObservedStar always ranked them. The summed intensity of DetectedStars is not
+    carried over. Cosines are only computed among the brightest stars, one star more whenever the quadruples reach a
+    fainter one, so frames with thousands of detections stay cheap. Quadruples refer to the stars by index,
+    ObservedStar objects are only created for stars of quadruples that are actually built.
+    """
+    def __init__(self, positions: np.ndarray, pixel_counts: np.ndarray, field_of_view_deg: float):
+        assert len(positions) == len(pixel_counts)
+        self.positions = positions
+        self.pixel_counts = pixel_counts
+        self.field_of_view_deg = field_of_view_deg
+        # stars by descending pixel count and the rank of every star
+        self._ranked: np.ndarray | None = None
+        self._rank_of: np.ndarray | None = None
+        # cosine separations among the first _ranked_cosine_count ranked stars, the buffer grows by doubling
+        self._ranked_cosines = np.empty((0, 0))
+        self._ranked_cosine_count = 0
+        # one adapter object per star, so quadruples sharing a star share the object
+        self._observed_stars: dict[int, ObservedStar] = {}
+
+    @classmethod
+    def from_detected_stars(cls, detected_stars: DetectedStars, field_of_view_deg: float):
+        return cls(detected_stars.positions, detected_stars.pixel_counts, field_of_view_deg)
+
+    @classmethod
+    def from_observed_stars(cls, observed_stars: list[ObservedStar], field_of_view_deg: float):
+        frame = cls(np.array([star.position for star in observed_stars], dtype=np.float64).reshape(-1, 2),
+                    np.array([star.pixel_count for star in observed_stars], dtype=np.int64), field_of_view_deg)
+        frame._observed_stars = dict(enumerate(observed_stars))
+        return frame
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def in_field_of_view(self) -> np.ndarray:
+        return np.hypot(*(self.positions - np.array(Params.center_point)).T) <= Params.norm_radius
+
+    def within_field_of_view(self):
+        """
+        :return: new frame of the stars within the circular field of view
+        """
+        in_field_of_view = self.in_field_of_view
+        return ObservedFrame(self.positions[in_field_of_view], self.pixel_counts[in_field_of_view],
+                             self.field_of_view_deg)
+
+    def _rank_stars(self):
+        if self._ranked is None:
+            # stable, stars of equal pixel count keep their detection order
+            self._ranked = np.argsort(-self.pixel_counts, kind="stable")
+            self._rank_of = np.empty(len(self), dtype=np.int64)
+            self._rank_of[self._ranked] = np.arange(len(self))
+
+    @property
+    def ranked(self) -> np.ndarray:
+        """
+        Star indices by descending brightness, i.e. pixel count.
+        """
+        self._rank_stars()
+        return self._ranked
+
+    def ranked_cosines(self, count: int) -> np.ndarray:
+        """
+        Cosine separations among the count brightest stars in rank order, computed like
+        ObservedStarPair.from_observed_stars. Rows of stars not reached before are added to the cached ones.
+        :return: (count x count) view into the cache
+        """
+        assert count <= len(self)
+        if count <= self._ranked_cosine_count:
+            return self._ranked_cosines[:count, :count]
+        ranked_positions = self.positions[self.ranked[:count]]
+        if count > len(self._ranked_cosines):
+            grown = np.empty((min(len(self), max(count, 2 * len(self._ranked_cosines))),) * 2)
+            known = self._ranked_cosine_count
+            grown[:known, :known] = self._ranked_cosines[:known, :known]
+            self._ranked_cosines = grown
+        for rank in range(self._ranked_cosine_count, count):
+            pixel_separations = np.linalg.norm(ranked_positions[:rank + 1] - ranked_positions[rank], axis=1)
+            row = np.cos(pixel_separations / Params.width_height[0] * Code.deg_to_rad(self.field_of_view_deg))
+            self._ranked_cosines[rank, :rank + 1] = row
+            self._ranked_cosines[:rank + 1, rank] = row
+        self._ranked_cosine_count = count
+        return self._ranked_cosines[:count, :count]
+
+    def pair_cosines(self, star_indices: tuple[int, int, int, int]) -> list[float]:
+        """
+        :return: cosine separations of the six pairs of a quadruple in the order of StarImager.pair_by_ids
+        """
+        self._rank_stars()
+        ranks = [self._rank_of.item(index) for index in star_indices]
+        if max(ranks) >= self._ranked_cosine_count:
+            self.ranked_cosines(max(ranks) + 1)
+        return [self._ranked_cosines.item(ranks[first], ranks[second]) for first, second in StarImager.pair_by_ids]
+
+    def observed_star(self, index: int) -> ObservedStar:
+        index = int(index)
+        if index not in self._observed_stars:
+            x, y = self.positions[index]
+            self._observed_stars[index] = ObservedStar(int(self.pixel_counts[index]), (float(x), float(y)))
+        return self._observed_stars[index]
+
+    def quadruple(self, star_indices: tuple[int, int, int, int]) -> ObservedQuadruple:
+        return ObservedQuadruple.from_frame(self, tuple(star_indices))
+
+    def brightness_ordered_quadruples(self) -> Iterator[tuple[int, int, int, int]]:
+        """
+        Lazily yields the star indices of every quadruple exactly once in a deterministic order. Stars are ranked by
+        pixel count and quadruples come in the order of the rank of their faintest star, so the four largest stars
+        are first. Quadruples sharing their faintest star are ordered by their smallest separation, widely spread
+        ones first, because close stars have the largest relative separation error.
+        """
+        assert len(self) >= 4
+        ranked = self.ranked
+        for faintest in range(3, len(self)):
+            ranked_cosine_matrix = self.ranked_cosines(faintest + 1)
+            brighter = np.array(list(itertools.combinations(range(faintest), 3)))
+            quadruples = np.column_stack((brighter, np.full(len(brighter), faintest)))
+            # the smallest separation has the largest cosine
+            largest_cosines = np.max([ranked_cosine_matrix[quadruples[:, first], quadruples[:, second]]
+                                      for first, second in StarImager.pair_by_ids], axis=0)
+            for quadruple in ranked[quadruples[np.argsort(largest_cosines, kind="stable")]].tolist():
+                yield tuple(quadruple)
+
+
+class BackgroundEstimate:
+    """
+    Background level and noise of a gray frame. Median and scaled median absolute deviation are determined for all
+    square tiles at once from one intensity histogram per tile and interpolated bilinearly to full resolution, so
+    stars barely shift the estimate. Pixels outside the circular field of view can be left out of the histograms.
+    """
+    # scales the median absolute deviation of normally distributed noise to its standard deviation
+    mad_to_sigma = 1.4826
+    intensity_levels = 256
+    # tiles with fewer valid pixels take the estimate of the nearest tile with enough of them
+    min_valid_tile_fraction = 0.25
+
+    def __init__(self, tile_backgrounds: np.ndarray, tile_noises: np.ndarray, shape: tuple[int, int]):
+        self.tile_backgrounds = tile_backgrounds
+        self.tile_noises = tile_noises
+        height, width = shape
+        self.background = cv2.resize(tile_backgrounds, (width, height), interpolation=cv2.INTER_LINEAR)
+        self.noise = cv2.resize(tile_noises, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    @staticmethod
+    @functools.cache
+    def _tile_bin_offsets(height: int, width: int, tile_size: int, within_field_of_view: bool) -> np.ndarray:
+        """
+        Histogram bin offset of every pixel of a padded frame, the tile index times the intensity levels. Pixels
+        outside the circular field of view get the offset of one extra tile past the last, which is dropped.
+        """
+        levels = BackgroundEstimate.intensity_levels
+        rows, cols = -(-height // tile_size), -(-width // tile_size)
+        tile_indices = ((np.arange(rows * tile_size) // tile_size)[:, None] * cols +
+                        (np.arange(cols * tile_size) // tile_size)[None, :])
+        if within_field_of_view:
+            assert (width, height) == Params.width_height
+            padding = (0, rows * tile_size - height), (0, cols * tile_size - width)
+            valid_mask = np.pad(Code.circular_field_of_view_mask(), padding, mode="symmetric") > 0
+            tile_indices = np.where(valid_mask, tile_indices, rows * cols)
+        offsets = (tile_indices * levels).astype(np.int32)
+        offsets.flags.writeable = False
+        return offsets
+
+    @classmethod
+    def from_gray_image(cls, gray_image: np.ndarray, tile_size: int | None = None,
+                        within_field_of_view: bool = False):
+        """
+        :param within_field_of_view: estimate from the pixels within the circular field of view only
+        """
+        assert gray_image.dtype == np.uint8
+        tile_size = StarImager.background_tile_size if tile_size is None else tile_size
+        levels = cls.intensity_levels
+        height, width = gray_image.shape
+        rows, cols = -(-height // tile_size), -(-width // tile_size)
+        # incomplete tiles at the bottom and right border are filled by mirroring
+        padded = np.pad(gray_image, ((0, rows * tile_size - height), (0, cols * tile_size - width)), mode="symmetric")
+        bins = cls._tile_bin_offsets(height, width, tile_size, within_field_of_view) + padded
+        histograms = np.bincount(bins.ravel(), minlength=(rows * cols + 1) * levels)[:rows * cols * levels].reshape(
+            rows * cols, levels)
+        # counts_below[:, k] is the number of tile pixels with an intensity below k
+        counts_below = np.concatenate((np.zeros((rows * cols, 1), dtype=np.int64), np.cumsum(histograms, axis=1)),
+                                      axis=1)
+        valid_counts = counts_below[:, -1]
+        half = valid_counts[:, None] / 2
+        medians = np.argmax(counts_below[:, 1:] >= half, axis=1)
+        # number of pixels within every absolute deviation from the median, the first reaching half is the MAD
+        deviations = np.arange(levels)
+        upper = np.minimum(medians[:, None] + deviations + 1, levels)
+        lower = np.maximum(medians[:, None] - deviations, 0)
+        within = np.take_along_axis(counts_below, upper, axis=1) - np.take_along_axis(counts_below, lower, axis=1)
+        deviations_of_median = np.argmax(within >= half, axis=1)
+        tile_backgrounds = medians.astype(np.float32)
+        tile_noises = (cls.mad_to_sigma * deviations_of_median).astype(np.float32)
+        sparse = valid_counts < cls.min_valid_tile_fraction * tile_size * tile_size
+        if sparse.any() and not sparse.all():
+            # keeps the interpolation from pulling the estimate towards the masked out pixels near the mask border.
+            # The nearest tile with enough pixels continues a gradient, like a planet's glow, up to the border.
+            tile_rows, tile_cols = np.divmod(np.arange(rows * cols), cols)
+            sparse_tiles, full_tiles = np.flatnonzero(sparse), np.flatnonzero(~sparse)
+            squared_distances = ((tile_rows[sparse_tiles, None] - tile_rows[None, full_tiles]) ** 2 +
+                                 (tile_cols[sparse_tiles, None] - tile_cols[None, full_tiles]) ** 2)
+            nearest_full_tiles = full_tiles[np.argmin(squared_distances, axis=1)]
+            tile_backgrounds[sparse_tiles] = tile_backgrounds[nearest_full_tiles]
+            tile_noises[sparse_tiles] = tile_noises[nearest_full_tiles]
+        return cls(tile_backgrounds.reshape(rows, cols), tile_noises.reshape(rows, cols), gray_image.shape)
+
+
+class DetectionStatistics:
+    """
+    Per frame numbers to monitor the detection thresholds with.
+    """
+    def __init__(self, background_estimate: BackgroundEstimate, star_count: int, extended_count: int):
+        self.background_median = float(np.median(background_estimate.tile_backgrounds))
+        self.background_max = float(np.max(background_estimate.tile_backgrounds))
+        self.noise_median = float(np.median(background_estimate.tile_noises))
+        self.star_count = star_count
+        self.extended_count = extended_count
+
+    def __str__(self):
+        return (f"Detection: background median {self.background_median:.1f} max {self.background_max:.1f}, "
+                f"noise median {self.noise_median:.2f}, {self.star_count} stars, "
+                f"{self.extended_count} extended components rejected.")
 
 
 class StarImager:
@@ -80,168 +343,148 @@ class StarImager:
         3: [2, 4, 5]
     }
 
+    # local thresholds lie detection_sigma noise levels, but at least min_detection_contrast, above the background
+    background_tile_size = 50
+    detection_sigma = 5.0
+    min_detection_contrast = 16
+    # components with a larger core, their pixels of at least half the peak contrast, are extended objects like
+    # nebulae, planets or the milky way, no stars. The core of a star keeps its size at any detection threshold.
+    max_star_pixel_count = 20
+    max_star_extent_px = 7
+
     def __init__(self, field_of_view_deg: float, save_debug_images: bool = False):
         self.field_of_view_deg = field_of_view_deg
         self.save_debug_images = save_debug_images
+        # statistics of the last frame stars were detected in
+        self.detection_statistics: DetectionStatistics | None = None
 
     @staticmethod
     def raw_to_gray(raw_image: np.ndarray) -> np.ndarray:
-        return cv2.cvtColor(raw_image, cv2.COLOR_BGR2GRAY)
+        return Code.to_gray(raw_image)
+
+    @staticmethod
+    def background_estimate_of(gray_image: np.ndarray) -> BackgroundEstimate:
+        # only pixels within the circular field of view, frames from the gray frame cache may be masked already
+        return BackgroundEstimate.from_gray_image(gray_image, within_field_of_view=True)
 
     def raw_to_mask(self, raw_image: np.ndarray) -> np.ndarray:
         """
-        :param raw_image: Raw image of the sun in BGR
-        :return: Mask image of relevant 'solar disc' pixels.
+        :param raw_image: Raw night sky image in BGR or an already gray frame
+        :return: Mask image of the star pixels within the circular field of view.
         """
-        assert raw_image.shape == Params.width_height + (3,)
+        assert raw_image.shape[:2] == Params.width_height
         # transform image to grayscale
         gray_image = StarImager.raw_to_gray(raw_image)
         if self.save_debug_images:
-            Code.save_debug_image(Params.debug_gray_img, gray_image)
-        # turn gray image to mask using thresholding
-        _, mask = cv2.threshold(gray_image, 68, 255, cv2.THRESH_BINARY)
-        return mask
+            debug_renderer.submit_frame(Params.debug_gray_img, gray_image)
+        return StarImager.gray_to_mask(gray_image, StarImager.background_estimate_of(gray_image))
 
     @staticmethod
-    def determine_keypoints(mask_image: np.ndarray) -> list[cv2.KeyPoint]:
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(mask_image, connectivity=8)
-
-        keypoints = []
-        for i in range(1, num_labels):  # skip background
-            area = stats[i, cv2.CC_STAT_AREA]
-            if 1 <= area <= 20:
-                cx, cy = centroids[i]
-                # use area as size (or sqrt(area) if you want more realistic scale)
-                keypoints.append(cv2.KeyPoint(float(cx), float(cy), float(area)))
-        return keypoints
+    def gray_to_mask(gray_image: np.ndarray, background_estimate: BackgroundEstimate) -> np.ndarray:
+        # turn gray image to mask using the local thresholds
+        threshold_image = background_estimate.background + np.maximum(
+            StarImager.detection_sigma * background_estimate.noise, StarImager.min_detection_contrast)
+        mask_image = np.where(gray_image > threshold_image, 255, 0).astype(np.uint8)
+        return cv2.bitwise_and(mask_image, Code.circular_field_of_view_mask())
 
     @staticmethod
-    def viable_stars_from_keypoints(keypoints: list[cv2.KeyPoint]) -> list[ObservedStar]:
-        all_observed_stars = []
-        for kp in keypoints:
-            all_observed_stars.append(ObservedStar(int(kp.size), tuple(kp.pt)))
-        print(f"Stars detected in frame: {len(all_observed_stars)}.")
-        viable_stars = list(filter(ObservedStar.star_viable, all_observed_stars))
-        print(f"Viable stars in frame: {len(viable_stars)}.")
-        return viable_stars
-
-    def determine_four_stars_and_their_pairings(self, night_sky_image: np.ndarray) -> tuple[dict[int, ObservedStar], dict[int, ObservedStarPair]]:
-        mask_image = self.raw_to_mask(night_sky_image).astype("uint8")
-        keypoints = self.determine_keypoints(mask_image)
+    def determine_centroids(gray_image: np.ndarray, mask_image: np.ndarray,
+                            background_image: np.ndarray) -> tuple[DetectedStars, int]:
+        """
+        Intensity weighted centroids of all connected mask components at once. Every pixel is weighted with its
+        intensity above the local background, the sums per component are accumulated with bincount over the
+        component labels. Components whose core exceeds the star pixel count or extent are rejected. The whole
+        component is no measure, a bright star grows far beyond the limits above a low threshold on a dark sky.
+        :return: detected stars and the number of rejected extended components
+        """
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask_image, connectivity=8)
+        if num_labels == 1:
+            return DetectedStars(np.zeros((0, 2)), np.zeros(0), np.zeros(0, dtype=stats.dtype)), 0
+        # coordinates of all mask pixels, much faster than np.nonzero on a full frame
+        xs, ys = cv2.findNonZero(mask_image).reshape(-1, 2).T
+        pixel_labels = labels[ys, xs]
+        weights = gray_image[ys, xs].astype(np.float64) - background_image[ys, xs]
+        brightness = np.bincount(pixel_labels, weights, minlength=num_labels)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            positions = np.column_stack((np.bincount(pixel_labels, weights * xs, minlength=num_labels),
+                                         np.bincount(pixel_labels, weights * ys, minlength=num_labels))) / \
+                brightness[:, None]
+        pixel_counts = stats[:, cv2.CC_STAT_AREA]
+        peaks = np.zeros(num_labels)
+        np.maximum.at(peaks, pixel_labels, weights)
+        core = weights >= peaks[pixel_labels] / 2
+        core_labels, core_xs, core_ys = pixel_labels[core], xs[core], ys[core]
+        core_pixel_counts = np.bincount(core_labels, minlength=num_labels)
+        core_extents = []
+        for coordinates in (core_xs, core_ys):
+            lowest = np.full(num_labels, np.iinfo(np.int32).max)
+            highest = np.full(num_labels, -1)
+            np.minimum.at(lowest, core_labels, coordinates)
+            np.maximum.at(highest, core_labels, coordinates)
+            core_extents.append(highest - lowest + 1)
+        compact = ((core_pixel_counts <= StarImager.max_star_pixel_count) &
+                   (core_extents[0] <= StarImager.max_star_extent_px) &
+                   (core_extents[1] <= StarImager.max_star_extent_px))
+        # skip the background label
+        compact[0] = False
+        stars = DetectedStars(positions[compact], brightness[compact], pixel_counts[compact])
+        return stars, num_labels - 1 - len(stars)
+
+    def detect_stars(self, night_sky_image: np.ndarray) -> DetectedStars:
+        assert night_sky_image.shape[:2] == Params.width_height
+        gray_image = StarImager.raw_to_gray(night_sky_image)
+        background_estimate = StarImager.background_estimate_of(gray_image)
+        mask_image = StarImager.gray_to_mask(gray_image, background_estimate)
+        detected_stars, extended_count = StarImager.determine_centroids(gray_image, mask_image,
+                                                                        background_estimate.background)
+        self.detection_statistics = DetectionStatistics(background_estimate, len(detected_stars), extended_count)
         if self.save_debug_images:
-            Code.save_debug_image(Params.debug_mask_img, mask_image)
-            self._draw_detected_dots_image(mask_image, keypoints)
+            print(self.detection_statistics)
+            debug_renderer.submit_frame(Params.debug_gray_img, gray_image)
+            self._draw_detected_dots_image(mask_image, detected_stars)
+        return detected_stars
 
-        viable_stars = self.viable_stars_from_keypoints(keypoints)
-        viable_stars.sort(key=ObservedStar.sort_by_pixel_count, reverse=True)
+    def observed_frame(self, night_sky_image: np.ndarray) -> ObservedFrame:
+        """
+        :return: frame of the detected stars within the circular field of view
+        """
+        detected_frame = ObservedFrame.from_detected_stars(self.detect_stars(night_sky_image), self.field_of_view_deg)
+        print(f"Stars detected in frame: {len(detected_frame)}.")
+        viable_frame = detected_frame.within_field_of_view()
+        print(f"Viable stars in frame: {len(viable_frame)}.")
+        return viable_frame
 
-        if self.save_debug_images:
-            blank = np.zeros((1, 1))
-            detected_img = cv2.drawKeypoints(
-                mask_image, keypoints, blank, (0, 0, 255), cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS
-            )
-            Code.save_debug_image(Params.debug_detected_img, detected_img)
-
-        matching_candidate_stars = {}
-        try:
-            for identifier in self.matching_candidate_ids:
-                matching_candidate_stars[identifier] = viable_stars[identifier]
-        except:
+    def determine_four_stars_and_their_pairings(self, night_sky_image: np.ndarray) -> tuple[dict[int, ObservedStar], dict[int, ObservedStarPair]]:
+        frame = self.observed_frame(night_sky_image)
+        if len(frame) < 4:
             print("Not enough stars detected.")
             return None
-
-        candidate_pairings = {}
-        for idx, identifier in enumerate(self.pairing_ids):
-            pair_id1, pair_id2 = self.pair_by_ids[idx]
-            star1, star2 = matching_candidate_stars.get(pair_id1), matching_candidate_stars.get(pair_id2)
-            candidate_pairings[identifier] = ObservedStarPair.from_observed_stars(star1, star2, self.field_of_view_deg)
-
-        return matching_candidate_stars, candidate_pairings
+        quadruple = frame.quadruple(next(frame.brightness_ordered_quadruples()))
+        return quadruple.observed_stars_dict, quadruple.observed_pairings_dict
 
     @staticmethod
-    def _draw_detected_dots_image(mask_image: np.ndarray, keypoints: list[cv2.KeyPoint]):
-        blank = np.zeros((1, 1))
-        detected_img = cv2.drawKeypoints(
-            mask_image, keypoints, blank, (0, 0, 255), cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS
-        )
-        Code.save_debug_image(Params.debug_detected_img, detected_img)
-
+    def _draw_detected_dots_image(mask_image: np.ndarray, detected_stars: DetectedStars):
+        if not debug_renderer.enabled:
+            return
+        debug_renderer.submit_frame(Params.debug_mask_img, mask_image)
+        debug_renderer.submit_drawing(Params.debug_detected_img, Params.debug_mask_img,
+                                      [DebugRenderer.keypoints(detected_stars.keypoints(), (0, 0, 255))])
 
 
-    @staticmethod
-    def _determine_viable_quadruple_stars(viable_stars: list[ObservedStar], max_quadruples: int) -> list[dict[int, ObservedStar]]:
-        assert len(viable_stars) >= 4
-        viable_quadruple_star_sets: list[set[ObservedStar]] = []
-        viable_quadruples_length = min(max_quadruples, math.comb(len(viable_stars), 4))
-        additional_star_combinations = viable_quadruples_length - 1
-
-        # at first sort list and take the first four stars due to best likelihood of match
-        viable_stars.sort(key=ObservedStar.sort_by_pixel_count, reverse=True)
-        first_set = set()
-        for idx in range(0, 3+1):
-            first_set.add(viable_stars[idx])
-        viable_quadruple_star_sets.append(first_set)
-
-        # then add additional randomized star combination sets
-        for additional in range(0, additional_star_combinations):
-            next_set_already_in_viable_quads = True
-            while next_set_already_in_viable_quads:
-                next_set = set(random.sample(viable_stars, 4))
-                if next_set not in viable_quadruple_star_sets:
-                    viable_quadruple_star_sets.append(next_set)
-                    next_set_already_in_viable_quads = False
-
-        # turn quadruple star sets into dictionaries
-        viable_quadruple_star_dicts = []
-        for star_set in viable_quadruple_star_sets:
-            set_as_list = list(star_set)
-            quadruple_dict = {}
-            for identifier in StarImager.matching_candidate_ids:
-                quadruple_dict[identifier] = set_as_list[identifier]
-            viable_quadruple_star_dicts.append(quadruple_dict)
-
-        return viable_quadruple_star_dicts
 
-    @staticmethod
-    def _determine_corresponding_pairings(quadruple_star_dicts: list[dict[int, ObservedStar]], field_of_view_deg: float) -> list[dict[int, ObservedStarPair]]:
-        corresponding_pairings = []
-        for quadruple_dict in quadruple_star_dicts:
-            pairing_dict = {}
-            for identifier in StarImager.pairing_ids:
-                pair_id1, pair_id2 = StarImager.pair_by_ids[identifier]
-                star1, star2 = quadruple_dict.get(pair_id1), quadruple_dict.get(pair_id2)
-                pairing_dict[identifier] = ObservedStarPair.from_observed_stars(star1, star2, field_of_view_deg)
-            corresponding_pairings.append(pairing_dict)
-        return corresponding_pairings
-
-    def determine_viable_quadruples(self, night_sky_image: np.ndarray, max_quadruples: int = 20) -> list[ObservedQuadruple] | None:
-        mask_image = self.raw_to_mask(night_sky_image).astype("uint8")
-        keypoints = self.determine_keypoints(mask_image)
-        if self.save_debug_images:
-            Code.save_debug_image(Params.debug_mask_img, mask_image)
-            self._draw_detected_dots_image(mask_image, keypoints)
-
-        viable_stars = self.viable_stars_from_keypoints(keypoints)
-        if len(viable_stars) < 4:
-            print(f"Not enough viable stars ({len(viable_stars)}) detected. Minimum number must be 4.")
+    def determine_viable_quadruples(self, night_sky_image: np.ndarray,
+                                    max_quadruples: int = 20) -> Iterator[ObservedQuadruple] | None:
+        """
+        :return: lazily built quadruples in the order of ObservedFrame.brightness_ordered_quadruples, None if fewer
+        than four viable stars are detected
+        """
+        frame = self.observed_frame(night_sky_image)
+        if len(frame) < 4:
+            print(f"Not enough viable stars ({len(frame)}) detected. Minimum number must be 4.")
             return None
 
-        viable_quadruple_stars = self._determine_viable_quadruple_stars(viable_stars, max_quadruples)
-        corresponding_pairings = self._determine_corresponding_pairings(viable_quadruple_stars, self.field_of_view_deg)
-        assert len(viable_quadruple_stars) == len(corresponding_pairings)
-
-        viable_quadruple_objects = []
-        for idx, quadruple_dict in enumerate(viable_quadruple_stars):
-            viable_quadruple_objects.append(
-                ObservedQuadruple(quadruple_dict, corresponding_pairings[idx])
-            )
-        return viable_quadruple_objects
-
-
-
-
-
-
+        star_indices = itertools.islice(frame.brightness_ordered_quadruples(), max_quadruples)
+        return (frame.quadruple(quadruple_indices) for quadruple_indices in star_indices)
 
 
 if __name__ == "__main__":
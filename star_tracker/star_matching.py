@@ -1,26 +1,92 @@
+import itertools
 import math
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-import cv2
 import numpy as np
 
 from common import Code, Params
+from debug_renderer import debug_renderer, DebugRenderer
 from se_automation import WindowController, VirtualCamera
+from star_tracker.pair_database import StarPairDatabase
 from star_tracker.star_pairing import CatalogStarPair
-from star_tracker.pairings import pairings
 from star_tracker.star_imager import ObservedStarPair, StarImager, ObservedStar, ObservedQuadruple
-from star_tracker.catalog_dict import catalog_dict
-from star_tracker.neighbors import neighbors
+from star_tracker.artifact_cache import ArtifactCache, StarTrackerArtifacts
+
+
+class MatchHypothesis:
+    """
+    Catalog ids for the four observed stars together with the sum of absolute angular differences between the six
+    observed and catalog separations.
+    """
+    def __init__(self, matching_quadruple: dict[int, int], residual_deg: float):
+        self.matching_quadruple = matching_quadruple
+        self.residual_deg = residual_deg
+
+    def __str__(self):
+        return f"MatchHypothesis({self.matching_quadruple}, {self.residual_deg:.4f})"
+
+
+class QuadrupleMatchResult:
+    """
+    Outcome of matching one observed quadruple: either the matched catalog ids or the reason why matching failed.
+    Scored results also carry the best hypotheses, lowest residual first, and the confidence in the best one.
+    """
+    def __init__(self, matching_quadruple: dict[int, int] | None = None, failure_reason: str | None = None,
+                 quadruple_index: int | None = None, hypotheses: list[MatchHypothesis] | None = None,
+                 confidence: float | None = None):
+        assert (matching_quadruple is None) != (failure_reason is None)
+        self.matching_quadruple = matching_quadruple
+        self.failure_reason = failure_reason
+        self.quadruple_index = quadruple_index
+        self.hypotheses = hypotheses if hypotheses is not None else []
+        self.confidence = confidence
+
+    @property
+    def matched(self) -> bool:
+        return self.matching_quadruple is not None
+
+    def __str__(self):
+        outcome = self.matching_quadruple if self.matched else self.failure_reason
+        return f"QuadrupleMatchResult({self.quadruple_index}, {outcome})"
 
 
 class StarMatcher:
+    # whether the engine looks up candidate pairs of observed pairs, which FrameCandidateRanges can batch
+    queries_candidate_pairs = True
 
-    def __init__(self, observed_quadruple: ObservedQuadruple):
+    def __init__(self, observed_quadruple: ObservedQuadruple, lookup: str = "binary_search",
+                 artifacts: StarTrackerArtifacts | None = None, save_debug_images: bool = True,
+                 candidate_ranges: dict[int, tuple[int, int]] | None = None, top_k: int = 3,
+                 min_confidence: float | None = None):
+        """
+        :param observed_quadruple: observed stars and pairs to match
+        :param lookup: candidate pair lookup in the pair database, "binary_search" or "k_vector"
+        :param artifacts: catalog, pair database and neighbor graph to match against, the cached default artifacts
+        if None
+        :param save_debug_images: draw candidate and matched stars into the debug capture, if the debug renderer is
+        enabled
+        :param candidate_ranges: pair database slice of every observed pairing id if already looked up for the whole
+        frame, see FrameCandidateRanges
+        :param top_k: number of best hypotheses kept in the match result
+        :param min_confidence: a best hypothesis is accepted at this confidence even if no observed star is
+        unambiguous. None, the default, accepts unambiguous matches only, like before confidences existed. Callers opt
+        in with a threshold, see match_confidence_benchmark
+        """
+        assert lookup in StarPairDatabase.lookups
+        self.lookup = lookup
+        self.artifacts = artifacts if artifacts is not None else ArtifactCache.default_artifacts()
+        self.save_debug_images = save_debug_images
+        self.candidate_ranges = candidate_ranges
+        self.top_k = top_k
+        self.min_confidence = min_confidence
         self.observed_stars = observed_quadruple.observed_stars_dict
         self.observed_pairings = observed_quadruple.observed_pairings_dict
         assert len(self.observed_stars) == 4
         assert len(self.observed_pairings) == 6
         # immediately draw candidate quadruple after creating instance of this
-        self.draw_candidate_quadruple_into_capture()
+        if self.save_debug_images:
+            self.draw_candidate_quadruple_into_capture()
 
 
     @staticmethod
@@ -56,184 +122,518 @@ class StarMatcher:
         return min_angular_separation <= supposed_angular_separation <= max_angular_separation
 
     def determine_candidate_pair_array(self, observed_star_pair: ObservedStarPair) -> list[CatalogStarPair]:
-        candidate_catalog_pairs = list(filter(lambda pair: self.cosine_separation_in_bounds(observed_star_pair.cosine_separation, pair.cosine_separation), pairings))
+        first_ids, second_ids, cosine_separations = self.artifacts.pair_database.query(
+            observed_star_pair.cosine_separation, lookup=self.lookup)
+        candidate_catalog_pairs = [CatalogStarPair(int(first_id), int(second_id), float(cosine_separation))
+                                   for first_id, second_id, cosine_separation in
+                                   zip(first_ids, second_ids, cosine_separations)]
         return candidate_catalog_pairs
 
+    def candidate_pairs(self, observed_pair_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: first and second ids of the candidate catalog pairs of an observed pair, as views into the database
+        """
+        pair_database = self.artifacts.pair_database
+        if self.candidate_ranges is not None:
+            start, stop = self.candidate_ranges[observed_pair_id]
+            return pair_database.first_ids[start:stop], pair_database.second_ids[start:stop]
+        first_ids, second_ids, _ = pair_database.query(self.observed_pairings.get(observed_pair_id).cosine_separation,
+                                                       lookup=self.lookup)
+        return first_ids, second_ids
+
     def matcher_matrix(self) -> np.ndarray:
-        candidate_pair_array_dict = {}
-        for identifier in self.observed_pairings.keys():
-            observed_star_pair = self.observed_pairings.get(identifier)
-            candidate_pair_array = self.determine_candidate_pair_array(observed_star_pair)
-            candidate_pair_array_dict[identifier] = candidate_pair_array
-
-        match_matrix = np.zeros((len(catalog_dict), 6))
-
-        for star_id in catalog_dict.keys():
-            for observed_pair_id in self.observed_pairings.keys():
-                candidate_pair_array = candidate_pair_array_dict.get(observed_pair_id)
-
-                star_id_in_candidate_pairs = False
-                for candidate_pair in candidate_pair_array:
-                    contains_star_id = candidate_pair.star_id_contained(star_id)
-                    if contains_star_id:
-                        star_id_in_candidate_pairs = True
-                        break
-                if star_id_in_candidate_pairs:
-                    match_matrix[star_id][observed_pair_id] = 1
+        """
+        :return: boolean (catalog stars x 6) matrix, True where a catalog star is part of a candidate pair of the
+        observed pair in that column
+        """
+        match_matrix = np.zeros((len(self.artifacts.catalog_dict), 6), dtype=bool)
+        for observed_pair_id in self.observed_pairings.keys():
+            first_ids, second_ids = self.candidate_pairs(observed_pair_id)
+            match_matrix[first_ids, observed_pair_id] = True
+            match_matrix[second_ids, observed_pair_id] = True
         return match_matrix
 
-    def _candidate_has_valid_neighbors(self, candidate_star_id: int, observed_star_id: int, match_sets: list[set[int]]) -> bool:
-        assert len(match_sets) == 4
-        assert candidate_star_id in match_sets[observed_star_id]
-        assert 0 <= observed_star_id <= 3
+    @staticmethod
+    def star_candidate_mask(matcher_matrix: np.ndarray, observed_star_id: int) -> np.ndarray:
+        """
+        Column-wise equivalent of the row tests first_star_candidate ... fourth_star_candidate.
+        :return: boolean mask over catalog stars, True where a star is part of candidate pairs of all three observed
+        pairs the observed star belongs to
+        """
+        pairing_ids = StarImager.pairing_ids_of_a_star.get(observed_star_id)
+        return matcher_matrix[:, pairing_ids].all(axis=1)
 
-        other_sets = Code.list_exclude_element(match_sets, observed_star_id)
-        other_observed_star_ids = Code.list_exclude_element(StarImager.matching_candidate_ids, observed_star_id)
-        candidate_star = catalog_dict.get(candidate_star_id)
-        neighbor_set = neighbors.get(candidate_star_id)
-        has_neighbor_in_bounds_in_other_sets = [False for other_set in other_sets]
-        for other_set_idx, other_set in enumerate(other_sets):
-            other_observed_star_id = other_observed_star_ids[other_set_idx]
-            common_star_ids = neighbor_set.intersection(other_set)
-            if len(common_star_ids) < 1:
-                return False
-            has_neighbor_in_bounds = False
-            measured_cosine_separation = self.observed_pairings.get(StarImager.pairing_id_by_pair.get((observed_star_id, other_observed_star_id))).cosine_separation
-            for common_star_id in common_star_ids:
-                common_star = catalog_dict.get(common_star_id)
-                supposed_cosine_separation = common_star.position.dot_product(candidate_star.position)
-                if StarMatcher.cosine_separation_in_bounds(measured_cosine_separation, supposed_cosine_separation):
-                    has_neighbor_in_bounds = True
-            has_neighbor_in_bounds_in_other_sets[other_set_idx] = has_neighbor_in_bounds
-        return all(has_neighbor_in_bounds_in_other_sets)
+    def _valid_candidate_ids(self, observed_star_id: int, match_masks: np.ndarray) -> np.ndarray:
+        """
+        :param match_masks: boolean (4 x catalog stars) matrix of candidates per observed star
+        :return: ids of the candidates of observed_star_id which have a neighbor within the measured separation
+        tolerance among the candidates of every other observed star
+        """
+        assert 0 <= observed_star_id <= 3
+        candidate_ids = np.flatnonzero(match_masks[observed_star_id])
+        valid = np.ones(len(candidate_ids), dtype=bool)
+        for other_observed_star_id in StarImager.matching_candidate_ids:
+            if other_observed_star_id == observed_star_id or not valid.any():
+                continue
+            pairing_id = StarImager.pairing_id_by_pair.get((observed_star_id, other_observed_star_id))
+            measured_cosine_separation = self.observed_pairings.get(pairing_id).cosine_separation
+            lowest_cosine, highest_cosine = StarPairDatabase.cosine_interval(measured_cosine_separation)
+            valid[valid] = self.artifacts.neighbor_graph.have_neighbor_within(
+                candidate_ids[valid], match_masks[other_observed_star_id], lowest_cosine, highest_cosine)
+        return candidate_ids[valid]
+
+    def _clear_match_masks(self, match_masks: np.ndarray) -> np.ndarray:
+        """
+        One pruning round, every observed star is checked against the candidates of the previous round.
+        """
+        cleared_match_masks = np.zeros_like(match_masks)
+        for observed_star_id in StarImager.matching_candidate_ids:
+            cleared_match_masks[observed_star_id, self._valid_candidate_ids(observed_star_id, match_masks)] = True
+        return cleared_match_masks
 
-    @staticmethod
-    def _count_match_sets_members(match_sets: list[set[int]]) -> int:
-        return sum([len(ms) for ms in match_sets])
-
-    def _clear_match_sets(self, match_sets: list[set[int]]) -> list[set[int]]:
-        cleared_match_sets = []
-        for set_idx, match_set in enumerate(match_sets):
-            stars_to_eliminate_from_match_set = set()
-            for star_id in match_set:
-                has_valid_neighborhood = self._candidate_has_valid_neighbors(star_id, set_idx, match_sets)
-                if not has_valid_neighborhood:
-                    stars_to_eliminate_from_match_set.add(star_id)
-            cleared_match_set = match_set.difference(stars_to_eliminate_from_match_set)
-            cleared_match_sets.append(cleared_match_set)
-        return cleared_match_sets
+    def observed_cosine_interval(self, first_observed_id: int, second_observed_id: int) -> tuple[float, float]:
+        pairing_id = StarImager.pairing_id_by_pair.get((first_observed_id, second_observed_id))
+        return StarPairDatabase.cosine_interval(self.observed_pairings.get(pairing_id).cosine_separation)
 
-    def determine_matching_quadruple_from_matrix(self, matcher_matrix: np.ndarray) -> dict[int, int] | None:
-        first_matches: set[int] = set()
-        second_matches: set[int] = set()
-        third_matches: set[int] = set()
-        fourth_matches: set[int] = set()
-        match_sets = [first_matches, second_matches, third_matches, fourth_matches]
-
-        # put all candidate stars into set of corresponding observed star
-        for row_idx, row_entries in enumerate(matcher_matrix):
-            if self.first_star_candidate(row_entries):
-                first_matches.add(row_idx)
-            if self.second_star_candidate(row_entries):
-                second_matches.add(row_idx)
-            if self.third_star_candidate(row_entries):
-                third_matches.add(row_idx)
-            if self.fourth_star_candidate(row_entries):
-                fourth_matches.add(row_idx)
-
-        current_match_sets_size = self._count_match_sets_members(match_sets)
-        new_match_sets_size = math.inf
-        while current_match_sets_size != new_match_sets_size and new_match_sets_size > 0:
-            current_match_sets_size = self._count_match_sets_members(match_sets)
-            match_sets = self._clear_match_sets(match_sets)
-            new_match_sets_size = self._count_match_sets_members(match_sets)
+    def _neighbor_edges_within(self, star_ids: np.ndarray, first_observed_id: int,
+                               second_observed_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: neighbors of star_ids within the tolerance of the observed pair and, per neighbor, the position of its
+        star in star_ids
+        """
+        neighbor_graph = self.artifacts.neighbor_graph
+        lowest_cosine, highest_cosine = self.observed_cosine_interval(first_observed_id, second_observed_id)
+        edge_indices, owners = neighbor_graph.edges_of(star_ids)
+        cosine_separations = neighbor_graph.cosine_separations[edge_indices]
+        within = (cosine_separations >= lowest_cosine) & (cosine_separations <= highest_cosine)
+        return neighbor_graph.neighbor_ids[edge_indices[within]], owners[within]
+
+    def _separations_within(self, first_ids: np.ndarray, second_ids: np.ndarray, first_observed_id: int,
+                            second_observed_id: int) -> np.ndarray:
+        positions = self.artifacts.catalog_store.positions
+        cosine_separations = np.einsum("ij,ij->i", positions[first_ids], positions[second_ids])
+        lowest_cosine, highest_cosine = self.observed_cosine_interval(first_observed_id, second_observed_id)
+        return (cosine_separations >= lowest_cosine) & (cosine_separations <= highest_cosine)
+
+    def hypothesis_residuals_deg(self, hypotheses: np.ndarray) -> np.ndarray:
+        """
+        :param hypotheses: (m x 4) matrix of catalog ids in the order of the observed star ids
+        :return: sum of absolute differences between catalog and observed angular separations of all 6 pairs
+        """
+        positions = self.artifacts.catalog_store.positions
+        residuals = np.zeros(len(hypotheses))
+        for pairing_id, (first, second) in enumerate(StarImager.pair_by_ids):
+            measured_angle = Code.cosine_separation_to_angle_deg(self.observed_pairings.get(pairing_id).cosine_separation)
+            catalog_cosine_separations = np.einsum("ij,ij->i", positions[hypotheses[:, first]],
+                                                   positions[hypotheses[:, second]])
+            residuals += np.abs(np.degrees(np.arccos(np.clip(catalog_cosine_separations, -1.0, 1.0))) - measured_angle)
+        return residuals
+
+    def ranked_result(self, hypotheses: np.ndarray, ambiguity_reason: str) -> QuadrupleMatchResult:
+        """
+        Ranks consistent catalog quadruples by their residual. Confidence in the best hypothesis is 1 minus the ratio
+        of the best to the second best residual. The best hypothesis is accepted if at least one observed star is
+        unambiguous, which rules out misidentification as binaries are unknown, or if the confidence suffices.
+        :param hypotheses: (m x 4) matrix of catalog ids in the order of the observed star ids, m > 0
+        """
+        hypotheses = np.unique(hypotheses, axis=0)
+        residuals = self.hypothesis_residuals_deg(hypotheses)
+        order = np.argsort(residuals, kind="stable")
+        hypotheses, residuals = hypotheses[order], residuals[order]
+        if len(hypotheses) == 1:
+            confidence = 1.0
+        else:
+            confidence = float(1 - residuals[0] / residuals[1]) if residuals[1] > 0 else 0.0
+        ranked_hypotheses = [
+            MatchHypothesis(dict(zip(StarImager.matching_candidate_ids, map(int, hypothesis))), float(residual))
+            for hypothesis, residual in zip(hypotheses[:self.top_k], residuals[:self.top_k])
+        ]
+        unambiguous = any(len(np.unique(hypotheses[:, column])) == 1 for column in range(4))
+        confident = self.min_confidence is not None and confidence >= self.min_confidence
+        if unambiguous or confident:
+            return QuadrupleMatchResult(ranked_hypotheses[0].matching_quadruple, hypotheses=ranked_hypotheses,
+                                        confidence=confidence)
+        return QuadrupleMatchResult(failure_reason=f"{ambiguity_reason}, confidence {confidence:.2f}",
+                                    hypotheses=ranked_hypotheses, confidence=confidence)
+
+    def enumerate_hypotheses(self, match_masks: np.ndarray) -> np.ndarray:
+        """
+        Joins the candidates of the observed stars along neighbor graph edges.
+        :param match_masks: boolean (4 x catalog stars) matrix of candidates per observed star
+        :return: (m x 4) matrix of catalog quadruples whose six separations all lie within the observed tolerances
+        """
+        hypotheses = np.flatnonzero(match_masks[0]).reshape(-1, 1)
+        for observed_star_id in StarImager.matching_candidate_ids[1:]:
+            neighbor_ids, owners = self._neighbor_edges_within(hypotheses[:, 0], 0, observed_star_id)
+            candidates = match_masks[observed_star_id][neighbor_ids]
+            hypotheses = np.column_stack((hypotheses[owners[candidates]], neighbor_ids[candidates]))
+            for previous_star_id in range(1, observed_star_id):
+                consistent = (self._separations_within(hypotheses[:, previous_star_id], hypotheses[:, observed_star_id],
+                                                       previous_star_id, observed_star_id) &
+                              (hypotheses[:, previous_star_id] != hypotheses[:, observed_star_id]))
+                hypotheses = hypotheses[consistent]
+        return hypotheses
+
+    def match_from_matrix(self, matcher_matrix: np.ndarray) -> QuadrupleMatchResult:
+        # candidate stars of every observed star as one boolean mask over catalog stars per row
+        match_masks = np.stack([self.star_candidate_mask(matcher_matrix, observed_star_id)
+                                for observed_star_id in StarImager.matching_candidate_ids])
+
+        current_match_masks_size = int(match_masks.sum())
+        new_match_masks_size = math.inf
+        while current_match_masks_size != new_match_masks_size and new_match_masks_size > 0:
+            current_match_masks_size = int(match_masks.sum())
+            match_masks = self._clear_match_masks(match_masks)
+            new_match_masks_size = int(match_masks.sum())
 
 
         print("\n\n\n")
-        for cleared in match_sets:
-            for identifier in cleared:
-                print(f"{identifier}: {catalog_dict.get(identifier).name}")
+        for cleared in match_masks:
+            for identifier in np.flatnonzero(cleared):
+                print(f"{identifier}: {self.artifacts.catalog_dict.get(identifier).name}")
             print("---")
         print("-----------")
-        matching_quadruple = self._reduce_cleared_match_sets_to_dict(match_sets)
-        if matching_quadruple is None:
-            raise Exception("Could not match stars with given observed quadruple.")
-        self.draw_matched_stars_into_capture(matching_quadruple)
-        return matching_quadruple
+        hypotheses = self.enumerate_hypotheses(match_masks) if new_match_masks_size > 0 else np.zeros((0, 4), int)
+        if len(hypotheses) == 0:
+            return QuadrupleMatchResult(failure_reason="no consistent catalog candidates")
+        return self.ranked_result(hypotheses, "no unambiguous observed star after pruning")
 
-    @staticmethod
-    def _reduce_cleared_match_sets_to_dict(cleared_match_sets: list[set[int]]) -> dict[int, int] | None:
-        assert len(cleared_match_sets) == 4
-        min_elements = 2
-        for match_set in cleared_match_sets:
-            min_elements = min(min_elements, len(match_set))
-        if min_elements != 1:
-            # there must be at least a single non-binary star to rule out misidentification because binaries are unknown
-            return None
-        else:
-            quadruple_dict = {}
-            for idx, identifier in enumerate(StarImager.matching_candidate_ids):
-                quadruple_dict[identifier] = cleared_match_sets[idx].pop()
-            return quadruple_dict
+    def match(self) -> QuadrupleMatchResult:
+        return self.match_from_matrix(self.matcher_matrix())
+
+    def _matching_quadruple_of(self, result: QuadrupleMatchResult) -> dict[int, int]:
+        if not result.matched:
+            raise Exception(f"Could not match stars with given observed quadruple: {result.failure_reason}.")
+        if self.save_debug_images:
+            self.draw_matched_stars_into_capture(result.matching_quadruple)
+        return result.matching_quadruple
+
+    def determine_matching_quadruple_from_matrix(self, matcher_matrix: np.ndarray) -> dict[int, int] | None:
+        return self._matching_quadruple_of(self.match_from_matrix(matcher_matrix))
 
     def determine_matching_quadruple(self) -> dict[int, int] | None:
-        return self.determine_matching_quadruple_from_matrix(self.matcher_matrix())
+        return self._matching_quadruple_of(self.match())
 
     def draw_matched_stars_into_capture(self, matched_ids_dict: dict[int, int]):
         assert len(matched_ids_dict) == 4
-        gray_img = Code.read_debug_image(Params.debug_gray_img)
+        if not debug_renderer.enabled:
+            return
+        draw_commands = []
         for idx in self.observed_stars.keys():
             observed = self.observed_stars.get(idx)
             float_pos = observed.position
             int_x, int_y = int(float_pos[0]), int(float_pos[1])
-            cv2.circle(gray_img, (int_x, int_y), radius=10, color=(0, 0, 255), thickness=1)
-            cv2.putText(
-                gray_img,
-                catalog_dict.get(matched_ids_dict[idx]).name, (int_x + 15, int_y - 10),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1, cv2.LINE_AA
-            )
-        Code.save_debug_image(Params.debug_matched_img, gray_img)
+            draw_commands.append(DebugRenderer.circle((int_x, int_y), 10, (0, 0, 255), 1))
+            draw_commands.append(DebugRenderer.text(
+                self.artifacts.catalog_dict.get(matched_ids_dict[idx]).name, (int_x + 15, int_y - 10), (0, 0, 255)
+            ))
+        debug_renderer.submit_drawing(Params.debug_matched_img, Params.debug_gray_img, draw_commands)
 
     def draw_candidate_quadruple_into_capture(self):
-        gray_img = Code.read_debug_image(Params.debug_gray_img)
+        if not debug_renderer.enabled:
+            return
+        draw_commands = []
         for idx in self.observed_stars.keys():
             observed = self.observed_stars.get(idx)
             float_pos = observed.position
             int_x, int_y = int(float_pos[0]), int(float_pos[1])
-            cv2.circle(gray_img, (int_x, int_y), radius=10, color=(0, 128, 255), thickness=1)
-            cv2.putText(
-                gray_img,
-                str(idx), (int_x + 15, int_y - 10),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 128, 255), 1, cv2.LINE_AA
-            )
-        Code.save_debug_image(Params.debug_candidates_img, gray_img)
+            draw_commands.append(DebugRenderer.circle((int_x, int_y), 10, (0, 128, 255), 1))
+            draw_commands.append(DebugRenderer.text(str(idx), (int_x + 15, int_y - 10), (0, 128, 255)))
+        debug_renderer.submit_drawing(Params.debug_candidates_img, Params.debug_gray_img, draw_commands)
+
+
+class PyramidMatcher(StarMatcher):
+    """
+    Alternative matching engine with the interface of StarMatcher, following the pyramid scheme: catalog triangles are
+    looked up for the observed triangles in order of brightness, a catalog triangle is only accepted once the remaining
+    observed star confirms it as the fourth star of a catalog pyramid.
+    """
+    def brightness_ordered_triangles(self) -> list[tuple[int, int, int]]:
+        """
+        :return: all triangles of observed star ids, triangles of brighter stars first
+        """
+        by_brightness = sorted(self.observed_stars.keys(), key=lambda observed_id: self.observed_stars.get(
+            observed_id).pixel_count, reverse=True)
+        return list(itertools.combinations(by_brightness, 3))
+
+    def catalog_triangles(self, triangle: tuple[int, int, int]) -> np.ndarray:
+        """
+        :param triangle: observed star ids i, j, k
+        :return: (m x 3) matrix of catalog star ids whose three separations match the observed triangle
+        """
+        i, j, k = triangle
+        first_ids, second_ids = self.candidate_pairs(StarImager.pairing_id_by_pair.get((i, j)))
+        # a catalog pair can be observed in either orientation
+        i_ids = np.concatenate((first_ids, second_ids))
+        j_ids = np.concatenate((second_ids, first_ids))
+        k_ids, owners = self._neighbor_edges_within(j_ids, j, k)
+        i_ids, j_ids = i_ids[owners], j_ids[owners]
+        closed = self._separations_within(i_ids, k_ids, i, k) & (k_ids != i_ids)
+        return np.column_stack((i_ids[closed], j_ids[closed], k_ids[closed]))
+
+    def confirmed_pyramids(self, triangle: tuple[int, int, int], catalog_triangles: np.ndarray) -> np.ndarray:
+        """
+        :return: (m x 4) matrix of catalog star ids in the order of the triangle followed by the fourth observed star
+        """
+        i, j, k = triangle
+        fourth = next(observed_id for observed_id in StarImager.matching_candidate_ids if observed_id not in triangle)
+        fourth_ids, owners = self._neighbor_edges_within(catalog_triangles[:, 0], i, fourth)
+        pyramids = np.column_stack((catalog_triangles[owners], fourth_ids))
+        confirmed = (self._separations_within(pyramids[:, 1], fourth_ids, j, fourth) &
+                     self._separations_within(pyramids[:, 2], fourth_ids, k, fourth) &
+                     (fourth_ids != pyramids[:, 1]) & (fourth_ids != pyramids[:, 2]))
+        return pyramids[confirmed]
+
+    def match(self) -> QuadrupleMatchResult:
+        result = QuadrupleMatchResult(failure_reason="no catalog triangle")
+        for triangle in self.brightness_ordered_triangles():
+            catalog_triangles = self.catalog_triangles(triangle)
+            if len(catalog_triangles) == 0:
+                continue
+            pyramids = self.confirmed_pyramids(triangle, catalog_triangles)
+            if len(pyramids) == 0:
+                result = QuadrupleMatchResult(failure_reason="no catalog triangle confirmed by the fourth star")
+                continue
+            observed_ids = triangle + tuple(observed_id for observed_id in StarImager.matching_candidate_ids
+                                            if observed_id not in triangle)
+            hypotheses = pyramids[:, [observed_ids.index(observed_id)
+                                      for observed_id in StarImager.matching_candidate_ids]]
+            result = self.ranked_result(hypotheses, "no unambiguous observed star among the confirmed pyramids")
+            if result.matched:
+                return result
+        return result
+
+
+class HashMatcher(PyramidMatcher):
+    """
+    Pyramid matching with catalog triangles taken from the triangle hash index of the artifacts: one probe of the
+    sorted side angles instead of expanding candidate pairs through the neighbor graph.
+    """
+    queries_candidate_pairs = False
+
+    def catalog_triangles(self, triangle: tuple[int, int, int]) -> np.ndarray:
+        i, j, k = triangle
+        opposite_side_angles = [Code.cosine_separation_to_angle_deg(self.observed_pairings.get(
+            StarImager.pairing_id_by_pair.get(side)).cosine_separation) for side in ((j, k), (i, k), (i, j))]
+        candidates = self.artifacts.triangle_hash_index.candidates(tuple(opposite_side_angles))
+        # sides of equal length can swap their order under noise, so every vertex assignment is verified
+        catalog_triangles = []
+        for permutation in itertools.permutations(range(3)):
+            assigned = candidates[:, permutation]
+            verified = (self._separations_within(assigned[:, 0], assigned[:, 1], i, j) &
+                        self._separations_within(assigned[:, 1], assigned[:, 2], j, k) &
+                        self._separations_within(assigned[:, 0], assigned[:, 2], i, k))
+            catalog_triangles.append(assigned[verified])
+        return np.concatenate(catalog_triangles)
+
+
+matching_engines = {"quadruple": StarMatcher, "pyramid": PyramidMatcher, "hash": HashMatcher}
+
+
+class FrameCandidateRanges:
+    """
+    Candidate pair lookup for all quadruples of a frame at once. Quadruples of a frame share most of their stars, so
+    the observed star-to-star cosine matrix is assembled once and the pair database is queried in one batch for every
+    unique observed pair, instead of six queries per quadruple.
+    """
+    def __init__(self, observed_quadruples: list[ObservedQuadruple], pair_database: StarPairDatabase,
+                 lookup: str = "binary_search"):
+        # unique observed stars of the frame, identified by object identity
+        star_indices: dict[int, int] = {}
+        for observed_quadruple in observed_quadruples:
+            for observed_star in observed_quadruple.observed_stars_dict.values():
+                star_indices.setdefault(id(observed_star), len(star_indices))
+        self.star_count = len(star_indices)
+
+        # frame star indices of both stars of every observed pair, per quadruple
+        quadruple_pair_indices = np.zeros((len(observed_quadruples), len(StarImager.pairing_ids), 2), dtype=int)
+        self.cosine_matrix = np.full((self.star_count, self.star_count), np.nan)
+        for quadruple_idx, observed_quadruple in enumerate(observed_quadruples):
+            observed_stars = observed_quadruple.observed_stars_dict
+            for pairing_id, observed_star_pair in observed_quadruple.observed_pairings_dict.items():
+                first, second = StarImager.pair_by_ids[pairing_id]
+                pair_indices = sorted((star_indices[id(observed_stars.get(first))],
+                                       star_indices[id(observed_stars.get(second))]))
+                quadruple_pair_indices[quadruple_idx, pairing_id] = pair_indices
+                self.cosine_matrix[pair_indices[0], pair_indices[1]] = observed_star_pair.cosine_separation
+
+        rows, columns = np.nonzero(~np.isnan(self.cosine_matrix))
+        self.unique_pair_count = len(rows)
+        starts, stops = pair_database.query_ranges(self.cosine_matrix[rows, columns], lookup=lookup)
+        range_matrix = np.zeros((self.star_count, self.star_count, 2), dtype=np.int64)
+        range_matrix[rows, columns, 0] = starts
+        range_matrix[rows, columns, 1] = stops
+        quadruple_ranges = range_matrix[quadruple_pair_indices[..., 0], quadruple_pair_indices[..., 1]].tolist()
+        self.quadruple_ranges = [{pairing_id: tuple(pair_range) for pairing_id, pair_range in enumerate(ranges)}
+                                 for ranges in quadruple_ranges]
+
+
+# artifacts of the parent process, set once per worker process by MultiMatcher
+_worker_artifacts: StarTrackerArtifacts | None = None
+
+
+def _init_match_worker(artifacts_directory: str, artifacts_parameters: dict[str, float]):
+    global _worker_artifacts
+    # the arrays are memory-mapped, so all workers share the pages of the same files
+    _worker_artifacts = StarTrackerArtifacts(artifacts_directory, artifacts_parameters)
+
+
+def _match_quadruple(engine: str, lookup: str, quadruple_index: int, observed_quadruple: ObservedQuadruple,
+                     candidate_ranges: dict[int, tuple[int, int]] | None,
+                     min_confidence: float | None) -> QuadrupleMatchResult:
+    return MultiMatcher.match_quadruple(engine, lookup, _worker_artifacts, quadruple_index, observed_quadruple, False,
+                                        candidate_ranges, min_confidence)
 
 
 class MultiMatcher:
     """
-    Like StarMatcher but can take a list of quadruples for match making.
+    Like StarMatcher but can take several quadruples for match making. Quadruples are pulled from the given iterable
+    on demand, a lazy generator is only advanced until a quadruple matches.
     """
-    def __init__(self, observed_quadruples: list[ObservedQuadruple]):
-        self.observed_quadruples = observed_quadruples
+    # quadruples pulled at once and sharing one batched candidate pair lookup
+    lookup_batch_size = 8
 
-    def determine_match_from_multiple_quadruples(self) -> tuple[dict[int, int], dict[int, ObservedStar]] | None:
+    def __init__(self, observed_quadruples: Iterable[ObservedQuadruple], lookup: str = "binary_search",
+                 artifacts: StarTrackerArtifacts | None = None, engine: str = "quadruple",
+                 save_debug_images: bool = True, workers: int = 1, batch_lookup: bool = True,
+                 min_confidence: float | None = None, worker_pool: ProcessPoolExecutor | None = None):
         """
-        Returns matched star ids as dictionary as well as the corresponding observed stars.
-        :return:
+        :param observed_quadruples: quadruples in the order they are tried, e.g. a generator
+        :param engine: matching engine, "quadruple" (StarMatcher), "pyramid" (PyramidMatcher) or "hash" (HashMatcher)
+        :param workers: number of processes matching quadruples in parallel, 1 matches them one after another
+        :param worker_pool: pool of create_worker_pool for the same artifacts, kept by the caller across frames. Without
+        one a pool is created and closed for this matcher only
+        :param batch_lookup: look up candidate pairs once per batch of quadruples, see FrameCandidateRanges
+        :param min_confidence: confidence at which an ambiguous quadruple is accepted, see StarMatcher
+        """
+        assert engine in matching_engines
+        assert workers >= 1
+        self._quadruple_source = iter(observed_quadruples)
+        # quadruples pulled from the source so far, indexed like results
+        self.observed_quadruples: list[ObservedQuadruple] = []
+        self.lookup = lookup
+        self.artifacts = artifacts if artifacts is not None else ArtifactCache.default_artifacts()
+        # workers load the artifacts from their directory, in memory only artifacts are matched within this process
+        assert workers == 1 or isinstance(self.artifacts, StarTrackerArtifacts)
+        self.engine = engine
+        self.save_debug_images = save_debug_images
+        self.workers = workers
+        self.batch_lookup = batch_lookup
+        self.min_confidence = min_confidence
+        self.worker_pool = worker_pool
+        # one result per pulled quadruple after matching, None for quadruples which have not been tried
+        self.results: list[QuadrupleMatchResult | None] = []
+
+    @staticmethod
+    def match_quadruple(engine: str, lookup: str, artifacts: StarTrackerArtifacts, quadruple_index: int,
+                        observed_quadruple: ObservedQuadruple, save_debug_images: bool,
+                        candidate_ranges: dict[int, tuple[int, int]] | None = None,
+                        min_confidence: float | None = None) -> QuadrupleMatchResult:
+        # engines report quadruples without a match as failed results, anything raised is a bug and propagates
+        matcher = matching_engines[engine](observed_quadruple, lookup, artifacts, save_debug_images,
+                                           candidate_ranges, min_confidence=min_confidence)
+        result = matcher.match()
+        if result.matched and save_debug_images:
+            matcher.draw_matched_stars_into_capture(result.matching_quadruple)
+        result.quadruple_index = quadruple_index
+        return result
+
+    def _next_batch(self, start_index: int) -> list[tuple[int, ObservedQuadruple, dict[int, tuple[int, int]] | None]]:
+        """
+        Quadruples from start_index on, already pulled ones first, then new ones from the source.
+        :return: up to lookup_batch_size quadruples with their index and candidate ranges, empty when exhausted
         """
-        num_of_quadruples = len(self.observed_quadruples)
-        for idx, observed_quadruple in enumerate(self.observed_quadruples):
-            try:
-                print(f"Try with quadruple {idx + 1 } of {num_of_quadruples}.")
-                matcher = StarMatcher(observed_quadruple)
-                matching_quadruple_ids = matcher.determine_matching_quadruple()
-                return matching_quadruple_ids, observed_quadruple.observed_stars_dict
-            except:
-                print(f"Could not match with quadruple {idx+1} of {num_of_quadruples}.")
+        stop_index = start_index + self.lookup_batch_size
+        while len(self.observed_quadruples) < stop_index:
+            observed_quadruple = next(self._quadruple_source, None)
+            if observed_quadruple is None:
+                break
+            self.observed_quadruples.append(observed_quadruple)
+            self.results.append(None)
+        batch = self.observed_quadruples[start_index:stop_index]
+        if not self.batch_lookup or len(batch) == 0 or not matching_engines[self.engine].queries_candidate_pairs:
+            quadruple_candidate_ranges = [None] * len(batch)
+        else:
+            quadruple_candidate_ranges = FrameCandidateRanges(batch, self.artifacts.pair_database,
+                                                              self.lookup).quadruple_ranges
+        return list(zip(range(start_index, start_index + len(batch)), batch, quadruple_candidate_ranges))
+
+    def _match_one_after_another(self) -> QuadrupleMatchResult | None:
+        batch = self._next_batch(0)
+        while len(batch) > 0:
+            for idx, observed_quadruple, candidate_ranges in batch:
+                print(f"Try with quadruple {idx + 1}.")
+                result = self.match_quadruple(self.engine, self.lookup, self.artifacts, idx, observed_quadruple,
+                                              self.save_debug_images, candidate_ranges, self.min_confidence)
+                self.results[idx] = result
+                if result.matched:
+                    return result
+                print(f"Could not match with quadruple {idx + 1}: {result.failure_reason}.")
+            batch = self._next_batch(batch[-1][0] + 1)
         return None
 
+    @staticmethod
+    def create_worker_pool(artifacts: StarTrackerArtifacts, workers: int) -> ProcessPoolExecutor:
+        """
+        Process pool whose workers load the artifacts once, to be shared by the matchers of many frames. The caller
+        closes it with shutdown.
+        """
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_match_worker,
+                                   initargs=(artifacts.directory, artifacts.parameters))
 
+    def _match_in_parallel(self) -> QuadrupleMatchResult | None:
+        """
+        The first verified match to complete wins. New quadruples are pulled whenever fewer than two per worker are
+        pending, the ones still waiting for a worker are cancelled once a match is found.
+        """
+        executor = self.worker_pool
+        if executor is None:
+            executor = MultiMatcher.create_worker_pool(self.artifacts, self.workers)
+        winning_result = None
+        pending = set()
+        batch = self._next_batch(0)
+        try:
+            while winning_result is None and (len(batch) > 0 or len(pending) > 0):
+                while len(batch) > 0 and len(pending) < 2 * self.workers:
+                    idx, observed_quadruple, candidate_ranges = batch.pop(0)
+                    pending.add(executor.submit(_match_quadruple, self.engine, self.lookup, idx, observed_quadruple,
+                                                candidate_ranges, self.min_confidence))
+                    if len(batch) == 0:
+                        batch = self._next_batch(idx + 1)
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    self.results[result.quadruple_index] = result
+                    if result.matched and (winning_result is None or
+                                           result.quadruple_index < winning_result.quadruple_index):
+                        winning_result = result
+        finally:
+            for future in pending:
+                future.cancel()
+            if self.worker_pool is None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        if winning_result is not None and self.save_debug_images:
+            # workers do not draw, the winning quadruple is drawn here
+            matcher = matching_engines[self.engine](self.observed_quadruples[winning_result.quadruple_index],
+                                                    self.lookup, self.artifacts, self.save_debug_images)
+            matcher.draw_matched_stars_into_capture(winning_result.matching_quadruple)
+        return winning_result
 
+    def determine_match_from_multiple_quadruples(self) -> tuple[dict[int, int], dict[int, ObservedStar]] | None:
+        """
+        Returns matched star ids as dictionary as well as the corresponding observed stars. The outcome of every
+        quadruple tried is kept in results.
+        :return:
+        """
+        self.results = [None] * len(self.observed_quadruples)
+        if self.workers > 1:
+            winning_result = self._match_in_parallel()
+        else:
+            winning_result = self._match_one_after_another()
+        if winning_result is None:
+            return None
+        winning_quadruple = self.observed_quadruples[winning_result.quadruple_index]
+        return winning_result.matching_quadruple, winning_quadruple.observed_stars_dict
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 from math import pi, cos
 
+import numpy as np
+
 from star_tracker.catalog_parser import CatalogStar
-from star_tracker.catalog_dict import catalog_dict
+from star_tracker.catalog_store import CatalogStore
+from star_tracker.pair_database import StarPairDatabase
+from star_tracker.sky_grid import SkyGrid
 
 
 class CatalogStarPair:
@@ -27,29 +33,50 @@ class CatalogStarPair:
 
 class PairingDeterminer:
     radians_per_degree = pi / 180
-    pairings_file = "star_tracker/pairings.py"
-    neighbors_file = "star_tracker/neighbors.py"
 
     def __init__(self, max_viable_angle_deg: float, min_viable_angle_deg: float, max_magnitude: float,
                  catalog_stars: dict[int, CatalogStar]):
         max_viable_angle_rad = max_viable_angle_deg * self.radians_per_degree
         min_viable_angle_rad = min_viable_angle_deg * self.radians_per_degree
+        self.max_viable_angle_deg = max_viable_angle_deg
         self.min_viable_cosine = cos(min_viable_angle_rad)
         self.max_viable_cosine = cos(max_viable_angle_rad)
+        self.star_count = max(catalog_stars.keys()) + 1
         self.filtered_catalog_dict = self._filter_by_magnitude(catalog_stars, max_magnitude)
 
     @staticmethod
     def _filter_by_magnitude(catalog_stars: dict[int, CatalogStar], max_magnitude: float) -> dict[int, CatalogStar]:
-        stars_to_remove = []
+        filtered_catalog_stars = {}
         for identifier in catalog_stars.keys():
             star = catalog_stars.get(identifier)
-            if star.visual_magnitude > max_magnitude:
-                stars_to_remove.append(identifier)
-        for identifier in stars_to_remove:
-            del catalog_stars[identifier]
-        return catalog_stars
+            if star.visual_magnitude <= max_magnitude:
+                filtered_catalog_stars[identifier] = star
+        return filtered_catalog_stars
+
+    def determine_viable_pair_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Enumerates viable pairs with a sky grid, only stars in cells within the maximum viable angle are compared.
+        :return: first ids, second ids and cosine separations, sorted by ascending cosine separation
+        """
+        star_ids = np.array(list(self.filtered_catalog_dict.keys()), dtype=np.int64)
+        if len(star_ids) < 2:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        positions = np.array([self.filtered_catalog_dict.get(star_id).position.value for star_id in star_ids])
+        sky_grid = SkyGrid(positions, self.max_viable_angle_deg)
+        first_rows, second_rows, cosine_separations = sky_grid.pairs_within_angle(self.min_viable_cosine,
+                                                                                 self.max_viable_cosine)
+        order = np.argsort(cosine_separations, kind="stable")
+        return star_ids[first_rows[order]], star_ids[second_rows[order]], cosine_separations[order]
 
     def determine_viable_pairings(self) -> list[CatalogStarPair]:
+        first_ids, second_ids, cosine_separations = self.determine_viable_pair_arrays()
+        return [CatalogStarPair(int(first_id), int(second_id), float(cosine_separation))
+                for first_id, second_id, cosine_separation in zip(first_ids, second_ids, cosine_separations)]
+
+    def determine_viable_pairings_brute_force(self) -> list[CatalogStarPair]:
+        """
+        Reference implementation checking every possible pair, quadratic in the number of stars.
+        """
         viable_star_pairs = []
         star_ids = set(self.filtered_catalog_dict.keys())
         #print("determine all possible pairing tuples")
@@ -64,39 +91,6 @@ class PairingDeterminer:
                 viable_star_pairs.append(CatalogStarPair(first_id, second_id, cosine_separation))
         return viable_star_pairs
 
-    def generate_pairing_file(self, visible_star_pairs: list[CatalogStarPair]):
-        file_str = "from star_tracker.star_pairing import CatalogStarPair\n\n"
-        file_str += "pairings = [\n"
-        for idx, star_pair in enumerate(visible_star_pairs):
-            file_str += f"\t{str(star_pair)},\n"
-        file_str += "]\n"
-        with open(self.pairings_file, "w") as f:
-            f.write(file_str)
-
-    def generate_neighbors_file(self, visible_star_pairs: list[CatalogStarPair]):
-        neighbors_dict: dict[int, set] = {}
-        for star_pair in visible_star_pairs:
-            first_id = star_pair.first_id
-            second_id = star_pair.second_id
-            first_entry = neighbors_dict.get(first_id)
-            second_entry = neighbors_dict.get(second_id)
-            if first_entry is not None:
-                first_entry.add(second_id)
-            else:
-                neighbors_dict[first_id] = {second_id}
-            if second_entry is not None:
-                second_entry.add(first_id)
-            else:
-                neighbors_dict[second_id] = {first_id}
-        file_str = "neighbors = {\n"
-        for star_id in neighbors_dict.keys():
-            neighbor_set = neighbors_dict.get(star_id)
-            file_str += 4*" " + f"{star_id}: {str(neighbor_set)},\n"
-        file_str = file_str[:-2]
-        file_str += "\n}\n"
-        with open(self.neighbors_file, "w") as f:
-            f.write(file_str)
-
     @staticmethod
     def pairing_tuples(indices: set[int]) -> set[tuple[int, int]]:
         pairs = set()
@@ -112,7 +106,79 @@ class PairingDeterminer:
         return pairs
 
 
+# sky grid of the union catalog, set once per worker process by PairDatabaseBuilder
+_worker_sky_grid: SkyGrid | None = None
+
+
+def _init_pair_worker(positions: np.ndarray, cell_size_deg: float):
+    global _worker_sky_grid
+    _worker_sky_grid = SkyGrid(positions, cell_size_deg)
+
+
+def _viable_pairs_of_cells(cells: np.ndarray, min_viable_cosine: float,
+                           max_viable_cosine: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    first_rows, second_rows, cosine_separations = _worker_sky_grid.pairs_within_angle(
+        min_viable_cosine, max_viable_cosine, cells)
+    order = np.argsort(cosine_separations, kind="stable")
+    return first_rows[order], second_rows[order], cosine_separations[order]
+
+
+class PairDatabaseBuilder:
+    """
+    Builds the union pair database for the largest field of view and magnitude limit of a sweep once. Sky grid cells
+    are split into chunks which are processed in a process pool, the sorted chunk results are merged into one
+    database. Databases for smaller configurations are derived from the union by masking.
+    """
+    def __init__(self, max_viable_angle_deg: float, min_viable_angle_deg: float, max_magnitude: float,
+                 catalog_store: CatalogStore, workers: int | None = None, chunks_per_worker: int = 4):
+        self.max_viable_angle_deg = max_viable_angle_deg
+        self.min_viable_angle_deg = min_viable_angle_deg
+        self.max_magnitude = max_magnitude
+        self.catalog_store = catalog_store
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.chunks_per_worker = chunks_per_worker
+
+    def build(self) -> StarPairDatabase:
+        star_ids = np.flatnonzero(self.catalog_store.visual_magnitudes <= self.max_magnitude)
+        positions = self.catalog_store.positions[star_ids]
+        min_viable_cosine = cos(self.min_viable_angle_deg * PairingDeterminer.radians_per_degree)
+        max_viable_cosine = cos(self.max_viable_angle_deg * PairingDeterminer.radians_per_degree)
+        cell_count = SkyGrid(positions, self.max_viable_angle_deg).cell_count
+        cell_chunks = np.array_split(np.arange(cell_count), min(cell_count, self.workers * self.chunks_per_worker))
+
+        with ProcessPoolExecutor(self.workers, initializer=_init_pair_worker,
+                                 initargs=(positions, self.max_viable_angle_deg)) as executor:
+            chunk_results = list(executor.map(_viable_pairs_of_cells, cell_chunks,
+                                              [min_viable_cosine] * len(cell_chunks),
+                                              [max_viable_cosine] * len(cell_chunks)))
+
+        first_rows, second_rows, cosine_separations = (np.concatenate(arrays) for arrays in zip(*chunk_results))
+        # chunk results are sorted runs already, which the stable sort merges
+        return StarPairDatabase.from_pair_arrays(star_ids[first_rows], star_ids[second_rows], cosine_separations)
+
+    def derive(self, union_database: StarPairDatabase, max_viable_angle_deg: float, min_viable_angle_deg: float,
+               max_magnitude: float) -> StarPairDatabase:
+        """
+        Masks the union database down to a configuration within the limits this builder was created with.
+        """
+        assert max_viable_angle_deg <= self.max_viable_angle_deg
+        assert min_viable_angle_deg >= self.min_viable_angle_deg
+        assert max_magnitude <= self.max_magnitude
+        min_viable_cosine = cos(min_viable_angle_deg * PairingDeterminer.radians_per_degree)
+        max_viable_cosine = cos(max_viable_angle_deg * PairingDeterminer.radians_per_degree)
+        visual_magnitudes = self.catalog_store.visual_magnitudes
+        cosine_separations = union_database.cosine_separations
+        mask = ((cosine_separations >= max_viable_cosine) & (cosine_separations <= min_viable_cosine) &
+                (visual_magnitudes[union_database.first_ids] <= max_magnitude) &
+                (visual_magnitudes[union_database.second_ids] <= max_magnitude))
+        # masking keeps the ascending order of the cosine separations
+        return StarPairDatabase(cosine_separations[mask], union_database.first_ids[mask],
+                                union_database.second_ids[mask])
+
+
 if __name__ == "__main__":
+    from star_tracker.artifact_cache import ArtifactCache
+    catalog_dict = ArtifactCache.default_artifacts().catalog_dict
     #catalog_stars_dict = catalog_dict
     #stars_to_remove = []
     #for identifier in catalog_stars_dict.keys():
@@ -125,8 +191,5 @@ if __name__ == "__main__":
     max_fov = 17.0
     max_magnitude = 4.9
     pd = PairingDeterminer(max_fov, max_fov / 1000, max_magnitude, catalog_dict)
-    pairings = pd.determine_viable_pairings()
-    pairings.sort(key=CatalogStarPair.sorting_key)
-    print(len(pairings), len(pd.filtered_catalog_dict))
-    pd.generate_pairing_file(pairings)
-    pd.generate_neighbors_file(pairings)
+    first_ids, _, _ = pd.determine_viable_pair_arrays()
+    print(len(first_ids), len(pd.filtered_catalog_dict))
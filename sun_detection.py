@@ -4,39 +4,65 @@ import numpy as np
 
 from lense_distortion import RadialDistortionCorrector
 from common import Params, Code
+from debug_renderer import debug_renderer
 from se_automation import VirtualCamera, WindowController
 import cv2
 from math import atan, pi
 
 
+class SunMaskStatistics:
+    """
+    Pixel count, centroid and bounding box of the white pixels of a sun mask, all determined from one list of the
+    white pixel coordinates.
+    """
+    def __init__(self, pixel_count: int, center_point: tuple[float, float] | None,
+                 bounding_box: tuple[int, int, int, int] | None):
+        """
+        :param center_point: width and height pixel coordinates, None for an empty mask
+        :param bounding_box: x, y, width and height like cv2.boundingRect, None for an empty mask
+        """
+        self.pixel_count = pixel_count
+        self.center_point = center_point
+        self.bounding_box = bounding_box
+
+    @classmethod
+    def from_mask_image(cls, mask_image: np.ndarray):
+        assert mask_image.shape == Params.width_height
+        # x and y of all white pixels, None if there are none
+        white_points = cv2.findNonZero(mask_image)
+        if white_points is None:
+            return cls(0, None, None)
+        center_x, center_y = white_points.reshape(-1, 2).mean(axis=0)
+        return cls(len(white_points), (float(center_x), float(center_y)), cv2.boundingRect(white_points))
+
+    def __str__(self):
+        return f"SunMaskStatistics({self.pixel_count}, {self.center_point}, {self.bounding_box})"
+
+
 class SunDetector:
     mask_counter = 0
     @staticmethod
     def raw_to_mask(raw_image: np.ndarray) -> np.ndarray:
         """
-        :param raw_image: Raw image of the sun in BGR
+        :param raw_image: Raw image of the sun in BGR or an already gray frame
         :return: Mask image of relevant 'solar disc' pixels.
         """
-        assert raw_image.shape == Params.width_height + (3,)
+        assert raw_image.shape[:2] == Params.width_height
         # transform image to grayscale
-        gray_image = cv2.cvtColor(raw_image, cv2.COLOR_BGR2GRAY)
+        gray_image = Code.to_gray(raw_image)
         # turn gray image to mask using thresholding
         _, mask = cv2.threshold(gray_image, 248, 255, cv2.THRESH_BINARY)
-        Code.save_debug_image(str(SunDetector.mask_counter)+".png", mask)
+        debug_renderer.submit_frame(str(SunDetector.mask_counter)+".png", mask)
         SunDetector.mask_counter += 1
         return mask
 
     @staticmethod
     def white_dots(mask_image: np.ndarray) -> np.ndarray:
-        dots = []
+        """
+        :return: row and column of every white mask pixel in row-major order
+        """
         assert mask_image.shape == Params.width_height
-        for row in range(0, Params.width_height[1]):
-            for col in range(0, Params.width_height[0]):
-                val = mask_image[row][col]
-                assert val == 0 or val == 255
-                if val > 0:
-                    dots.append([row, col])
-        return np.array(dots)
+        return np.argwhere(mask_image > 0)
 
     @staticmethod
     def num_of_dots(white_dot_matrix: np.ndarray) -> int:
@@ -52,15 +78,9 @@ class SunDetector:
         :param mask_image:
         :return: Width and height pixel coordinates of center point
         """
-        white_dot_matrix = SunDetector.white_dots(mask_image)
-        num_of_dots = SunDetector.num_of_dots(white_dot_matrix)
-        summed_vector = white_dot_matrix.sum(axis=0)
-        print(summed_vector)
-        assert summed_vector.shape == (2,)
-        norm_summed_vector = summed_vector * (1 / num_of_dots)
-        # coordinates are reversed for some reason
-        position_tuple = float(norm_summed_vector[1]), float(norm_summed_vector[0])
-        return position_tuple
+        mask_statistics = SunMaskStatistics.from_mask_image(mask_image)
+        assert mask_statistics.pixel_count > 0
+        return mask_statistics.center_point
 
     @staticmethod
     def center_point_of_raw(raw_image: np.ndarray) -> tuple[float, float]:
@@ -69,8 +89,7 @@ class SunDetector:
 
     @staticmethod
     def num_of_dots_of_mask(mask_image: np.ndarray) -> int:
-        white_dot_matrix = SunDetector.white_dots(mask_image)
-        return SunDetector.num_of_dots(white_dot_matrix)
+        return SunMaskStatistics.from_mask_image(mask_image).pixel_count
 
     @staticmethod
     def identifier_of_sun_located_image(surrounding_images: dict[str, np.ndarray]) -> str:
@@ -158,6 +177,6 @@ if __name__ == "__main__":
     radius_of_point = distortion_corrector.self_point_to_radius(corrected_sun_point)
     sun_cam.turn_precisely('y', -(field_of_view / 2) * radius_of_point*math.sqrt(2))
 
-    analysis_img = sun_cam.take_screenshot("analysis_img")
+    analysis_img = sun_cam.take_screenshot("analysis_img", gray=True)
     analysis_center = SunDetector.center_point_of_raw(analysis_img)
     print(f"Sun now at pixel position: {analysis_center}")
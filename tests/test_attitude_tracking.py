@@ -0,0 +1,62 @@
+import pytest
+
+from common import Params
+from star_tracker.attitude_determiner import AttitudeDeterminer
+from star_tracker.benchmarks.fixtures import BenchmarkFixtures
+from star_tracker.catalog_parser import UnitVector
+
+turn_angle_deg = 5.0
+
+
+@pytest.fixture(scope="module")
+def determiner() -> AttitudeDeterminer:
+    return AttitudeDeterminer(Params.star_tracker_max_fov_deg)
+
+
+@pytest.fixture(scope="module")
+def turning_frames(determiner: AttitudeDeterminer) -> list[tuple[UnitVector, UnitVector, list, list]]:
+    # frames of a camera turned around a fixed axis, each with the view vector of the frame before
+    view_vector = UnitVector.from_array([0.3, 0.8, 0.52])
+    axis_vector = UnitVector.from_cross_product(view_vector, UnitVector.from_array([0.0, 0.0, 1.0]))
+    view_vectors = [view_vector]
+    while len(view_vectors) < 6:
+        view_vectors.append(UnitVector.from_rodrigues_rotation(axis_vector, view_vectors[-1], turn_angle_deg))
+    frames = BenchmarkFixtures.synthetic_frames(determiner.artifacts, 0,
+                                                boresights=[vector.value for vector in view_vectors[1:]])
+    return [(previous_view_vector, axis_vector, quadruples, truths)
+            for previous_view_vector, (quadruples, truths) in zip(view_vectors, frames) if len(quadruples) > 0]
+
+
+def test_predicted_attitude_matches_by_tracking(determiner: AttitudeDeterminer, turning_frames: list):
+    determiner.tracking = True
+    for previous_view_vector, axis_vector, quadruples, truths in turning_frames:
+        determiner.predicted_attitude = previous_view_vector, axis_vector
+        determiner.predict_turn(turn_angle_deg)
+        with BenchmarkFixtures.quiet():
+            result = determiner.match_quadruples(quadruples)
+        assert determiner.last_matching_mode == "tracking"
+        assert BenchmarkFixtures.matched_correctly(result, quadruples, truths)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_wrong_prediction_falls_back_to_lost_in_space(determiner: AttitudeDeterminer, turning_frames: list,
+                                                      lazy: bool):
+    determiner.tracking = True
+    for previous_view_vector, axis_vector, quadruples, truths in turning_frames:
+        # looking the opposite way, none of the observed stars are within the tracking cone
+        determiner.predicted_attitude = UnitVector(-previous_view_vector.value), axis_vector
+        with BenchmarkFixtures.quiet():
+            # lazily built quadruples like the star imager's, the ones tried by tracking must reach the fallback
+            result = determiner.match_quadruples((quadruple for quadruple in quadruples) if lazy else quadruples)
+        assert determiner.last_matching_mode == "lost-in-space"
+        assert determiner.predicted_attitude is None
+        assert BenchmarkFixtures.matched_correctly(result, quadruples, truths)
+
+
+def test_without_prediction_matches_lost_in_space(determiner: AttitudeDeterminer, turning_frames: list):
+    determiner.predicted_attitude = None
+    _, _, quadruples, truths = turning_frames[0]
+    with BenchmarkFixtures.quiet():
+        result = determiner.match_quadruples(quadruples)
+    assert determiner.last_matching_mode == "lost-in-space"
+    assert BenchmarkFixtures.matched_correctly(result, quadruples, truths)
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+
+from star_tracker.catalog_parser import Parser
+
+catalog_file = os.path.join(os.path.dirname(__file__), os.pardir, "assets", "catalog")
+
+
+def parser_of_catalog() -> Parser:
+    parser = Parser()
+    parser.catalog_file = catalog_file
+    return parser
+
+
+def test_parse_columns_equals_parse_line_by_line():
+    line_parser = parser_of_catalog()
+    line_parser.parse_line_by_line()
+    column_parser = parser_of_catalog()
+    column_parser.parse()
+
+    assert len(column_parser.catalog_dict) == len(line_parser.catalog_dict)
+    for star_id, expected_star in line_parser.catalog_dict.items():
+        star = column_parser.catalog_dict[star_id]
+        assert star.name == expected_star.name
+        assert star.visual_magnitude == expected_star.visual_magnitude
+        # bitwise equal, the columnar parse evaluates positions in the same order
+        assert np.array_equal(star.position.value, expected_star.position.value)
+
+
+def test_parse_columns_flags_entries_without_star_fields():
+    columns = parser_of_catalog().parse_columns()
+    line_parser = parser_of_catalog()
+    with open(catalog_file, "r") as file:
+        expected_valid = [line_parser.parse_catalog_line(line) is not None for line in file]
+    assert columns["valid"].tolist() == expected_valid
+    assert not all(expected_valid)
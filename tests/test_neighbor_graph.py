@@ -0,0 +1,65 @@
+import numpy as np
+
+from star_tracker.neighbor_graph import NeighborGraph
+from star_tracker.pair_database import StarPairDatabase
+
+star_count = 300
+
+
+def random_pair_database(seed: int = 0) -> StarPairDatabase:
+    rng = np.random.default_rng(seed)
+    first_ids, second_ids = rng.integers(0, star_count - 20, (2, 2000))
+    # no self pairs and every pair once, like the pairs of the catalog
+    unique_pairs = np.unique(np.sort(np.column_stack((first_ids, second_ids)), axis=1), axis=0)
+    unique_pairs = unique_pairs[unique_pairs[:, 0] != unique_pairs[:, 1]]
+    cosine_separations = np.cos(np.radians(rng.uniform(0.02, 17.0, len(unique_pairs))))
+    return StarPairDatabase.from_pair_arrays(unique_pairs[:, 0], unique_pairs[:, 1], cosine_separations)
+
+
+def set_based_neighbors(pair_database: StarPairDatabase) -> dict[int, set]:
+    """
+    Neighbor sets like the formerly generated neighbors module, with the cosine separation of every edge.
+    """
+    neighbors_dict: dict[int, set] = {}
+    for first_id, second_id, cosine_separation in zip(pair_database.first_ids.tolist(),
+                                                      pair_database.second_ids.tolist(),
+                                                      pair_database.cosine_separations.tolist()):
+        neighbors_dict.setdefault(first_id, set()).add((second_id, cosine_separation))
+        neighbors_dict.setdefault(second_id, set()).add((first_id, cosine_separation))
+    return neighbors_dict
+
+
+def test_neighbors_equal_set_based_graph():
+    pair_database = random_pair_database()
+    neighbor_graph = NeighborGraph.from_pair_database(pair_database, star_count)
+    expected = set_based_neighbors(pair_database)
+    assert neighbor_graph.star_count == star_count
+    for star_id in range(star_count):
+        neighbor_ids, cosine_separations = neighbor_graph.neighbors_of(star_id)
+        assert np.all(np.diff(neighbor_ids) > 0)
+        assert set(zip(neighbor_ids.tolist(), cosine_separations.tolist())) == expected.get(star_id, set())
+
+
+def test_neighbor_queries_equal_set_based_graph():
+    pair_database = random_pair_database(1)
+    neighbor_graph = NeighborGraph.from_pair_database(pair_database, star_count)
+    expected = set_based_neighbors(pair_database)
+    rng = np.random.default_rng(2)
+    candidate_mask = rng.random(star_count) < 0.3
+    candidate_ids = np.flatnonzero(candidate_mask)
+    lowest_cosine, highest_cosine = np.cos(np.radians([9.0, 4.0]))
+    expected_within = {}
+    for star_id in range(star_count):
+        neighbor_set = expected.get(star_id, set())
+        assert (neighbor_graph.common_neighbors(star_id, candidate_ids).tolist() ==
+                sorted(neighbor_id for neighbor_id, _ in neighbor_set if candidate_mask[neighbor_id]))
+        expected_within[star_id] = sorted(neighbor_id for neighbor_id, cosine_separation in neighbor_set
+                                          if lowest_cosine <= cosine_separation <= highest_cosine)
+        assert (neighbor_graph.neighbors_within(star_id, lowest_cosine, highest_cosine).tolist() ==
+                expected_within[star_id])
+        assert (neighbor_graph.neighbors_within(star_id, lowest_cosine, highest_cosine, candidate_mask).tolist() ==
+                [neighbor_id for neighbor_id in expected_within[star_id] if candidate_mask[neighbor_id]])
+
+    star_ids = rng.permutation(star_count)[:100]
+    assert (neighbor_graph.have_neighbor_within(star_ids, candidate_mask, lowest_cosine, highest_cosine).tolist() ==
+            [any(candidate_mask[neighbor_id] for neighbor_id in expected_within[star_id]) for star_id in star_ids])
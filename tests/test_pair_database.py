@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from star_tracker.pair_database import KVectorIndex, StarPairDatabase
+
+
+def searchsorted_range(sorted_values: np.ndarray, lowest: float, highest: float) -> tuple[int, int]:
+    return (int(np.searchsorted(sorted_values, lowest, side="left")),
+            int(np.searchsorted(sorted_values, highest, side="right")))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_k_vector_ranges_equal_searchsorted_ranges(seed: int):
+    rng = np.random.default_rng(seed)
+    # clustered values with duplicates, like the cosine separations of nearby star pairs
+    values = np.sort(np.concatenate((rng.uniform(0.95, 1.0, 4000), rng.uniform(0.999, 0.9995, 1000),
+                                     np.repeat(rng.uniform(0.96, 0.99, 20), 5))))
+    index = KVectorIndex.from_sorted_values(values)
+
+    lowest = rng.uniform(0.94, 1.01, 500)
+    intervals = [(low, low + width) for low, width in zip(lowest, rng.uniform(0, 0.01, 500))]
+    # bounds equal to stored values, also duplicated ones
+    intervals += [(values[first], values[first + offset]) for first, offset in
+                  zip(rng.integers(0, len(values) - 50, 200), rng.integers(0, 50, 200))]
+    # intervals around, below and above all values, and empty ones
+    intervals += [(values[0], values[-1]), (0.0, 2.0), (0.5, 0.9), (1.1, 1.2), (values[10], values[10])]
+    for low, high in intervals:
+        assert index.value_range(values, low, high) == searchsorted_range(values, low, high)
+
+
+def test_k_vector_query_ranges_equal_binary_search():
+    rng = np.random.default_rng(3)
+    pair_count = 3000
+    pair_database = StarPairDatabase.from_pair_arrays(rng.integers(0, 500, pair_count),
+                                                      rng.integers(500, 1000, pair_count),
+                                                      np.cos(np.radians(rng.uniform(0.02, 17.0, pair_count))))
+    pair_database.build_k_vector_index()
+    measured = np.cos(np.radians(rng.uniform(0.0, 18.0, 300)))
+    for measured_cosine_separation in measured:
+        assert (pair_database.query_range(measured_cosine_separation, lookup="k_vector") ==
+                pair_database.query_range(measured_cosine_separation, lookup="binary_search"))
+    for lookup_ranges in zip(pair_database.query_ranges(measured, lookup="k_vector"),
+                             pair_database.query_ranges(measured, lookup="binary_search")):
+        assert np.array_equal(*lookup_ranges)
@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pytest
+
+from star_tracker.sky_grid import SkyGrid
+
+
+def unit_vectors(right_ascensions_deg, declinations_deg) -> np.ndarray:
+    right_ascensions = np.radians(np.asarray(right_ascensions_deg, dtype=float))
+    declinations = np.radians(np.asarray(declinations_deg, dtype=float))
+    return np.column_stack((np.cos(declinations) * np.cos(right_ascensions),
+                            np.cos(declinations) * np.sin(right_ascensions),
+                            np.sin(declinations)))
+
+
+def cone_ring(direction: np.ndarray, radius_rad: float, count: int) -> np.ndarray:
+    """
+    :return: count unit vectors at exactly radius_rad from direction, spread evenly around it
+    """
+    helper = np.array([1.0, 0.0, 0.0]) if abs(direction[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    first = np.cross(direction, helper)
+    first /= np.linalg.norm(first)
+    second = np.cross(direction, first)
+    azimuths = np.linspace(0, 2 * math.pi, count, endpoint=False)[:, None]
+    offsets = np.cos(azimuths) * first + np.sin(azimuths) * second
+    return math.cos(radius_rad) * direction + math.sin(radius_rad) * offsets
+
+
+# poles, the right ascension wrap around at 0 / 360° and declinations on band boundaries of the tested cell sizes
+edge_directions = unit_vectors([0, 0, 0, 359.999, 180, 90, 45, 270, 0.001, 123.4, 200],
+                               [90, -90, 0, 0, 89.9, -89.9, 8.5, -17, 51, -68, 34])
+random_directions = np.random.default_rng(0).normal(size=(200, 3))
+random_directions /= np.linalg.norm(random_directions, axis=1)[:, None]
+directions = np.vstack((edge_directions, random_directions))
+
+
+def brute_force_ids(positions: np.ndarray, direction: np.ndarray, radius_rad: float) -> np.ndarray:
+    return np.flatnonzero(positions @ direction >= math.cos(radius_rad))
+
+
+@pytest.mark.parametrize("radius_deg, cell_size_deg", [(2.0, 8.5), (8.5, 8.5), (17.0, 17.0), (17.0, 5.0),
+                                                       (60.0, 8.5)])
+def test_cone_searches_match_brute_force(radius_deg: float, cell_size_deg: float):
+    positions = np.random.default_rng(1).normal(size=(3000, 3))
+    positions /= np.linalg.norm(positions, axis=1)[:, None]
+    positions = np.vstack((positions, edge_directions))
+    sky_grid = SkyGrid(positions, cell_size_deg)
+    radius_rad = math.radians(radius_deg)
+
+    offsets, star_ids = sky_grid.star_ids_within_cones(directions, radius_rad)
+    assert len(offsets) == len(directions) + 1
+    for query, direction in enumerate(directions):
+        expected_ids = brute_force_ids(positions, direction, radius_rad)
+        assert np.array_equal(sky_grid.star_ids_within_cone(direction, radius_rad), expected_ids)
+        assert np.array_equal(star_ids[offsets[query]:offsets[query + 1]], expected_ids)
+
+
+@pytest.mark.parametrize("radius_deg", [2.0, 8.5, 17.0])
+def test_cone_boundary(radius_deg: float):
+    # rings of stars just inside and just outside of every cone, far enough from the radius for rounding not to matter
+    radius_rad = math.radians(radius_deg)
+    margin_rad = 1e-7
+    ring_size = 24
+    rings = []
+    for direction in edge_directions:
+        rings.append(cone_ring(direction, radius_rad - margin_rad, ring_size))
+        rings.append(cone_ring(direction, radius_rad + margin_rad, ring_size))
+    positions = np.vstack(rings)
+    sky_grid = SkyGrid(positions, 8.5)
+
+    offsets, star_ids = sky_grid.star_ids_within_cones(edge_directions, radius_rad)
+    for query, direction in enumerate(edge_directions):
+        expected_ids = brute_force_ids(positions, direction, radius_rad)
+        # the inner ring of this cone is found, its outer ring is not
+        inner_ring = np.arange(2 * query * ring_size, (2 * query + 1) * ring_size)
+        assert np.all(np.isin(inner_ring, expected_ids))
+        assert not np.any(np.isin(inner_ring + ring_size, expected_ids))
+        assert np.array_equal(sky_grid.star_ids_within_cone(direction, radius_rad), expected_ids)
+        assert np.array_equal(star_ids[offsets[query]:offsets[query + 1]], expected_ids)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from common import Params
+from star_tracker.star_imager import BackgroundEstimate, StarImager
+
+width, height = Params.width_height
+noise_sigma = 2.5
+
+
+def gradient_background() -> np.ndarray:
+    # brightening from 20 at the left to 90 at the right edge, like the glow of a nearby planet or the milky way
+    return np.tile(np.linspace(20.0, 90.0, width), (height, 1))
+
+
+def synthetic_frame(star_positions: np.ndarray, peak: float = 120.0, psf_sigma: float = 1.2) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    frame = gradient_background() + rng.normal(0, noise_sigma, (height, width))
+    ys, xs = np.mgrid[0:height, 0:width]
+    for x, y in star_positions:
+        window = (slice(int(y) - 6, int(y) + 7), slice(int(x) - 6, int(x) + 7))
+        frame[window] += peak * np.exp(-((xs[window] - x) ** 2 + (ys[window] - y) ** 2) / (2 * psf_sigma ** 2))
+    # an extended object, no star
+    frame[(xs - 300) ** 2 + (ys - 650) ** 2 <= 15 ** 2] += 100
+    return np.clip(np.round(frame), 0, 255).astype(np.uint8)
+
+
+def star_positions_within_field_of_view(count: int = 40) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    angles = rng.uniform(0, 2 * np.pi, count)
+    radii = Params.norm_radius * 0.9 * np.sqrt(rng.uniform(0, 1, count))
+    return np.column_stack((Params.center_point[0] + radii * np.cos(angles),
+                            Params.center_point[1] + radii * np.sin(angles)))
+
+
+def test_background_estimate_follows_gradient():
+    frame = synthetic_frame(star_positions_within_field_of_view())
+    background_estimate = BackgroundEstimate.from_gray_image(frame, within_field_of_view=True)
+    center_x, center_y = Params.center_point
+    ys, xs = np.mgrid[0:height, 0:width]
+    within = (xs - center_x) ** 2 + (ys - center_y) ** 2 <= (0.8 * Params.norm_radius) ** 2
+    assert np.max(np.abs(background_estimate.background - gradient_background())[within]) < 3
+    assert abs(np.median(background_estimate.tile_noises) - noise_sigma) < 1
+
+
+def test_local_thresholds_detect_stars_on_gradient():
+    star_positions = star_positions_within_field_of_view()
+    star_imager = StarImager(17)
+    detected_stars = star_imager.detect_stars(synthetic_frame(star_positions))
+
+    # every star once, within a fraction of a pixel, and nothing else
+    assert len(detected_stars) == len(star_positions)
+    distances = np.linalg.norm(detected_stars.positions[:, None, :] - star_positions[None, :, :], axis=2)
+    assert np.max(np.min(distances, axis=0)) < 0.25
+    assert star_imager.detection_statistics.extended_count == 1
+
+    # a single threshold at the same contrast over the darkest background floods the bright side
+    global_threshold = 20 + StarImager.min_detection_contrast
+    assert np.count_nonzero(synthetic_frame(star_positions) > global_threshold) > 100000
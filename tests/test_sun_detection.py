@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from common import Params
+from sun_detection import SunDetector, SunMaskStatistics
+
+width, height = Params.width_height
+
+
+def loop_white_dots(mask_image: np.ndarray) -> np.ndarray:
+    # the pixel loop SunDetector.white_dots used to run
+    dots = []
+    for row in range(0, height):
+        for col in range(0, width):
+            if mask_image[row][col] > 0:
+                dots.append([row, col])
+    return np.array(dots)
+
+
+def mask_of_disks(disks: list[tuple[float, float, float]]) -> np.ndarray:
+    ys, xs = np.mgrid[0:height, 0:width]
+    mask_image = np.zeros((height, width), dtype=np.uint8)
+    for center_x, center_y, radius in disks:
+        mask_image[(xs - center_x) ** 2 + (ys - center_y) ** 2 <= radius ** 2] = 255
+    return mask_image
+
+
+@pytest.mark.parametrize("disks", [[(620.3, 410.7, 150.0)], [(5.0, 990.0, 40.0)], [(200, 200, 3), (800, 700, 60)],
+                                   [(500, 500, 0.5)]])
+def test_sun_mask_statistics_equal_pixel_loop(disks: list[tuple[float, float, float]]):
+    mask_image = mask_of_disks(disks)
+    dots = loop_white_dots(mask_image)
+    mask_statistics = SunMaskStatistics.from_mask_image(mask_image)
+
+    assert np.array_equal(SunDetector.white_dots(mask_image), dots)
+    assert mask_statistics.pixel_count == len(dots) == SunDetector.num_of_dots_of_mask(mask_image)
+    # the loop summed row and column and returned them reversed
+    summed_vector = dots.sum(axis=0) * (1 / len(dots))
+    assert mask_statistics.center_point == pytest.approx((summed_vector[1], summed_vector[0]), abs=1e-9)
+    assert SunDetector.center_point_of_mask(mask_image) == mask_statistics.center_point
+    rows, cols = dots[:, 0], dots[:, 1]
+    assert mask_statistics.bounding_box == (cols.min(), rows.min(), cols.max() - cols.min() + 1,
+                                            rows.max() - rows.min() + 1)
+
+
+def test_sun_mask_statistics_of_empty_mask():
+    mask_image = np.zeros((height, width), dtype=np.uint8)
+    mask_statistics = SunMaskStatistics.from_mask_image(mask_image)
+    assert (mask_statistics.pixel_count, mask_statistics.center_point, mask_statistics.bounding_box) == (0, None, None)
+    assert SunDetector.num_of_dots_of_mask(mask_image) == 0